@@ -1,357 +1,26 @@
-__version__ = "3.4.0"
-
 import os
 import json
-import datetime
-from collections import defaultdict
+import sqlite3
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QListWidget, QSpinBox,
                              QTabWidget, QTableWidget, QTableWidgetItem, QMessageBox,
-                             QFileDialog, QInputDialog, QComboBox, QGroupBox, QRadioButton,
-                             QCheckBox, QTextEdit, QStackedWidget, QScrollArea,QFormLayout,
-                             QDialog,QDialogButtonBox,QDoubleSpinBox,QListWidgetItem, QShortcut)
+                             QFileDialog, QInputDialog, QComboBox, QGroupBox,
+                             QCheckBox, QTextEdit, QStackedWidget, QFormLayout,
+                             QDialog,QDialogButtonBox,QDoubleSpinBox,QListWidgetItem, QShortcut,
+                             QListView, QTableView, QActionGroup, QDateEdit, QProgressDialog, QMenu)
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5 import QtCore
 from PyQt5.QtGui import QFont, QKeySequence
-from pypinyin import lazy_pinyin
 from PyQt5 import QtGui
+# 菜单、订单、存储、统计等核心功能在 menu_core 中（不依赖 PyQt5）
+from menu_core import (MenuManager, OrderManager, BackupManager, ExportCancelled, DEFAULT_FILE_FORMATS,
+                       FILE_FORMATS, ORDER_FILE_VERSION, ROLLUP_GRANULARITIES, TIME_SLOTS, atomic_write,
+                       backup_dir_for, format_money, openpyxl, read_json_file, write_json_atomic,
+                       write_json_file)
 
 
-class Dish:
-    def __init__(self, id, name, price, category="未分类", description="", dialect_name="", is_spicy=0):
-        self.id = id  # 菜品编号（用于快捷键）
-        self.name = name
-        self.price = price
-        self.category = category
-        self.description = description
-        self.dialect_name = dialect_name  # 方言菜名
-        self.is_spicy = is_spicy  # 辣度 0-不辣 1-微辣 2-中辣 3-重辣
-        self.sales_count = 0  # 销售计数
-        self.remarks = []  # 顾客备注历史
-
-    def total_price(self, quantity):
-        return self.price * quantity
-
-    def add_remark(self, remark):
-        self.remarks.append(remark)
-
-    def increment_sales(self):
-        self.sales_count += 1
-
-    def get_spicy_text(self):
-        spicy_map = {0: "不辣", 1: "微辣", 2: "中辣", 3: "重辣"}
-        return spicy_map.get(self.is_spicy, "")
-
-
-class MenuManager:
-    def __init__(self):
-        self.dishes = []
-        self.categories = ["未分类"]
-        self.current_file = None
-        self.next_id = 1  # 用于自动生成菜品ID
-        self.order_history = []  # 订单历史保存
-        self.modified = False # 修改标记
-
-    def add_dish(self, name, price, category="未分类", description="", dialect_name="", is_spicy=0):
-        dish = Dish(self.next_id, name, price, category, description, dialect_name, is_spicy)
-        self.dishes.append(dish)
-        self.next_id += 1
-        
-        if category not in self.categories:
-            self.categories.append(category)
-        self.modified = True  # 设置修改标记
-        return dish
-
-    def remove_dish(self, dish_id):
-        for i, dish in enumerate(self.dishes):
-            if dish.id == dish_id:
-                self.dishes.pop(i)
-                self.modified = True  # 设置修改标记
-                return True
-        return False
-
-    def update_dish(self, dish_id, **kwargs):
-        for dish in self.dishes:
-            if dish.id == dish_id:
-                for key, value in kwargs.items():
-                    if hasattr(dish, key):
-                        setattr(dish, key, value)
-                        
-                        if key == 'category' and value not in self.categories:
-                            self.categories.append(value)
-                self.modified = True  # 设置修改标记
-                return True
-        return False
-
-    def get_dish_by_id(self, dish_id):
-        for dish in self.dishes:
-            if dish.id == dish_id:
-                return dish
-        return None
-
-    def get_dishes_by_category(self, category):
-        return [dish for dish in self.dishes if dish.category == category]
-
-    def get_top_dishes(self, limit=5):
-        return sorted(self.dishes, key=lambda x: x.sales_count, reverse=True)[:limit]
-
-    def save_to_file(self, filename):
-        data = {
-            "dishes": [{
-                "id": dish.id,
-                "name": dish.name,
-                "price": dish.price,
-                "category": dish.category,
-                "description": dish.description,
-                "dialect_name": dish.dialect_name,
-                "is_spicy": dish.is_spicy,
-                "sales_count": dish.sales_count,
-                "remarks": dish.remarks
-            } for dish in self.dishes],
-            "categories": self.categories,
-            "next_id": self.next_id,
-            "current_file": filename,
-            "order_history": self.order_history
-        }
-        
-        # 创建备份
-        if os.path.exists(filename):
-            backup_name = filename.replace('.json', f'_backup_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.json')
-            os.rename(filename, backup_name)
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        self.modified = False  # 保存后重置修改标记
-
-    def load_from_file(self, filename):
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.dishes = []
-                for dish_data in data["dishes"]:
-                    dish = Dish(
-                        dish_data["id"],
-                        dish_data["name"],
-                        dish_data["price"],
-                        dish_data.get("category", "未分类"),
-                        dish_data.get("description", ""),
-                        dish_data.get("dialect_name", ""),
-                        dish_data.get("is_spicy", 0)
-                    )
-                    dish.sales_count = dish_data.get("sales_count", 0)
-                    dish.remarks = dish_data.get("remarks", [])
-                    self.dishes.append(dish)
-                
-                self.categories = data.get("categories", ["未分类"])
-                self.next_id = data.get("next_id", len(self.dishes) + 1)
-                self.current_file = filename
-                self.order_history = data.get("order_history", [])
-                self.modified = False  # 加载文件后重置修改标记
-            return True
-        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-            print(f"加载菜单失败: {e}")
-            return False
-
-
-class OrderItem:
-    def __init__(self, dish_id, quantity, remark=""):
-        self.dish_id = dish_id
-        self.quantity = quantity
-        self.remark = remark  # 本次点单的特殊要求
-        self.price = 0  # 新增price属性，版本2.2.1
-
-
-
-class PersonOrder:
-    def __init__(self, name):
-        self.name = name
-        self.items = []
-        self.payment_method = "AA"  # AA/比例/自定义
-        self.payment_value = 1.0  # 比例或自定义金额
-
-    def add_item(self, dish_id, quantity, remark=""):
-        self.items.append(OrderItem(dish_id, quantity, remark))
-
-    def remove_item(self, index):
-        if 0 <= index < len(self.items):
-            self.items.pop(index)
-
-    def clear_items(self):
-        self.items = []
-
-    def calculate_total(self, menu_manager):
-        total = 0
-        for item in self.items:
-            dish = menu_manager.get_dish_by_id(item.dish_id)
-            if dish:
-                total += dish.price * item.quantity
-        return total
-
-    def set_payment_method(self, method, value=1.0):
-        self.payment_method = method
-        self.payment_value = value
-
-
-class OrderManager(QtCore.QObject):
-    # 类级别的信号定义
-    order_changed = QtCore.pyqtSignal()
-
-    def __init__(self, menu_manager=None):
-        super().__init__() 
-        self.orders = {}  # {person_name: PersonOrder}
-        self.history = []
-        self.current_table = ""
-        self.menu_manager = menu_manager
-        
-        # 如果提供了menu_manager，尝试加载它的历史
-        if menu_manager and hasattr(menu_manager, 'order_history'):
-            self.history = menu_manager.order_history
-
-        #self.order_changed = QtCore.pyqtSignal()
-
-    def add_person(self, name):
-        if name not in self.orders:
-            self.orders[name] = PersonOrder(name)
-
-    def remove_person(self, name):
-        if name in self.orders:
-            del self.orders[name]
-
-    def add_item_to_person(self, person_name, dish_id, quantity, remark=""):
-        if person_name in self.orders:
-            self.orders[person_name].add_item(dish_id, quantity, remark)
-            if self.menu_manager:  # 添加检查确保 menu_manager 存在
-                dish = self.menu_manager.get_dish_by_id(dish_id)
-            if dish:
-                dish.increment_sales()
-                if remark:
-                    dish.add_remark(remark)
-            self.order_changed.emit()
-            return True
-        return False
-
-    def remove_item_from_person(self, person_name, index):
-        if person_name in self.orders:
-            self.orders[person_name].remove_item(index)
-            self.order_changed.emit()
-            return True
-        return False
-
-    def set_payment_method(self, person_name, method, value=1.0):
-        if person_name in self.orders:
-            self.orders[person_name].set_payment_method(method, value)
-            self.order_changed.emit()
-            return True
-        return False
-
-    def set_payment_method_in_dialog(self, payment_table, dialog):
-        selected_rows = payment_table.selectionModel().selectedRows()
-        if not selected_rows or len(selected_rows) > 1:
-            QMessageBox.warning(self, "警告", "请选择一个顾客设置支付方式")
-            return
-        
-        row = selected_rows[0].row()
-        person_name = payment_table.item(row, 0).text()
-        
-        payment_dialog = PaymentMethodDialog(self)
-        if payment_dialog.exec_() == QDialog.Accepted:
-            if hasattr(payment_dialog, 'payment_method'):
-                method, value = payment_dialog.payment_method
-                self.order_manager.set_payment_method(person_name, method, value)
-                # 重新计算并更新显示
-                totals, subtotal = self.order_manager.calculate_totals(self.menu_manager)
-                
-                # 更新支付表格
-                payment_table.setRowCount(0)
-                for row, (name, data) in enumerate(totals.items()):
-                    payment_table.insertRow(row)
-                    payment_table.setItem(row, 0, QTableWidgetItem(name))
-                    payment_table.setItem(row, 1, QTableWidgetItem(f"{data['original']:.2f}元"))
-                    
-                    method_text = {
-                        "AA": "AA制",
-                        "比例": f"按比例 {data['value']:.2f}",
-                        "自定义": f"自定义 {data['value']:.2f}元"
-                    }.get(data['method'], data['method'])
-                    
-                    payment_table.setItem(row, 2, QTableWidgetItem(method_text))
-                    payment_table.setItem(row, 3, QTableWidgetItem(f"{data['final']:.2f}元"))
-
-
-    def calculate_totals(self, menu_manager):
-        totals = {}
-        subtotal = 0.0
-        
-        # 计算每个人的原始消费金额
-        for name, order in self.orders.items():
-            original = sum(menu_manager.get_dish_by_id(item.dish_id).price * item.quantity 
-                        for item in order.items)
-            totals[name] = {
-                'original': original,
-                'final': original,  # 默认应付金额等于消费金额
-                'method': order.payment_method,
-                'value': order.payment_value
-            }
-            subtotal += original
-        
-        # 处理AA制
-        aa_people = [name for name, data in totals.items() if data["method"] == "AA"]
-        if aa_people:
-            aa_total = sum(data["original"] for name, data in totals.items() 
-                        if name not in aa_people)
-            aa_share = (subtotal - aa_total) / len(aa_people) if aa_people else 0
-            for name in aa_people:
-                totals[name]["final"] = aa_share
-        
-        # 处理自定义金额
-        custom_people = [name for name, data in totals.items() if data["method"] == "自定义"]
-        for name in custom_people:
-            # 确保自定义金额不超过消费金额
-            totals[name]["final"] = min(totals[name]["value"], totals[name]["original"])
-        
-        return totals, subtotal
-
-
-    def save_current_order(self):
-        if self.orders:
-            order_data = {
-                "table": self.current_table,
-                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "orders": {}
-            }
-            
-            for name, person_order in self.orders.items():
-                order_data["orders"][name] = {
-                    "items": [(item.dish_id, item.quantity, item.remark) for item in person_order.items],
-                    "payment_method": person_order.payment_method,
-                    "payment_value": person_order.payment_value
-                }
-            
-            self.history.append(order_data)
-            return True
-        return False
-
-    def clear_current_order(self):
-        self.orders = {}
-        self.current_table = ""
-
-    def get_customer_habits(self):
-        habit_data = defaultdict(lambda: {"count": 0, "total_spent": 0, "dishes": defaultdict(int)})
-        
-        for order in self.history:
-            for name, data in order["orders"].items():
-                habit = habit_data[name]
-                habit["count"] += 1
-                
-                for dish_id, quantity, _ in data["items"]:
-                    if self.menu_manager:  # 添加检查确保 menu_manager 存在
-                        dish = self.menu_manager.get_dish_by_id(dish_id)
-                    if dish:
-                        habit["total_spent"] += dish.price * quantity
-                        habit["dishes"][dish.name] += quantity
-        
-        return habit_data
+# 界面设置的默认值，可在 settings.json 中覆盖；search_debounce_ms 为搜索框停止输入后多少毫秒才筛选
+DEFAULT_SETTINGS = {"search_debounce_ms": 200}
 
 
 class DishEditDialog(QDialog):
@@ -423,7 +92,7 @@ class DishEditDialog(QDialog):
         if self.dish:
             self.id_input.setText(str(self.dish.id))
             self.name_input.setText(self.dish.name)
-            self.price_input.setText(str(self.dish.price))
+            self.price_input.setText(format_money(self.dish.price_cents))
             self.category_combo.setCurrentText(self.dish.category)
             self.dialect_input.setText(self.dish.dialect_name)
             self.description_input.setPlainText(self.dish.description)
@@ -553,6 +222,418 @@ class PaymentMethodDialog(QDialog):
         super().accept()
 
 
+def format_dish_text(dish, show_category=True):
+    """菜品列表中的显示文本"""
+    if show_category:
+        text = f"{dish.id}. {dish.name} ({dish.category}) - {format_money(dish.price_cents)}元"
+    else:
+        text = f"{dish.id}. {dish.name} - {format_money(dish.price_cents)}元"
+    if dish.dialect_name:
+        text += f" [{dish.dialect_name}]"
+    if dish.is_spicy > 0:
+        text += f" {dish.get_spicy_text()}"
+    return text
+
+
+class DishListModel(QtCore.QAbstractListModel):
+    """菜单管理和点餐两个标签页共用的菜品列表模型，直接读取 MenuManager.dishes"""
+    DishIdRole = Qt.UserRole
+
+    def __init__(self, menu_manager, parent=None):
+        super().__init__(parent)
+        self.menu_manager = menu_manager
+
+    def set_menu_manager(self, menu_manager):
+        self.beginResetModel()
+        self.menu_manager = menu_manager
+        self.endResetModel()
+
+    def refresh(self):
+        """菜品增删、修改或排序后调用"""
+        self.beginResetModel()
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.menu_manager.dishes)
+
+    def dish_at(self, row):
+        return self.menu_manager.dishes[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        dish = self.menu_manager.dishes[index.row()]
+        if role == Qt.DisplayRole:
+            return format_dish_text(dish)
+        if role == self.DishIdRole:
+            return dish.id
+        return None
+
+
+class DishFilterProxyModel(QtCore.QSortFilterProxyModel):
+    """每个标签页各自的分类/搜索筛选，筛选时不重建任何控件"""
+
+    def __init__(self, show_category=True, parent=None):
+        super().__init__(parent)
+        self.show_category = show_category
+        self._category = None
+        self._search_text = ""
+        self._accepted_ids = None  # 当前筛选结果的菜品ID集合，None 表示需要逐行判断
+        self._accepted_dishes = None  # 当前筛选结果，用于逐步细化的搜索
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        # 源模型重置（菜品增删改、排序）后，之前的筛选结果不再可靠
+        model.modelAboutToBeReset.connect(self._drop_cached_result)
+
+    def _drop_cached_result(self):
+        self._accepted_ids = None
+        self._accepted_dishes = None
+
+    def set_filter(self, category, search_text, incremental=False):
+        """incremental 为 True 且新搜索文本是上次的延续时，只在上次结果中继续筛选"""
+        candidates = None
+        if (incremental and self._accepted_dishes is not None and
+                category == self._category and search_text.startswith(self._search_text)):
+            candidates = self._accepted_dishes
+
+        menu_manager = self.sourceModel().menu_manager
+        self._category = category
+        self._search_text = search_text
+        self._accepted_dishes = menu_manager.filter_dishes(category, search_text, candidates)
+        self._accepted_ids = {dish.id for dish in self._accepted_dishes}
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        dish = self.sourceModel().dish_at(source_row)
+        if self._accepted_ids is not None:
+            return dish.id in self._accepted_ids
+        if self._category and dish.category != self._category:
+            return False
+        return self.sourceModel().menu_manager.dish_matches(dish, self._search_text)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and not self.show_category:
+            source_index = self.mapToSource(index)
+            return format_dish_text(self.sourceModel().dish_at(source_index.row()), False)
+        return super().data(index, role)
+
+
+class OrderTableModel(QtCore.QAbstractTableModel):
+    """当前订单表格模型，根据 OrderManager 的逐项信号只更新变化的行"""
+    HEADERS = ["顾客", "菜品", "单价", "数量", "小计", "备注"]
+
+    def __init__(self, order_manager, menu_manager, parent=None):
+        super().__init__(parent)
+        self.order_manager = None
+        self.menu_manager = menu_manager
+        self._rows = []  # [(顾客名, OrderItem)]，顺序与 order_manager.orders 一致
+        self.set_order_manager(order_manager, menu_manager)
+
+    def set_order_manager(self, order_manager, menu_manager):
+        if self.order_manager is not None:
+            self.order_manager.order_changed.disconnect(self.refresh)
+            self.order_manager.item_added.disconnect(self._on_item_added)
+            self.order_manager.item_removed.disconnect(self._on_item_removed)
+            self.order_manager.item_changed.disconnect(self._on_item_changed)
+        self.order_manager = order_manager
+        self.menu_manager = menu_manager
+        order_manager.order_changed.connect(self.refresh)
+        order_manager.item_added.connect(self._on_item_added)
+        order_manager.item_removed.connect(self._on_item_removed)
+        order_manager.item_changed.connect(self._on_item_changed)
+        self.refresh()
+
+    def refresh(self):
+        self.beginResetModel()
+        self._rows = [(name, item)
+                      for name, order in self.order_manager.orders.items()
+                      for item in order.items]
+        self.endResetModel()
+
+    def _person_offset(self, person_name):
+        """该顾客第一项所在的行号"""
+        offset = 0
+        for name, order in self.order_manager.orders.items():
+            if name == person_name:
+                break
+            offset += len(order.items)
+        return offset
+
+    def _on_item_added(self, person_name, index):
+        row = self._person_offset(person_name) + index
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self._rows.insert(row, (person_name, self.order_manager.orders[person_name].items[index]))
+        self.endInsertRows()
+
+    def _on_item_removed(self, person_name, index):
+        row = self._person_offset(person_name) + index
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self._rows[row]
+        self.endRemoveRows()
+
+    def _on_item_changed(self, person_name, index):
+        row = self._person_offset(person_name) + index
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+
+    def item_at(self, row):
+        """返回 (顾客名, 订单项索引, OrderItem)"""
+        person_name, item = self._rows[row]
+        return person_name, row - self._person_offset(person_name), item
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        person_name, item = self._rows[index.row()]
+        dish = self.menu_manager.get_dish_by_id(item.dish_id)
+        column = index.column()
+        if column == 0:
+            return person_name
+        if column == 1:
+            return dish.name if dish else f"已删除菜品({item.dish_id})"
+        if column == 2:
+            return format_money(item.price_cents)
+        if column == 3:
+            return str(item.quantity)
+        if column == 4:
+            return f"{format_money(item.total_cents)}元"
+        return item.remark
+
+
+class HistoryTableModel(QtCore.QAbstractTableModel):
+    """
+    订单历史表格模型：行按批加载（fetchMore），只为显示到的行读取订单并计算汇总，汇总按历史序号缓存
+    按日期和桌号筛选由存储后端完成（SQLite 直接用 SQL），按时间排序只需反转历史序号
+    """
+    HEADERS = ["时间", "桌号", "顾客数", "总金额"]
+    SORT_KEYS = (None, "table", "customers", "total")  # 各列的排序键，按时间即按保存顺序
+    BATCH_SIZE = 200
+
+    def __init__(self, menu_manager, parent=None):
+        super().__init__(parent)
+        self.menu_manager = menu_manager
+        self._filter = (None, None, None)  # (开始时间, 结束时间, 桌号)
+        self._sort = (0, Qt.AscendingOrder)
+        self._seqs = None  # 筛选/排序后的历史序号；None 表示全部订单按保存顺序
+        self._total = 0
+        self._loaded = 0
+        self._summaries = {}  # {历史序号: (时间, 桌号, 顾客数, 总金额分)}
+
+    def set_menu_manager(self, menu_manager):
+        """切换菜单时先清空，等 refresh 时再读取新的历史"""
+        self.beginResetModel()
+        self.menu_manager = menu_manager
+        self._seqs = None
+        self._total = self._loaded = 0
+        self._summaries = {}
+        self.endResetModel()
+
+    def set_filter(self, start=None, end=None, table=None):
+        self._filter = (start, end, table)
+        self.refresh()
+
+    def current_filter(self):
+        """返回 (开始时间, 结束时间, 桌号)"""
+        return self._filter
+
+    def refresh(self):
+        self.beginResetModel()
+        self._summaries = {}
+        column, order = self._sort
+        self.menu_manager.refresh_history()  # 历史序号与存储一致（共享数据库时其他终端可能新增了订单）
+        history = self.menu_manager.order_history
+        if not self.menu_manager.can_sort_history(self.SORT_KEYS[column]):
+            # 按页读取的历史在存储不支持该列排序时只按时间排序，不为排序读取全部订单
+            column = 0
+            self._sort = (column, order)
+        if self._filter == (None, None, None) and column == 0 and order == Qt.AscendingOrder:
+            seqs = None  # 全部订单按保存顺序显示，不需要序号列表
+        else:
+            if self._filter == (None, None, None) and column == 0:
+                seqs = list(range(len(history)))
+            else:
+                seqs = self.menu_manager.query_order_seqs(*self._filter, sort=self.SORT_KEYS[column])
+            if order == Qt.DescendingOrder:
+                seqs.reverse()
+        self._seqs = seqs
+        self._total = len(seqs) if seqs is not None else len(history)
+        self._loaded = min(self._total, self.BATCH_SIZE)
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort = (column, order)
+        self.refresh()
+
+    def sort_column(self):
+        """实际排序的列（不支持按所选列排序时为时间列）"""
+        return self._sort[0]
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self._loaded < self._total
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        count = min(self.BATCH_SIZE, self._total - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def seq_at(self, row):
+        """行对应的历史序号（order_history 的下标）"""
+        return self._seqs[row] if self._seqs is not None else row
+
+    def order_at(self, row):
+        return self.menu_manager.order_history[self.seq_at(row)]
+
+    def summary(self, seq):
+        summary = self._summaries.get(seq)
+        if summary is None:
+            order = self.menu_manager.order_history[seq]
+            summary = (order["timestamp"], order["table"], len(order["orders"]),
+                       self.menu_manager.order_total_cents(order))
+            self._summaries[seq] = summary
+        return summary
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        timestamp, table, customer_count, total_cents = self.summary(self.seq_at(index.row()))
+        column = index.column()
+        if column == 0:
+            return timestamp
+        if column == 1:
+            return table
+        if column == 2:
+            return str(customer_count)
+        return f"{format_money(total_cents)}元"
+
+
+def selected_dish_id(view):
+    """返回列表视图中选中菜品的ID，未选中时返回 None"""
+    indexes = view.selectionModel().selectedIndexes()
+    if not indexes:
+        return None
+    return indexes[0].data(DishListModel.DishIdRole)
+
+
+class _SaveTaskSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(object, object)  # (SaveJob, 异常或None)
+
+
+class _SaveTask(QtCore.QRunnable):
+    def __init__(self, job, signals):
+        super().__init__()
+        self.job = job
+        self.signals = signals
+
+    def run(self):
+        try:
+            self.job.run()
+        except Exception as e:
+            self.signals.done.emit(self.job, e)
+        else:
+            self.signals.done.emit(self.job, None)
+
+
+class BackgroundSaver(QtCore.QObject):
+    """
+    后台保存：在界面线程中生成快照，在线程池中序列化并写盘，一次只执行一个保存任务
+    任务执行期间重复提交的同类请求只保留最新一个，轮到它执行时才生成快照
+    """
+    save_finished = QtCore.pyqtSignal(str, str, str)  # (请求类型, 文件名, 错误信息；成功时为空)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._signals = _SaveTaskSignals()
+        self._signals.done.connect(self._on_done)
+        self._running = None  # (请求类型, 完成回调)
+        self._pending = {}  # {请求类型: (生成任务的函数, 完成回调)}
+
+    def request(self, kind, prepare, on_done=None):
+        """prepare() 在界面线程中调用并返回 SaveJob；on_done(job, error) 在界面线程中回调"""
+        self._pending[kind] = (prepare, on_done)
+        if self._running is None:
+            self._start_next()
+
+    def is_busy(self):
+        return self._running is not None or bool(self._pending)
+
+    def wait(self):
+        """等待所有保存任务完成（退出程序前调用）"""
+        while self.is_busy():
+            self.pool.waitForDone(100)
+            QApplication.processEvents()
+
+    def _start_next(self):
+        while self._pending:
+            kind = next(iter(self._pending))
+            prepare, on_done = self._pending.pop(kind)
+            try:
+                job = prepare()
+            except Exception as e:
+                self.save_finished.emit(kind, "", str(e))
+                continue
+            self._running = (kind, on_done)
+            self.pool.start(_SaveTask(job, self._signals))
+            return
+
+    def _on_done(self, job, error):
+        kind, on_done = self._running
+        self._running = None
+        if on_done is not None:
+            on_done(job, error)
+        self.save_finished.emit(kind, job.filename, "" if error is None else str(error))
+        self._start_next()
+
+
+class _ExportSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, int)  # (已处理订单数, 订单总数)
+    done = QtCore.pyqtSignal(object, object)  # (HistoryExport, 异常或None)
+
+
+class _ExportTask(QtCore.QRunnable):
+    def __init__(self, job, signals):
+        super().__init__()
+        self.job = job
+        self.signals = signals
+        job.progress = signals.progress.emit  # 跨线程信号，进度在界面线程中处理
+
+    def run(self):
+        try:
+            self.job.run()
+        except Exception as e:
+            self.signals.done.emit(self.job, e)
+        else:
+            self.signals.done.emit(self.job, None)
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -568,10 +649,31 @@ class MainWindow(QMainWindow):
         self.menu_manager = MenuManager()
         self.order_manager = OrderManager(self.menu_manager)
         
-        # 连接信号
-        self.order_manager.order_changed.connect(self.update_order_display)
+        # 菜单文件和订单文件的保存格式（备份格式见 backups/policy.json）
+        self.file_formats = self.load_file_formats()
+
+        # 后台保存，Ctrl+S 和自动备份都不阻塞界面
+        self.saver = BackgroundSaver(self)
+        self.saver.save_finished.connect(self.on_save_finished)
+        # 导出订单历史可能需要较长时间，使用单独的线程池，不阻塞保存和备份
+        self.export_pool = QtCore.QThreadPool(self)
+        self.export_pool.setMaxThreadCount(1)
+        self._export_signals = _ExportSignals()
+        self._export_signals.progress.connect(self.on_export_progress)
+        self._export_signals.done.connect(self.on_export_finished)
+        self.export_job = None
+        self.export_progress = None
+
+        # 当前订单表格模型，通过订单管理器的信号增量更新
+        self.order_model = OrderTableModel(self.order_manager, self.menu_manager, self)
         
-        self.last_backup_hash = None  # 用于备份比对
+        self.last_backup_key = None  # 上次备份时的修改代数，用于备份比对
+
+        # 搜索框防抖：停止输入 search_debounce_ms 毫秒后才筛选，设为0则立即筛选（可在 settings.json 中设置）
+        self.search_debounce_ms = self.load_settings()["search_debounce_ms"]
+
+        # 两个标签页共用的菜品模型
+        self.dish_model = DishListModel(self.menu_manager, self)
         
         # 初始化UI
         self.init_ui()
@@ -607,6 +709,9 @@ class MainWindow(QMainWindow):
         self.create_order_tab()
         self.create_history_tab()
         self.create_analysis_tab()
+        # 历史订单和数据分析需要读取订单历史，切换到对应标签页时才刷新
+        self._stale_views = set()
+        self.tab_widget.currentChanged.connect(self.refresh_stale_views)
         
         main_layout.addWidget(self.tab_widget)
         main_widget.setLayout(main_layout)
@@ -649,7 +754,21 @@ class MainWindow(QMainWindow):
         
         backup_action = file_menu.addAction("立即备份")
         backup_action.triggered.connect(self.manual_backup)
+
+        restore_action = file_menu.addAction("恢复备份")
+        restore_action.triggered.connect(self.restore_backup)
         
+        format_menu = file_menu.addMenu("保存格式")
+        for kind, title in (("menu", "菜单文件"), ("order", "订单文件")):
+            kind_menu = format_menu.addMenu(title)
+            group = QActionGroup(self)
+            for file_format, label in FILE_FORMATS.items():
+                action = kind_menu.addAction(label)
+                action.setCheckable(True)
+                action.setChecked(self.file_formats[kind] == file_format)
+                action.triggered.connect(lambda checked, k=kind, f=file_format: self.set_file_format(k, f))
+                group.addAction(action)
+
         file_menu.addSeparator()
         
         exit_action = file_menu.addAction("退出")
@@ -692,7 +811,11 @@ class MainWindow(QMainWindow):
         
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("搜索菜品...")
-        self.search_input.textChanged.connect(self.update_dish_list)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.refine_dish_list)
+        self.search_input.textChanged.connect(
+            lambda: self.schedule_search(self.search_timer, self.refine_dish_list))
         
         filter_layout.addWidget(QLabel("分类筛选:"))
         filter_layout.addWidget(self.category_filter)
@@ -700,9 +823,14 @@ class MainWindow(QMainWindow):
         filter_layout.addWidget(self.search_input)
         
         # 菜品列表
-        self.dish_list_widget = QListWidget()
-        self.dish_list_widget.setSelectionMode(QListWidget.SingleSelection)
-        self.dish_list_widget.itemDoubleClicked.connect(self.edit_selected_dish)
+        self.dish_proxy = DishFilterProxyModel(show_category=True, parent=self)
+        self.dish_proxy.setSourceModel(self.dish_model)
+        self.dish_list_view = QListView()
+        self.dish_list_view.setModel(self.dish_proxy)
+        self.dish_list_view.setSelectionMode(QListView.SingleSelection)
+        self.dish_list_view.setEditTriggers(QListView.NoEditTriggers)
+        self.dish_list_view.setUniformItemSizes(True)
+        self.dish_list_view.doubleClicked.connect(self.edit_selected_dish)
         
         # 操作按钮
         button_layout = QHBoxLayout()
@@ -721,7 +849,7 @@ class MainWindow(QMainWindow):
         button_layout.addWidget(remove_button)
         
         layout.addLayout(filter_layout)
-        layout.addWidget(self.dish_list_widget)
+        layout.addWidget(self.dish_list_view)
         layout.addLayout(button_layout)
         
         tab.setLayout(layout)
@@ -739,7 +867,11 @@ class MainWindow(QMainWindow):
         search_layout = QHBoxLayout()
         self.order_search_input = QLineEdit()
         self.order_search_input.setPlaceholderText("搜索菜品(支持中文、拼音、首字母)...")
-        self.order_search_input.textChanged.connect(self.update_order_dish_list)
+        self.order_search_timer = QTimer(self)
+        self.order_search_timer.setSingleShot(True)
+        self.order_search_timer.timeout.connect(self.refine_order_dish_list)
+        self.order_search_input.textChanged.connect(
+            lambda: self.schedule_search(self.order_search_timer, self.refine_order_dish_list))
         search_layout.addWidget(QLabel("搜索:"))
         search_layout.addWidget(self.order_search_input)
         
@@ -785,11 +917,16 @@ class MainWindow(QMainWindow):
         self.dish_category_combo.addItem("所有分类")
         self.dish_category_combo.currentIndexChanged.connect(self.update_order_dish_list)
         
-        self.order_dish_list = QListWidget()
-        self.order_dish_list.setSelectionMode(QListWidget.SingleSelection)
+        self.order_dish_proxy = DishFilterProxyModel(show_category=False, parent=self)
+        self.order_dish_proxy.setSourceModel(self.dish_model)
+        self.order_dish_view = QListView()
+        self.order_dish_view.setModel(self.order_dish_proxy)
+        self.order_dish_view.setSelectionMode(QListView.SingleSelection)
+        self.order_dish_view.setEditTriggers(QListView.NoEditTriggers)
+        self.order_dish_view.setUniformItemSizes(True)
         
         dish_select_layout.addWidget(self.dish_category_combo)
-        dish_select_layout.addWidget(self.order_dish_list)
+        dish_select_layout.addWidget(self.order_dish_view)
         
         # 点餐详情区域
         detail_layout = QVBoxLayout()
@@ -841,14 +978,14 @@ class MainWindow(QMainWindow):
         order_control_layout.addLayout(detail_layout, 1)
         
         # 4. 订单表格
-        self.order_table = QTableWidget()
-        self.order_table.setColumnCount(6)  # 顾客,菜品,单价,数量,小计,备注
-        self.order_table.setHorizontalHeaderLabels(["顾客", "菜品", "单价", "数量", "小计", "备注"])
+        self.order_table = QTableView()
+        self.order_table.setModel(self.order_model)  # 顾客,菜品,单价,数量,小计,备注
         self.order_table.horizontalHeader().setStretchLastSection(True)
-        self.order_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.order_table.setSelectionMode(QTableWidget.SingleSelection)
-        self.order_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.order_table.cellDoubleClicked.connect(self.edit_order_item)
+        self.order_table.setSelectionBehavior(QTableView.SelectRows)
+        self.order_table.setSelectionMode(QTableView.SingleSelection)
+        self.order_table.setEditTriggers(QTableView.NoEditTriggers)
+        self.order_table.doubleClicked.connect(
+            lambda index: self.edit_order_item(index.row(), index.column()))
         
         # 5. 操作按钮
         button_layout = QHBoxLayout()
@@ -893,7 +1030,7 @@ class MainWindow(QMainWindow):
         layout.addLayout(button_layout)
         
         # 7. 设置菜品选择变化时的价格更新
-        self.order_dish_list.currentItemChanged.connect(self.update_current_price)
+        self.order_dish_view.selectionModel().currentChanged.connect(self.update_current_price)
         
         tab.setLayout(layout)
         self.tab_widget.addTab(tab, "订单管理")
@@ -904,16 +1041,11 @@ class MainWindow(QMainWindow):
         return tab
 
     def update_current_price(self):
-        selected_items = self.order_dish_list.selectedItems()
-        if selected_items:
-            selected_text = selected_items[0].text()
-            price_str = selected_text.split(' - ')[1].split('元')[0]
-            try:
-                price = float(price_str)
-                quantity = self.quantity_spin.value()
-                self.current_price_label.setText(f"小计: {price * quantity}元")
-            except ValueError:
-                self.current_price_label.setText("小计: 0元")
+        dish_id = selected_dish_id(self.order_dish_view)
+        dish = self.menu_manager.get_dish_by_id(dish_id) if dish_id is not None else None
+        if dish:
+            quantity = self.quantity_spin.value()
+            self.current_price_label.setText(f"小计: {format_money(dish.total_cents(quantity))}元")
         else:
             self.current_price_label.setText("小计: 0元")
 
@@ -962,11 +1094,42 @@ class MainWindow(QMainWindow):
         tab = QWidget()
         layout = QVBoxLayout()
         
-        # 历史订单列表
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(4)
-        self.history_table.setHorizontalHeaderLabels(["时间", "桌号", "顾客数", "总金额"])
+        # 筛选条件：日期范围和桌号
+        filter_layout = QHBoxLayout()
+        self.history_date_check = QCheckBox("按日期")
+        today = QtCore.QDate.currentDate()
+        self.history_start_date = QDateEdit(today.addDays(-30))
+        self.history_start_date.setCalendarPopup(True)
+        self.history_start_date.setDisplayFormat("yyyy-MM-dd")
+        self.history_end_date = QDateEdit(today)
+        self.history_end_date.setCalendarPopup(True)
+        self.history_end_date.setDisplayFormat("yyyy-MM-dd")
+        self.history_table_filter = QLineEdit()
+        self.history_table_filter.setPlaceholderText("桌号（留空表示全部）")
+        self.history_table_filter.returnPressed.connect(self.apply_history_filter)
+        filter_button = QPushButton("筛选")
+        filter_button.clicked.connect(self.apply_history_filter)
+        clear_filter_button = QPushButton("清除筛选")
+        clear_filter_button.clicked.connect(self.clear_history_filter)
+
+        filter_layout.addWidget(self.history_date_check)
+        filter_layout.addWidget(self.history_start_date)
+        filter_layout.addWidget(QLabel("至"))
+        filter_layout.addWidget(self.history_end_date)
+        filter_layout.addWidget(self.history_table_filter)
+        filter_layout.addWidget(filter_button)
+        filter_layout.addWidget(clear_filter_button)
+
+        # 历史订单列表：只为可见行读取订单，滚动时按批加载
+        self.history_model = HistoryTableModel(self.menu_manager, self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
+        self.history_table.setSelectionBehavior(QTableView.SelectRows)
+        self.history_table.setSelectionMode(QTableView.SingleSelection)
         self.history_table.horizontalHeader().setStretchLastSection(True)
+        self.history_table.setSortingEnabled(True)
+        self.history_table.sortByColumn(0, Qt.AscendingOrder)
+        self.history_table.horizontalHeader().sortIndicatorChanged.connect(self.on_history_sort_changed)
         self.history_table.doubleClicked.connect(self.view_history_detail)
         
         # 操作按钮
@@ -985,10 +1148,12 @@ class MainWindow(QMainWindow):
         button_layout.addWidget(view_button)
         button_layout.addWidget(export_button)
         
+        layout.addLayout(filter_layout)
         layout.addWidget(self.history_table)
         layout.addLayout(button_layout)
         
         tab.setLayout(layout)
+        self.history_tab = tab
         self.tab_widget.addTab(tab, "历史订单")
 
     def create_analysis_tab(self):
@@ -997,7 +1162,7 @@ class MainWindow(QMainWindow):
         
         # 分析选项
         analysis_options = QComboBox()
-        analysis_options.addItems(["热销菜品排行", "顾客消费习惯"])
+        analysis_options.addItems(["热销菜品排行", "顾客消费习惯", "销售趋势分析"])
         analysis_options.currentIndexChanged.connect(self.update_analysis_view)
         
         # 堆叠窗口显示不同分析结果
@@ -1026,15 +1191,58 @@ class MainWindow(QMainWindow):
         
         habits_layout.addWidget(self.habits_table)
         habits_widget.setLayout(habits_layout)
+
+        # 销售趋势面板：按小时/天/周/月汇总，可按营业时段筛选
+        trend_widget = QWidget()
+        trend_layout = QVBoxLayout()
+
+        trend_options = QHBoxLayout()
+        trend_options.addWidget(QLabel("汇总方式:"))
+        self.rollup_granularity = QComboBox()
+        for granularity, (label, _) in ROLLUP_GRANULARITIES.items():
+            self.rollup_granularity.addItem(label, granularity)
+        self.rollup_granularity.setCurrentIndex(self.rollup_granularity.findData("day"))
+        self.rollup_granularity.currentIndexChanged.connect(self.update_trend_table)
+        trend_options.addWidget(self.rollup_granularity)
+        trend_options.addWidget(QLabel("营业时段:"))
+        self.rollup_slot = QComboBox()
+        self.rollup_slot.addItem("全天", "")
+        for name, start, end in TIME_SLOTS:
+            self.rollup_slot.addItem(f"{name} ({start}:00-{end}:00)", name)
+        self.rollup_slot.currentIndexChanged.connect(self.update_trend_table)
+        trend_options.addWidget(self.rollup_slot)
+        trend_options.addStretch()
+        trend_layout.addLayout(trend_options)
+
+        self.trend_table = QTableWidget()
+        self.trend_table.setColumnCount(5)
+        self.trend_table.setHorizontalHeaderLabels(["时间", "订单数", "人次", "营业额", "客单价"])
+        self.trend_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.trend_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.trend_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.trend_table.horizontalHeader().setStretchLastSection(True)
+        self.trend_table.itemSelectionChanged.connect(self.update_trend_dishes_table)
+        trend_layout.addWidget(self.trend_table)
+
+        trend_layout.addWidget(QLabel("所选时间的热销菜品:"))
+        self.trend_dishes_table = QTableWidget()
+        self.trend_dishes_table.setColumnCount(3)
+        self.trend_dishes_table.setHorizontalHeaderLabels(["排名", "菜品", "销量"])
+        self.trend_dishes_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.trend_dishes_table.horizontalHeader().setStretchLastSection(True)
+        trend_layout.addWidget(self.trend_dishes_table)
+        trend_widget.setLayout(trend_layout)
         
         # 添加到堆叠窗口
         self.analysis_stack.addWidget(top_dishes_widget)
         self.analysis_stack.addWidget(habits_widget)
+        self.analysis_stack.addWidget(trend_widget)
         
         layout.addWidget(analysis_options)
         layout.addWidget(self.analysis_stack)
         
         tab.setLayout(layout)
+        self.analysis_tab = tab
         self.tab_widget.addTab(tab, "数据分析")
 
     def setup_shortcuts(self):
@@ -1074,56 +1282,37 @@ class MainWindow(QMainWindow):
                 
                 self.order_manager.add_person(customer_name)
                 self.order_manager.add_item_to_person(customer_name, dish.id, 1)
-                self.update_order_display()
                 self.statusBar().showMessage(f"已添加 {dish.name} 到 {customer_name} 的订单", 2000)
                 break
 
-    def update_dish_list(self):
-        self.dish_list_widget.clear()
-        
-        selected_category = self.category_filter.currentText()
-        search_text = self.search_input.text().lower()
-        
-        for dish in self.menu_manager.dishes:
-            if selected_category != "所有分类" and dish.category != selected_category:
-                continue
-            
-            try:
-                # 支持中文、拼音全拼、拼音首字母搜索
-                pinyin_name = ''.join(lazy_pinyin(dish.name))
-                pinyin_initials = ''.join([x[0] for x in lazy_pinyin(dish.name)])
-                # 方言名的拼音转换
-                dialect_pinyin = ''.join(lazy_pinyin(dish.dialect_name)) if dish.dialect_name else ""
-                dialect_initials = ''.join([x[0] for x in lazy_pinyin(dish.dialect_name)]) if dish.dialect_name else ""
-            except:
-                # 如果拼音转换失败，只比较原始文本
-                pinyin_name = pinyin_initials = dish.name.lower()
-                dialect_pinyin = dialect_initials = dish.dialect_name.lower() if dish.dialect_name else ""
-            
-            # 搜索匹配条件
-            match_condition = (
-                not search_text or  # 无搜索文本时显示所有
-                search_text in dish.name.lower() or  # 匹配中文名
-                search_text in (dish.dialect_name or "").lower() or  # 匹配方言名
-                search_text in pinyin_name or  # 匹配全拼
-                search_text in pinyin_initials or  # 匹配首字母
-                search_text in dialect_pinyin or  # 匹配方言全拼
-                search_text in dialect_initials  # 匹配方言首字母
-            )
-            
-            if not match_condition:
-                continue
-            
-            # 构建显示文本
-            item_text = f"{dish.id}. {dish.name} ({dish.category}) - {dish.price}元"
-            if dish.dialect_name:
-                item_text += f" [{dish.dialect_name}]"
-            
-            if dish.is_spicy > 0:
-                item_text += f" {dish.get_spicy_text()}"
-            
-            self.dish_list_widget.addItem(item_text)
+    def schedule_search(self, timer, refine):
+        if self.search_debounce_ms > 0:
+            timer.start(self.search_debounce_ms)  # 重新计时，合并连续按键
+        else:
+            refine()
+
+    def refine_dish_list(self):
+        self.update_dish_list(incremental=True)
+
+    def refine_order_dish_list(self):
+        self.update_order_dish_list(incremental=True)
 
+    def current_category(self, category_combo):
+        selected_category = category_combo.currentText()
+        return None if selected_category == "所有分类" else selected_category
+
+    def update_dish_list(self, incremental=False):
+        # 使用预先生成的拼音索引匹配（中文名、全拼、首字母、方言名）
+        # 分类下拉框的 currentIndexChanged 会把索引作为参数传入，所以这里用 is True 判断
+        self.dish_proxy.set_filter(self.current_category(self.category_filter),
+                                   self.search_input.text().lower(),
+                                   incremental is True)
+
+    def refresh_dish_model(self):
+        """菜品数据变化后刷新共享模型，两个标签页的列表随之更新"""
+        self.dish_model.refresh()
+        self.update_dish_list()
+        self.update_order_dish_list()
 
     def update_category_filter(self):
         current_text = self.category_filter.currentText()
@@ -1134,132 +1323,47 @@ class MainWindow(QMainWindow):
         if current_text in self.menu_manager.categories:
             self.category_filter.setCurrentText(current_text)
 
-    def update_order_dish_list(self):
-        self.order_dish_list.clear()
-        
-        selected_category = self.dish_category_combo.currentText()
-        search_text = self.order_search_input.text().lower()
-        
-        for dish in self.menu_manager.dishes:
-            if selected_category != "所有分类" and dish.category != selected_category:
-                continue
-
-            try:
-                # 支持中文、拼音全拼、拼音首字母搜索
-                pinyin_name = ''.join(lazy_pinyin(dish.name))
-                pinyin_initials = ''.join([x[0] for x in lazy_pinyin(dish.name)])
-            except NameError:
-                # 如果 lazy_pinyin 不可用，仅支持中文搜索
-                pinyin_name = dish.name
-                pinyin_initials = dish.name
-
-            if (search_text and 
-                search_text not in dish.name.lower() and 
-                search_text not in pinyin_name and 
-                search_text not in pinyin_initials):
-                continue
-            
-            item_text = f"{dish.id}. {dish.name} - {dish.price}元"
-            if dish.dialect_name:
-                item_text += f" [{dish.dialect_name}]"
-            
-            if dish.is_spicy > 0:
-                item_text += f" {dish.get_spicy_text()}"
-            
-            self.order_dish_list.addItem(item_text)
+    def update_order_dish_list(self, incremental=False):
+        self.order_dish_proxy.set_filter(self.current_category(self.dish_category_combo),
+                                         self.order_search_input.text().lower(),
+                                         incremental is True)
 
     def sort_dishes(self, key='default'):
-        if key == 'default':
-            self.menu_manager.dishes.sort(key=lambda x: x.id)
-        elif key == 'name':
-            self.menu_manager.dishes.sort(key=lambda x: x.name)
-        elif key == 'price':
-            self.menu_manager.dishes.sort(key=lambda x: x.price)
-        
-        self.update_order_dish_list()
-        self.update_dish_list()
+        self.menu_manager.sort_dishes(key)
+        self.refresh_dish_model()
 
     def update_order_display(self):
-        if not hasattr(self, 'order_table') or self.order_table is None:
+        """整体刷新订单表格；逐项的增删改由 OrderTableModel 根据信号自动更新"""
+        if not hasattr(self, 'order_model'):
             return
-        
-        self.order_table.setRowCount(0)
-        
-        for person_name, order in self.order_manager.orders.items():
-            for item in order.items:
-                dish = self.menu_manager.get_dish_by_id(item.dish_id)
-                if dish:
-                    row = self.order_table.rowCount()
-                    self.order_table.insertRow(row)
-                    
-                    self.order_table.setItem(row, 0, QTableWidgetItem(person_name))
-                    self.order_table.setItem(row, 1, QTableWidgetItem(dish.name))
-                    self.order_table.setItem(row, 2, QTableWidgetItem(str(dish.price)))
-                    self.order_table.setItem(row, 3, QTableWidgetItem(str(item.quantity)))
-                    self.order_table.setItem(row, 4, QTableWidgetItem(f"{dish.price * item.quantity}元"))
-                    self.order_table.setItem(row, 5, QTableWidgetItem(item.remark))
-
-
-    def update_order_item(self, row, column):
-        if column == 3:  # 数量列
-            person_name = self.order_table.item(row, 0).text()
-            dish_name = self.order_table.item(row, 1).text()
-            new_quantity = int(self.order_table.item(row, 3).text())
-            
-            # 更新订单管理器中的数据
-            for person in self.order_manager.orders.values():
-                if person.name == person_name:
-                    for item in person.items:
-                        dish = self.menu_manager.get_dish_by_id(item.dish_id)
-                        if dish and dish.name == dish_name:
-                            item.quantity = new_quantity
-                            break
-            
-            # 重新计算小计
-            dish_price = float(self.order_table.item(row, 2).text().replace('元', ''))
-            self.order_table.item(row, 4).setText(f"{dish_price * new_quantity}元")
-            
-            # 重新计算总计
-            self.calculate_totals()
+        self.order_model.refresh()
+
+    def selected_order_row(self):
+        """返回订单表格选中行对应的 (顾客名, 订单项索引, OrderItem)，未选中时返回 None"""
+        selected_rows = self.order_table.selectionModel().selectedRows()
+        if not selected_rows:
+            return None
+        return self.order_model.item_at(selected_rows[0].row())
 
     def edit_order_item(self, row, column):
         """编辑订单项"""
-        if column in (2, 3):  # 数量或备注列
-            person_name = self.order_table.item(row, 0).text()
-            dish_name = self.order_table.item(row, 1).text()
-            
-            # 获取当前值
-            current_value = self.order_table.item(row, column).text()
+        if column in (3, 5):  # 数量或备注列
+            person_name, index, item = self.order_model.item_at(row)
+            dish = self.menu_manager.get_dish_by_id(item.dish_id)
+            dish_name = dish.name if dish else str(item.dish_id)
             
             # 弹出输入对话框
-            if column == 2:  # 数量
+            if column == 3:  # 数量
                 new_value, ok = QInputDialog.getInt(self, "修改数量", f"修改 {dish_name} 的数量:", 
-                                                int(current_value), 1, 99, 1)
+                                                item.quantity, 1, 99, 1)
+                if ok and new_value != item.quantity:
+                    self.order_manager.update_item(person_name, index, quantity=new_value)
+                    self.calculate_totals()
             else:  # 备注
                 new_value, ok = QInputDialog.getText(self, "修改备注", f"修改 {dish_name} 的备注:", 
-                                                text=current_value)
-            
-            if ok and new_value != current_value:
-                # 更新表格显示
-                self.order_table.item(row, column).setText(str(new_value))
-                
-                # 更新订单管理器中的数据
-                for person in self.order_manager.orders.values():
-                    if person.name == person_name:
-                        for item in person.items:
-                            dish = self.menu_manager.get_dish_by_id(item.dish_id)
-                            if dish and dish.name == dish_name:
-                                if column == 2:  # 数量
-                                    item.quantity = int(new_value)
-                                else:  # 备注
-                                    item.remark = new_value
-                                break
-                
-                # 如果是数量变化，重新计算小计
-                if column == 2:
-                    dish_price = float(self.order_table.item(row, 2).text().replace('元', ''))
-                    self.order_table.item(row, 4).setText(f"{dish_price * int(new_value)}元")
-                    self.calculate_totals()
+                                                text=item.remark)
+                if ok and new_value != item.remark:
+                    self.order_manager.update_item(person_name, index, remark=new_value)
 
 
     def save_current_order_without_clear(self):
@@ -1277,23 +1381,11 @@ class MainWindow(QMainWindow):
             return
         
         # 1. 首先保存到订单历史记录
-        self.order_manager.save_current_order()
+        self.save_order_to_history()
         
         # 2. 准备订单数据
-        order_data = {
-            "version": "2.2.0",
-            "table": self.order_manager.current_table,
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "orders": {}
-        }
-        
-        # 3. 收集所有订单数据
-        for name, person_order in self.order_manager.orders.items():
-            order_data["orders"][name] = {
-                "items": [(item.dish_id, item.quantity, item.remark) for item in person_order.items],
-                "payment_method": person_order.payment_method,
-                "payment_value": person_order.payment_value
-            }
+        # 3. 收集所有订单数据（含单价、菜品名和金额快照）
+        order_data = {"version": ORDER_FILE_VERSION, **self.order_manager.build_order_data()}
         
         # 4. 弹出保存文件对话框
         options = QFileDialog.Options()
@@ -1315,14 +1407,16 @@ class MainWindow(QMainWindow):
         
         try:
             # 6. 保存到文件
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(order_data, f, ensure_ascii=False, indent=2)
+            write_json_file(filename, order_data, self.file_formats["order"])
             
             # 7. 添加到最近订单列表
             self.save_recent_order(filename)
             
             # 8. 更新历史订单显示
             self.update_history_table()
+            self.update_top_dishes_table()
+            self.update_habits_table()
+            self.update_trend_table()
             
             # 9. 显示成功消息
             self.statusBar().showMessage(f"订单已保存到: {filename}", 3000)
@@ -1361,13 +1455,16 @@ class MainWindow(QMainWindow):
         history_tab = QWidget()
         history_layout = QVBoxLayout()
         
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(4)
-        self.history_table.setHorizontalHeaderLabels(["时间", "桌号", "顾客数", "总金额"])
-        self.history_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.update_history_table()  # 填充历史数据
+        # 使用单独的模型和表格，不影响历史订单标签页
+        self.open_order_history_view = QTableView()
+        self.open_order_history_view.setModel(HistoryTableModel(self.menu_manager, dialog))
+        self.open_order_history_view.setSelectionBehavior(QTableView.SelectRows)
+        self.open_order_history_view.setSelectionMode(QTableView.SingleSelection)
+        self.open_order_history_view.horizontalHeader().setStretchLastSection(True)
+        self.open_order_history_view.setSortingEnabled(True)
+        self.open_order_history_view.sortByColumn(0, Qt.DescendingOrder)  # 最新的订单在最上面
         
-        history_layout.addWidget(self.history_table)
+        history_layout.addWidget(self.open_order_history_view)
         history_tab.setLayout(history_layout)
         
         # 标签2: 从文件打开
@@ -1402,7 +1499,7 @@ class MainWindow(QMainWindow):
         dialog.setLayout(layout)
         
         # 双击也可以打开
-        self.history_table.doubleClicked.connect(lambda: self.load_selected_order(0, dialog))
+        self.open_order_history_view.doubleClicked.connect(lambda: self.load_selected_order(0, dialog))
         self.recent_order_list.doubleClicked.connect(lambda: self.load_selected_order(1, dialog))
         
         dialog.exec_()
@@ -1410,13 +1507,12 @@ class MainWindow(QMainWindow):
     def load_selected_order(self, tab_index, dialog):
         """加载选中的订单"""
         if tab_index == 0:  # 历史记录
-            selected_rows = self.history_table.selectionModel().selectedRows()
+            selected_rows = self.open_order_history_view.selectionModel().selectedRows()
             if not selected_rows:
                 QMessageBox.warning(self, "警告", "请先选择一个历史订单")
                 return
             
-            row = selected_rows[0].row()
-            order_data = self.order_manager.history[row]
+            order_data = self.open_order_history_view.model().order_at(selected_rows[0].row())
         else:  # 文件
             selected_items = self.recent_order_list.selectedItems()
             if not selected_items:
@@ -1425,32 +1521,20 @@ class MainWindow(QMainWindow):
             
             filename = selected_items[0].data(Qt.UserRole)
             try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    order_data = json.load(f)
+                order_data = read_json_file(filename)
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"加载订单文件失败: {str(e)}")
                 return
         
-        # 清空当前订单
-        self.order_manager.clear_current_order()
-        self.order_manager.current_table = order_data.get("table", "")
-        
-        # 加载订单数据
-        for person_name, person_data in order_data["orders"].items():
-            self.order_manager.add_person(person_name)
-            for dish_id, quantity, remark in person_data["items"]:
-                self.order_manager.add_item_to_person(person_name, dish_id, quantity, remark)
-            
-            # 设置支付方式
-            self.order_manager.set_payment_method(
-                person_name,
-                person_data["payment_method"],
-                person_data["payment_value"]
-            )
+        # 一次性恢复订单，不重复统计销量
+        try:
+            self.order_manager.restore_order(order_data)
+        except ValueError as e:
+            QMessageBox.critical(self, "错误", f"订单格式无效: {str(e)}")
+            return
         
         # 更新UI
         self.table_input.setText(self.order_manager.current_table)
-        self.update_order_display()
         self.calculate_totals()
         
         # 如果是文件订单，添加到最近列表
@@ -1507,8 +1591,7 @@ class MainWindow(QMainWindow):
         recent.insert(0, filename)
         recent = recent[:5]  # 只保留最近5个
         
-        with open('recent_orders.json', 'w', encoding='utf-8') as f:
-            json.dump({"recent_orders": recent}, f, ensure_ascii=False, indent=2)
+        write_json_atomic('recent_orders.json', {"recent_orders": recent})
 
 
     def load_order_from_file(self, filename):
@@ -1518,53 +1601,14 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, "警告", f"订单文件不存在: {filename}")
                 return False
 
-            with open(filename, 'r', encoding='utf-8') as f:
-                order_data = json.load(f)
-
-            # 验证订单数据结构
-            if not isinstance(order_data, dict) or "orders" not in order_data:
-                raise ValueError("无效的订单文件格式")
+            # 自动识别格式化/紧凑/压缩的订单文件
+            order_data = read_json_file(filename)
 
-            # 清空当前订单
-            self.order_manager.clear_current_order()
-            
-            # 设置桌号（默认为"1"）
-            self.order_manager.current_table = order_data.get("table", "1")
+            # 一次性恢复订单（桌号默认为"1"），不重复统计销量
+            self.order_manager.restore_order(order_data, default_table="1")
             self.table_input.setText(self.order_manager.current_table)
 
-            # 加载每个顾客的订单
-            for person_name, person_data in order_data["orders"].items():
-                # 验证顾客数据
-                if not isinstance(person_data, dict) or "items" not in person_data:
-                    continue
-
-                # 添加顾客
-                self.order_manager.add_person(person_name)
-
-                # 加载菜品
-                for item in person_data["items"]:
-                    # 验证菜品数据格式 (dish_id, quantity, remark)
-                    if len(item) != 3 or not all(isinstance(i, (int, str)) for i in item[:2]):
-                        continue
-
-                    dish_id, quantity, remark = item
-                    self.order_manager.add_item_to_person(
-                        person_name, 
-                        int(dish_id), 
-                        int(quantity), 
-                        str(remark)
-                    )
-
-                # 设置支付方式（如果有）
-                if "payment_method" in person_data and "payment_value" in person_data:
-                    self.order_manager.set_payment_method(
-                        person_name,
-                        person_data["payment_method"],
-                        float(person_data["payment_value"])
-                    )
-
             # 更新UI
-            self.update_order_display()
             self.calculate_totals()
             
             # 添加到最近订单记录
@@ -1589,8 +1633,7 @@ class MainWindow(QMainWindow):
     def clear_recent_orders(self):
         """清除最近订单记录"""
         try:
-            with open('recent_orders.json', 'w', encoding='utf-8') as f:
-                json.dump({"recent_orders": []}, f)
+            write_json_atomic('recent_orders.json', {"recent_orders": []}, indent=None)
             self.recent_orders = []
             
             # 更新菜单
@@ -1623,7 +1666,7 @@ class MainWindow(QMainWindow):
         
         for row, (name, data) in enumerate(totals.items()):
             self.payment_table.setItem(row, 0, QTableWidgetItem(name))
-            self.payment_table.setItem(row, 1, QTableWidgetItem(f"{data['original']:.2f}元"))
+            self.payment_table.setItem(row, 1, QTableWidgetItem(f"{format_money(data['original_cents'])}元"))
             
             method_text = {
                 "AA": "AA制",
@@ -1632,55 +1675,118 @@ class MainWindow(QMainWindow):
             }.get(data['method'], data['method'])
             
             self.payment_table.setItem(row, 2, QTableWidgetItem(method_text))
-            self.payment_table.setItem(row, 3, QTableWidgetItem(f"{data['final']:.2f}元"))
+            self.payment_table.setItem(row, 3, QTableWidgetItem(f"{format_money(data['final_cents'])}元"))
         
         self.total_label.setText(f"总金额: {subtotal:.2f}元")
         self.payment_table.resizeColumnsToContents()  # 自动调整列宽
 
 
+    def is_view_visible(self, name, tab):
+        """标签页不可见时记下需要刷新的视图，返回 False"""
+        if self.tab_widget.currentWidget() is tab:
+            self._stale_views.discard(name)
+            return True
+        self._stale_views.add(name)
+        return False
+
+    def refresh_stale_views(self, index=None):
+        if "history" in self._stale_views:
+            self.update_history_table()
+        if "top_dishes" in self._stale_views:
+            self.update_top_dishes_table()
+        if "habits" in self._stale_views:
+            self.update_habits_table()
+        if "trend" in self._stale_views:
+            self.update_trend_table()
+
     def update_history_table(self):
-        self.history_table.setRowCount(len(self.order_manager.history))
-        
-        for row, order in enumerate(self.order_manager.history):
-            customer_count = len(order["orders"])
-            total = 0
-            
-            for person_data in order["orders"].values():
-                for dish_id, quantity, _ in person_data["items"]:
-                    dish = self.menu_manager.get_dish_by_id(dish_id)
-                    if dish:
-                        total += dish.price * quantity
-            
-            self.history_table.setItem(row, 0, QTableWidgetItem(order["timestamp"]))
-            self.history_table.setItem(row, 1, QTableWidgetItem(order["table"]))
-            self.history_table.setItem(row, 2, QTableWidgetItem(str(customer_count)))
-            self.history_table.setItem(row, 3, QTableWidgetItem(f"{total}元"))
+        if not self.is_view_visible("history", self.history_tab):
+            return
+        self.history_model.refresh()
+
+    def on_history_sort_changed(self, column, order):
+        # 模型不支持按该列排序时改为按时间排序，表头的排序标记随之更新
+        sort_column = self.history_model.sort_column()
+        if sort_column != column:
+            self.history_table.horizontalHeader().setSortIndicator(sort_column, order)
+            self.statusBar().showMessage("JSON 菜单的订单历史只能按时间排序（SQLite 菜单文件支持按各列排序）", 3000)
+
+    def apply_history_filter(self):
+        start = end = None
+        if self.history_date_check.isChecked():
+            start = self.history_start_date.date().toString("yyyy-MM-dd")
+            end = self.history_end_date.date().addDays(1).toString("yyyy-MM-dd")
+        table = self.history_table_filter.text().strip() or None
+        self.history_model.set_filter(start, end, table)
+
+    def clear_history_filter(self):
+        self.history_date_check.setChecked(False)
+        self.history_table_filter.clear()
+        self.history_model.set_filter()
 
     def update_top_dishes_table(self):
+        if not self.is_view_visible("top_dishes", self.analysis_tab):
+            return
         top_dishes = self.menu_manager.get_top_dishes(10)
         self.top_dishes_table.setRowCount(len(top_dishes))
         
-        for row, dish in enumerate(top_dishes):
+        for row, (dish_id, quantity) in enumerate(top_dishes):
+            dish = self.menu_manager.get_dish_by_id(dish_id)
             self.top_dishes_table.setItem(row, 0, QTableWidgetItem(str(row + 1)))
-            self.top_dishes_table.setItem(row, 1, QTableWidgetItem(dish.name))
-            self.top_dishes_table.setItem(row, 2, QTableWidgetItem(dish.category))
-            self.top_dishes_table.setItem(row, 3, QTableWidgetItem(f"{dish.price}元"))
-            self.top_dishes_table.setItem(row, 4, QTableWidgetItem(str(dish.sales_count)))
+            self.top_dishes_table.setItem(row, 1, QTableWidgetItem(self.menu_manager.dish_name(dish_id)))
+            self.top_dishes_table.setItem(row, 2, QTableWidgetItem(dish.category if dish else "已删除"))
+            self.top_dishes_table.setItem(row, 3, QTableWidgetItem(f"{format_money(dish.price_cents)}元" if dish else ""))
+            self.top_dishes_table.setItem(row, 4, QTableWidgetItem(str(quantity)))
 
     def update_habits_table(self):
-        habits = self.order_manager.get_customer_habits()
-        self.habits_table.setRowCount(len(habits))
+        if not self.is_view_visible("habits", self.analysis_tab):
+            return
+        habits = self.menu_manager.customer_habits
+        self.habits_table.setRowCount(len(habits.customers))
         
-        for row, (name, data) in enumerate(habits.items()):
+        for row, (name, data) in enumerate(habits.customers.items()):
             self.habits_table.setItem(row, 0, QTableWidgetItem(name))
             self.habits_table.setItem(row, 1, QTableWidgetItem(str(data["count"])))
-            self.habits_table.setItem(row, 2, QTableWidgetItem(f"{data['total_spent']}元"))
+            self.habits_table.setItem(row, 2, QTableWidgetItem(f"{format_money(data['total_spent_cents'])}元"))
             
-            # 找出最常点的3个菜
-            top_dishes = sorted(data["dishes"].items(), key=lambda x: x[1], reverse=True)[:3]
+            # 最常点的3个菜（统计时已维护排行）
+            top_dishes = habits.top_dishes(name, 3)
             top_dishes_text = ", ".join(f"{name}({count})" for name, count in top_dishes)
             self.habits_table.setItem(row, 3, QTableWidgetItem(top_dishes_text))
 
+    def update_trend_table(self):
+        """按所选汇总方式和营业时段显示最近的汇总，数据来自预先汇总的 SalesRollups"""
+        if not self.is_view_visible("trend", self.analysis_tab):
+            return
+        granularity = self.rollup_granularity.currentData()
+        slot = self.rollup_slot.currentData()
+        series = self.menu_manager.sales_rollups.series(granularity, slot, limit=60)
+        self.trend_table.blockSignals(True)
+        self.trend_table.setRowCount(len(series))
+        for row, (key, summary) in enumerate(series):
+            self.trend_table.setItem(row, 0, QTableWidgetItem(key))
+            self.trend_table.setItem(row, 1, QTableWidgetItem(str(summary["orders"])))
+            self.trend_table.setItem(row, 2, QTableWidgetItem(str(summary["covers"])))
+            self.trend_table.setItem(row, 3, QTableWidgetItem(f"{format_money(summary['revenue_cents'])}元"))
+            self.trend_table.setItem(row, 4, QTableWidgetItem(f"{format_money(summary['avg_ticket_cents'])}元"))
+        self.trend_table.blockSignals(False)
+        if series:
+            self.trend_table.selectRow(0)  # 默认显示最近一段时间（如本月）的热销菜品
+        self.update_trend_dishes_table()
+
+    def update_trend_dishes_table(self):
+        row = self.trend_table.currentRow()
+        top_dishes = []
+        if 0 <= row < self.trend_table.rowCount() and self.trend_table.item(row, 0):
+            top_dishes = self.menu_manager.sales_rollups.top_dishes(
+                self.rollup_granularity.currentData(), self.trend_table.item(row, 0).text(),
+                self.rollup_slot.currentData(), limit=10)
+        self.trend_dishes_table.setRowCount(len(top_dishes))
+        for rank, (dish_id, quantity) in enumerate(top_dishes):
+            self.trend_dishes_table.setItem(rank, 0, QTableWidgetItem(str(rank + 1)))
+            self.trend_dishes_table.setItem(rank, 1, QTableWidgetItem(self.menu_manager.dish_name(dish_id)))
+            self.trend_dishes_table.setItem(rank, 2, QTableWidgetItem(str(quantity)))
+
     def update_analysis_view(self, index):
         self.analysis_stack.setCurrentIndex(index)
         
@@ -1688,15 +1794,20 @@ class MainWindow(QMainWindow):
             self.update_top_dishes_table()
         elif index == 1:  # 消费习惯
             self.update_habits_table()
+        elif index == 2:  # 销售趋势
+            self.update_trend_table()
 
     def refresh_all_views(self):
+        self.dish_model.set_menu_manager(self.menu_manager)
+        self.history_model.set_menu_manager(self.menu_manager)
+        self.order_model.set_order_manager(self.order_manager, self.menu_manager)
         self.update_dish_list()
         self.update_category_filter()
         self.update_order_dish_list()
-        self.update_order_display()
         self.update_history_table()
         self.update_top_dishes_table()
         self.update_habits_table()
+        self.update_trend_table()
         
         # 清空支付表格
         if hasattr(self, 'payment_table'):
@@ -1719,18 +1830,15 @@ class MainWindow(QMainWindow):
                 dish_data["dialect_name"],
                 dish_data["is_spicy"]
             )
-            self.update_dish_list()
+            self.refresh_dish_model()
             self.update_category_filter()
-            self.update_order_dish_list()
 
     def edit_selected_dish(self):
-        selected_items = self.dish_list_widget.selectedItems()
-        if not selected_items:
+        dish_id = selected_dish_id(self.dish_list_view)
+        if dish_id is None:
             QMessageBox.warning(self, "警告", "请先选择一个菜品")
             return
         
-        selected_text = selected_items[0].text()
-        dish_id = int(selected_text.split('.')[0])
         dish = self.menu_manager.get_dish_by_id(dish_id)
         
         if dish:
@@ -1748,29 +1856,25 @@ class MainWindow(QMainWindow):
                     dialect_name=dish_data["dialect_name"],
                     is_spicy=dish_data["is_spicy"]
                 )
-                self.update_dish_list()
+                self.refresh_dish_model()
                 self.update_category_filter()
-                self.update_order_dish_list()
 
     def remove_selected_dish(self):
-        selected_items = self.dish_list_widget.selectedItems()
-        if not selected_items:
+        dish_id = selected_dish_id(self.dish_list_view)
+        if dish_id is None:
             QMessageBox.warning(self, "警告", "请先选择一个菜品")
             return
         
         reply = QMessageBox.question(self, "确认删除", "确定要删除这个菜品吗?",
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            selected_text = selected_items[0].text()
-            dish_id = int(selected_text.split('.')[0])
             self.menu_manager.remove_dish(dish_id)
-            self.update_dish_list()
+            self.refresh_dish_model()
             self.update_category_filter()
-            self.update_order_dish_list()
 
     def add_to_order(self):
-        selected_items = self.order_dish_list.selectedItems()
-        if not selected_items:
+        dish_id = selected_dish_id(self.order_dish_view)
+        if dish_id is None:
             QMessageBox.warning(self, "警告", "请先选择一个菜品")
             return
         
@@ -1781,8 +1885,6 @@ class MainWindow(QMainWindow):
         # 顾客姓名默认为"匿名"
         customer_name = self.customer_name_input.text().strip() or "匿名"
                 
-        selected_text = selected_items[0].text()
-        dish_id = int(selected_text.split('.')[0])
         quantity = self.quantity_spin.value()
         
         # 处理备注
@@ -1796,9 +1898,6 @@ class MainWindow(QMainWindow):
         self.order_manager.add_person(customer_name)
         self.order_manager.add_item_to_person(customer_name, dish_id, quantity, remark)
         
-        # 更新显示
-        self.update_order_display()
-        
         # 清空输入
         self.remark_input.clear()
         self.spicy_check.setCurrentIndex(0)
@@ -1815,19 +1914,8 @@ class MainWindow(QMainWindow):
         
         # 从最后开始删除，避免行号变化问题
         for row in sorted((r.row() for r in selected_rows), reverse=True):
-            person_name = self.order_table.item(row, 0).text()
-            dish_name = self.order_table.item(row, 1).text()
-            
-            # 找到对应的订单项索引
-            person_order = self.order_manager.orders.get(person_name)
-            if person_order:
-                for i, item in enumerate(person_order.items):
-                    dish = self.menu_manager.get_dish_by_id(item.dish_id)
-                    if dish and dish.name == dish_name:
-                        person_order.remove_item(i)
-                        break
-        
-        self.update_order_display()
+            person_name, index, _ = self.order_model.item_at(row)
+            self.order_manager.remove_item_from_person(person_name, index)
 
     def clear_order(self):
         if not self.order_manager.orders:
@@ -1837,7 +1925,6 @@ class MainWindow(QMainWindow):
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
             self.order_manager.clear_current_order()
-            self.update_order_display()
             if hasattr(self, 'payment_table'):  # 安全检查
                 self.payment_table.setRowCount(0)
             if hasattr(self, 'total_label'):    # 安全检查
@@ -1848,21 +1935,34 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "当前没有订单可保存")
             return
         
-        self.order_manager.save_current_order()
+        saved = self.save_order_to_history()
         self.order_manager.clear_current_order()
-        self.update_order_display()
         self.update_history_table()
+        self.update_top_dishes_table()
+        self.update_habits_table()
+        self.update_trend_table()
         self.payment_table.setRowCount(0)
         self.total_label.setText("总金额: 0元")
         
-        QMessageBox.information(self, "成功", "订单已保存")
+        if saved:
+            QMessageBox.information(self, "成功", "订单已保存")
+
+    def save_order_to_history(self):
+        """把当前订单加入订单历史；写入存储失败时订单仍保留在内存中，提示稍后保存菜单"""
+        try:
+            self.order_manager.save_current_order()
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.critical(self, "保存失败",
+                                 f"订单已加入历史，但写入存储失败:\n{e}\n\n请稍后保存菜单以写入完整历史")
+            return False
+        return True
 
     def calculate_totals(self):
         if not self.order_manager.orders:
             QMessageBox.warning(self, "警告", "当前没有订单可计算")
             return
         
-        totals, subtotal = self.order_manager.calculate_totals(self.menu_manager)
+        totals, subtotal_cents = self.order_manager.settle()
         
         # 创建详细菜品列表的对话框
         detail_dialog = QDialog(self)
@@ -1890,9 +1990,9 @@ class MainWindow(QMainWindow):
                     detail_table.insertRow(row)
                     detail_table.setItem(row, 0, QTableWidgetItem(person_name))
                     detail_table.setItem(row, 1, QTableWidgetItem(dish.name))
-                    detail_table.setItem(row, 2, QTableWidgetItem(f"{dish.price}元"))
+                    detail_table.setItem(row, 2, QTableWidgetItem(f"{format_money(item.price_cents)}元"))
                     detail_table.setItem(row, 3, QTableWidgetItem(str(item.quantity)))
-                    detail_table.setItem(row, 4, QTableWidgetItem(f"{dish.price * item.quantity}元"))
+                    detail_table.setItem(row, 4, QTableWidgetItem(f"{format_money(item.total_cents)}元"))
                     detail_table.setItem(row, 5, QTableWidgetItem(item.remark))
                     row += 1
         
@@ -1906,12 +2006,12 @@ class MainWindow(QMainWindow):
         for name, data in totals.items():
             payment_table.insertRow(payment_row)
             payment_table.setItem(payment_row, 0, QTableWidgetItem(name))
-            payment_table.setItem(payment_row, 1, QTableWidgetItem(f"{data['original']:.2f}元"))
-            payment_table.setItem(payment_row, 2, QTableWidgetItem(f"{data['final']:.2f}元"))  # 直接显示实际应付金额
+            payment_table.setItem(payment_row, 1, QTableWidgetItem(f"{format_money(data['original_cents'])}元"))
+            payment_table.setItem(payment_row, 2, QTableWidgetItem(f"{format_money(data['final_cents'])}元"))  # 直接显示实际应付金额
             payment_row += 1
         
         # 总金额
-        total_label = QLabel(f"总金额: {subtotal:.2f}元")
+        total_label = QLabel(f"总金额: {format_money(subtotal_cents)}元")
         total_label.setAlignment(Qt.AlignRight)
         font = total_label.font()
         font.setPointSize(14)
@@ -1937,29 +2037,21 @@ class MainWindow(QMainWindow):
         detail_dialog.exec_()
 
     def set_payment_method(self):
-        selected_rows = self.order_table.selectionModel().selectedRows()
-        if not selected_rows or len(selected_rows) > 1:
+        selected = self.selected_order_row()
+        if selected is None:
             QMessageBox.warning(self, "警告", "请选择一个顾客设置支付方式")
             return
         
-        row = selected_rows[0].row()
-        person_name = self.order_table.item(row, 0).text()
+        person_name = selected[0]
         
-        # 修改计算逻辑，使用menu_manager获取菜品价格 - 版本2.2.1
-        original_amount = 0
         person_order = self.order_manager.orders.get(person_name)
-        if person_order:
-            for item in person_order.items:
-                dish = self.menu_manager.get_dish_by_id(item.dish_id)
-                if dish:
-                    original_amount += dish.price * item.quantity
+        original_amount = person_order.subtotal_cents / 100 if person_order else 0
         
         dialog = PaymentMethodDialog(self, original_amount)
         if dialog.exec_() == QDialog.Accepted:
             if hasattr(dialog, 'payment_method'):
                 method, value = dialog.payment_method
                 self.order_manager.set_payment_method(person_name, method, value)
-                self.update_order_display()
                 self.calculate_totals()
 
 
@@ -1984,11 +2076,11 @@ class MainWindow(QMainWindow):
             return
         
         # 检查索引是否在有效范围内
-        if index < 0 or index >= len(self.order_manager.history):
+        if index < 0 or index >= self.history_model.rowCount():
             QMessageBox.warning(self, "错误", "订单索引超出范围")
             return
         
-        order = self.order_manager.history[index]
+        order = self.history_model.order_at(index)
         
         detail_dialog = QDialog(self)
         detail_dialog.setWindowTitle(f"订单详情 - {order['table']}桌 - {order['timestamp']}")
@@ -2008,27 +2100,28 @@ class MainWindow(QMainWindow):
         detail_table.setHorizontalHeaderLabels(["顾客", "菜品", "单价", "数量", "小计", "备注"])
         detail_table.horizontalHeader().setStretchLastSection(True)
         
-        total = 0
         row_count = 0
         
         for person_name, person_data in order["orders"].items():
-            for dish_id, quantity, remark in person_data["items"]:
-                dish = self.menu_manager.get_dish_by_id(dish_id)
-                if dish:
+            for item in person_data["items"]:
+                # 优先显示保存时的菜品名和单价
+                resolved = self.menu_manager.resolve_order_item(item)
+                if resolved:
+                    name, price_cents, quantity, remark = resolved
                     detail_table.insertRow(row_count)
                     detail_table.setItem(row_count, 0, QTableWidgetItem(person_name))
-                    detail_table.setItem(row_count, 1, QTableWidgetItem(dish.name))
-                    detail_table.setItem(row_count, 2, QTableWidgetItem(f"{dish.price}元"))
+                    detail_table.setItem(row_count, 1, QTableWidgetItem(name))
+                    detail_table.setItem(row_count, 2, QTableWidgetItem(f"{format_money(price_cents)}元"))
                     detail_table.setItem(row_count, 3, QTableWidgetItem(str(quantity)))
-                    detail_table.setItem(row_count, 4, QTableWidgetItem(f"{dish.price * quantity}元"))
+                    detail_table.setItem(row_count, 4, QTableWidgetItem(f"{format_money(price_cents * quantity)}元"))
                     detail_table.setItem(row_count, 5, QTableWidgetItem(remark))
-                    total += dish.price * quantity
                     row_count += 1
+        total_cents = self.menu_manager.order_total_cents(order)
         
         # 支付方式表格
         payment_table = QTableWidget()
         payment_table.setColumnCount(4)
-        payment_table.setHorizontalHeaderLabels(["顾客", "消费金额", "应付金额"])
+        payment_table.setHorizontalHeaderLabels(["顾客", "支付方式", "消费金额", "应付金额"])
         payment_table.horizontalHeader().setStretchLastSection(True)
         
         payment_row = 0
@@ -2044,17 +2137,15 @@ class MainWindow(QMainWindow):
             
             payment_table.setItem(payment_row, 1, QTableWidgetItem(method_text))
             
-            # 计算该顾客应付金额
-            person_total = 0
-            for dish_id, quantity, _ in person_data["items"]:
-                dish = self.menu_manager.get_dish_by_id(dish_id)
-                if dish:
-                    person_total += dish.price * quantity
-            payment_table.setItem(payment_row, 2, QTableWidgetItem(f"{person_total}元"))
+            # 该顾客的消费金额和应付金额（旧格式订单没有应付金额快照）
+            person_total_cents = self.menu_manager.person_total_cents(person_data)
+            payment_table.setItem(payment_row, 2, QTableWidgetItem(f"{format_money(person_total_cents)}元"))
+            if "final_cents" in person_data:
+                payment_table.setItem(payment_row, 3, QTableWidgetItem(f"{format_money(person_data['final_cents'])}元"))
             payment_row += 1
         
         # 总金额
-        total_label = QLabel(f"总金额: {total}元")
+        total_label = QLabel(f"总金额: {format_money(total_cents)}元")
         total_label.setAlignment(Qt.AlignRight)
         font = total_label.font()
         font.setBold(True)
@@ -2073,17 +2164,47 @@ class MainWindow(QMainWindow):
 
 
     def export_history(self):
+        """在后台导出订单历史（按历史页当前的筛选条件），每个菜品项一行"""
+        if self.export_job is not None:
+            QMessageBox.information(self, "提示", "正在导出订单历史，请等待完成或取消后再试")
+            return
         options = QFileDialog.Options()
-        filename, _ = QFileDialog.getSaveFileName(self, "导出历史订单", "", 
+        filename, selected_filter = QFileDialog.getSaveFileName(self, "导出历史订单", "", 
                                                 "Excel文件 (*.xlsx);;CSV文件 (*.csv)", 
                                                 options=options)
-        if filename:
-            try:
-                # 这里应该实现实际的导出逻辑
-                # 由于需要额外的库(pandas/openpyxl)，这里只显示提示
-                QMessageBox.information(self, "成功", f"订单历史已导出到 {filename}")
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"导出失败: {str(e)}")
+        if not filename:
+            return
+        if not filename.lower().endswith(('.xlsx', '.csv')):
+            filename += '.csv' if selected_filter.startswith("CSV") else '.xlsx'
+        if filename.lower().endswith('.xlsx') and openpyxl is None:
+            QMessageBox.warning(self, "提示", "导出Excel文件需要安装 openpyxl（pip install openpyxl），也可以导出为CSV文件")
+            return
+
+        self.export_job = self.menu_manager.begin_export(filename, *self.history_model.current_filter())
+        self.export_progress = QProgressDialog("正在导出订单历史...", "取消", 0, 0, self)
+        self.export_progress.setWindowTitle("导出历史订单")
+        self.export_progress.setAutoClose(False)
+        self.export_progress.setAutoReset(False)
+        self.export_progress.canceled.connect(self.export_job.cancel)
+        self.export_progress.show()
+        self.export_pool.start(_ExportTask(self.export_job, self._export_signals))
+
+    def on_export_progress(self, done, total):
+        if self.export_progress is not None:
+            self.export_progress.setMaximum(max(total, 1))
+            self.export_progress.setValue(done)
+
+    def on_export_finished(self, job, error):
+        self.export_job = None
+        if self.export_progress is not None:
+            self.export_progress.close()
+            self.export_progress = None
+        if isinstance(error, ExportCancelled):
+            self.statusBar().showMessage("已取消导出订单历史", 3000)
+        elif error is not None:
+            QMessageBox.critical(self, "错误", f"导出失败: {str(error)}")
+        else:
+            QMessageBox.information(self, "成功", f"已导出 {job.rows_written} 行订单历史到 {job.filename}")
 
     def new_menu(self):
         reply = QMessageBox.question(self, "新建菜单", "创建新菜单会清空当前菜单，是否继续?",
@@ -2111,7 +2232,7 @@ class MainWindow(QMainWindow):
     def open_menu(self):
         options = QFileDialog.Options()
         filename, _ = QFileDialog.getOpenFileName(self, "打开菜单文件", "", 
-                                                "JSON文件 (*.json);;所有文件 (*)", 
+                                                "JSON文件 (*.json);;SQLite数据库 (*.db);;所有文件 (*)", 
                                                 options=options)
         if filename:
             new_manager = MenuManager()
@@ -2132,58 +2253,143 @@ class MainWindow(QMainWindow):
             # 如果是新建的菜单且从未保存过，则调用另存为
             self.save_menu_as()
         else:
-            try:
-                self.menu_manager.save_to_file(self.menu_manager.current_file)
-                self.statusBar().showMessage(f"菜单已保存到: {self.menu_manager.current_file}", 2000)
-            except Exception as e:
-                QMessageBox.critical(self, "保存失败", f"保存菜单失败:\n{str(e)}")
-                # 保存失败时尝试另存为
-                self.save_menu_as()
+            self.save_menu_to(self.menu_manager.current_file)
+
+    def save_menu_to(self, filename):
+        """在后台线程保存菜单，完成后通过 on_save_finished 提示"""
+        menu_manager = self.menu_manager
+        file_format = self.file_formats["menu"]
+        self.saver.request("menu", lambda: menu_manager.begin_save(filename, file_format), menu_manager.finish_save)
+
+    def on_save_finished(self, kind, filename, error):
+        if kind == "backup":
+            if error:
+                self.last_backup_key = None  # 下次自动备份时重试
+                self.statusBar().showMessage(f"自动备份失败: {error}", 5000)
+            else:
+                self.statusBar().showMessage("自动备份完成", 2000)
+        elif error:
+            QMessageBox.critical(self, "保存失败", f"保存菜单失败:\n{error}")
+            # 保存失败时尝试另存为
+            self.save_menu_as()
+        else:
+            self.statusBar().showMessage(f"菜单已保存到: {filename}", 2000)
 
 
     def save_menu_as(self):
         options = QFileDialog.Options()
-        filename, _ = QFileDialog.getSaveFileName(self, "另存菜单文件", "", 
-                                                "JSON文件 (*.json);;所有文件 (*)", 
+        filename, selected_filter = QFileDialog.getSaveFileName(self, "另存菜单文件", "", 
+                                                "JSON文件 (*.json);;SQLite数据库 (*.db);;所有文件 (*)", 
                                                 options=options)
         if filename:
-            if not filename.endswith('.json'):
-                filename += '.json'
-            try:
-                self.menu_manager.save_to_file(filename)
-                self.menu_manager.current_file = filename  # 更新当前文件路径
-                base_name = os.path.basename(filename)
-                self.setWindowTitle(f"高级点菜管理系统 - {base_name}")
-                self.statusBar().showMessage(f"菜单已保存为 {base_name}", 2000)
-            except Exception as e:
-                QMessageBox.critical(self, "保存失败", f"保存菜单失败:\n{str(e)}")
+            if not filename.endswith(('.json', '.db', '.sqlite', '.sqlite3')):
+                filename += '.db' if selected_filter.startswith("SQLite") else '.json'
+            self.save_menu_to(filename)
+            base_name = os.path.basename(filename)
+            self.setWindowTitle(f"高级点菜管理系统 - {base_name}")
 
 
     def auto_backup(self):
         if not self.menu_manager.current_file:
             return
         
-        # 计算当前菜单的哈希值
-        current_hash = hash(json.dumps(
-            [vars(dish) for dish in self.menu_manager.dishes],
-            sort_keys=True
-        ))
-        
-        # 只有菜单发生变化时才备份
-        if current_hash != self.last_backup_hash:
-            backup_dir = os.path.join(os.path.dirname(self.menu_manager.current_file), "backups")
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = os.path.join(backup_dir, f"menu_backup_{timestamp}.json")
-            
-            self.menu_manager.save_to_file(backup_name)
-            self.last_backup_hash = current_hash
-            self.statusBar().showMessage(f"自动备份完成: {os.path.basename(backup_name)}", 2000)
+        # 菜单修改代数和已保存的订单数都没变时跳过；当前未保存的订单不在备份中，不参与比较
+        # 相同内容的快照只保存一份，过期备份按 backups/policy.json 清理
+        backup_key = (id(self.menu_manager),) + self.menu_manager.backup_key()
+        if backup_key != self.last_backup_key:
+            menu_manager = self.menu_manager
+            self.saver.request("backup", menu_manager.begin_backup)
+            self.last_backup_key = backup_key
 
     def manual_backup(self):
-        self.auto_backup()
-        QMessageBox.information(self, "备份成功", "菜单已备份")
+        if not self.menu_manager.current_file:
+            QMessageBox.warning(self, "警告", "请先打开菜单文件")
+            return
+        # 手动备份总是提交，由备份任务判断内容是否与上次相同，并按实际结果提示
+        result = {}
+        def on_done(job, error):
+            result["job"], result["error"] = job, error
+        menu_manager = self.menu_manager
+        self.last_backup_key = (id(menu_manager),) + menu_manager.backup_key()
+        self.saver.request("backup", menu_manager.begin_backup, on_done)
+        self.saver.wait()
+        if "job" not in result:
+            QMessageBox.critical(self, "备份失败", "无法生成备份快照")
+        elif result["error"] is not None:
+            QMessageBox.critical(self, "备份失败", f"备份菜单失败:\n{result['error']}")
+        elif result["job"].entry is None:
+            QMessageBox.information(self, "备份", "内容与上次备份相同，未新增备份")
+        else:
+            QMessageBox.information(self, "备份成功", f"菜单已备份到: {result['job'].filename}")
+
+    def load_file_formats(self):
+        formats = dict(DEFAULT_FILE_FORMATS)
+        try:
+            with open('file_formats.json', 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            formats.update({kind: value for kind, value in saved.items()
+                            if kind in formats and value in FILE_FORMATS})
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            pass
+        return formats
+
+    def load_settings(self):
+        """读取 settings.json 中的界面设置，缺少或无效的项使用 DEFAULT_SETTINGS"""
+        settings = dict(DEFAULT_SETTINGS)
+        try:
+            with open('settings.json', 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            settings.update({key: value for key, value in saved.items()
+                             if key in settings and isinstance(value, int) and value >= 0})
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            pass
+        return settings
+
+    def set_file_format(self, kind, file_format):
+        """设置菜单/订单文件的保存格式，下次保存时生效；读取时自动识别格式"""
+        self.file_formats[kind] = file_format
+        try:
+            write_json_atomic('file_formats.json', self.file_formats)
+        except OSError as e:
+            print(f"保存配置失败: {e}")
+        self.statusBar().showMessage(f"保存格式已设置为: {FILE_FORMATS[file_format]}", 2000)
+
+    def restore_backup(self):
+        """选择一个备份时间点，从检查点和增量备份重建当时的菜单和订单历史"""
+        if not self.menu_manager.current_file:
+            QMessageBox.warning(self, "警告", "请先打开菜单文件")
+            return
+        self.saver.wait()
+        backup_manager = BackupManager(backup_dir_for(self.menu_manager.current_file))
+        entries = backup_manager.list_backups()
+        if not entries:
+            QMessageBox.information(self, "恢复备份", "没有可用的备份")
+            return
+
+        labels = [f"{entry['timestamp']}（{'增量' if entry.get('kind') == 'delta' else '完整'}）"
+                  for entry in reversed(entries)]
+        label, ok = QInputDialog.getItem(self, "恢复备份", "选择要恢复到的时间点:", labels, 0, False)
+        if not ok:
+            return
+        entry = entries[len(entries) - 1 - labels.index(label)]
+
+        reply = QMessageBox.question(self, "恢复备份",
+                                     f"将把菜单和订单历史恢复到 {entry['timestamp']}，当前未保存的修改会丢失，是否继续?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            data = backup_manager.restore(entry, entries)
+            new_manager = MenuManager()
+            new_manager.restore_backup(data, self.menu_manager.current_file)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, "错误", f"恢复备份失败: {str(e)}")
+            return
+
+        self.menu_manager = new_manager
+        self.order_manager = OrderManager(self.menu_manager)
+        self.refresh_all_views()
+        self.statusBar().showMessage(f"已恢复到 {entry['timestamp']} 的备份，保存后生效", 5000)
 
     def load_last_config(self):
         try:
@@ -2230,9 +2436,9 @@ class MainWindow(QMainWindow):
         # 保存当前菜单文件路径
         if self.menu_manager.current_file:
             try:
-                with open('last_config.txt', 'w', encoding='utf-8') as f:
+                with atomic_write('last_config.txt') as f:
                     f.write(self.menu_manager.current_file)
-            except IOError as e:
+            except OSError as e:
                 print(f"保存配置失败: {e}")
         
         # 只在菜单被修改过时才询问是否保存
@@ -2247,6 +2453,12 @@ class MainWindow(QMainWindow):
                 event.ignore()
                 return
         
+        # 等待后台保存和备份写完再退出，未完成的导出直接取消
+        if self.export_job is not None:
+            self.export_job.cancel()
+        self.export_pool.waitForDone()
+        self.saver.wait()
+        self.menu_manager.save_stats()
         event.accept()
 
 
@@ -0,0 +1,82 @@
+"""
+订单分析性能测试：生成指定菜品项数量的模拟订单历史，比较
+逐条遍历订单统计顾客消费（CustomerHabits.add_order，即重建订单统计时的做法）与列式分析（NumPy / 纯 Python）的耗时
+
+用法: python benchmark_analytics.py [菜品项数量，默认 1000000]
+"""
+import sys
+import time
+import random
+import datetime
+
+from menu_core import (MenuManager, CustomerHabits, ColumnarHistory, ColumnarAnalytics, np)
+
+
+def make_history(menu_manager, item_count, seed=1):
+    """生成约 item_count 个菜品项的订单历史：每单 1-4 位顾客，每人 1-3 个菜品，每 7 分钟一单"""
+    rng = random.Random(seed)
+    dishes = menu_manager.dishes
+    customers = [f"顾客{i}" for i in range(2000)]
+    start = datetime.datetime(2024, 1, 1, 10, 0, 0)
+    history = []
+    items = 0
+    while items < item_count:
+        orders = {}
+        for name in rng.sample(customers, rng.randint(1, 4)):
+            person_items = []
+            for dish in rng.sample(dishes, rng.randint(1, 3)):
+                person_items.append([dish.id, rng.randint(1, 3), "", dish.price_cents, dish.name])
+            items += len(person_items)
+            orders[name] = {"items": person_items, "payment_method": "AA", "payment_value": 1.0}
+        timestamp = start + datetime.timedelta(minutes=7 * len(history))
+        history.append({"table": str(rng.randint(1, 30)),
+                        "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"), "orders": orders})
+    return history
+
+
+def timed(label, func):
+    begin = time.perf_counter()
+    result = func()
+    print(f"{label:<28}{time.perf_counter() - begin:>10.3f} 秒")
+    return result
+
+
+def main():
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    menu_manager = MenuManager()
+    for i in range(120):
+        menu_manager.add_dish(f"菜品{i}", 8 + i % 60)
+
+    history = timed("生成模拟历史", lambda: make_history(menu_manager, item_count))
+    print(f"订单 {len(history)} 条，菜品项约 {item_count} 个")
+
+    def scan_habits():
+        habits = CustomerHabits()
+        for order_data in history:
+            habits.add_order(order_data, menu_manager)
+        return habits
+
+    habits = timed("逐条遍历统计顾客消费", scan_habits)
+    columns = timed("转换为列式历史", lambda: ColumnarHistory.from_history(history, menu_manager))
+
+    modes = [False] + ([True] if np is not None else [])
+    for use_numpy in modes:
+        name = "NumPy" if use_numpy else "纯 Python"
+        analytics = ColumnarAnalytics(columns, use_numpy=use_numpy)
+        if use_numpy:
+            timed("转换为 NumPy 数组", analytics._np)
+        begin = time.perf_counter()
+        spend = analytics.customer_spend()
+        spend_time = time.perf_counter() - begin
+        print(f"{'列式顾客消费 (' + name + ')':<28}{spend_time:>10.3f} 秒")
+        timed(f"列式热销菜品 ({name})", lambda: analytics.top_dishes(10))
+        timed(f"列式按月营业额 ({name})", lambda: analytics.revenue_by_period("month"))
+        # 结果应与逐条遍历一致
+        expected = {name: (habit["count"], habit["total_spent_cents"]) for name, habit in habits.customers.items()}
+        print(f"{'':<28}结果一致: {spend == expected}")
+    if np is None:
+        print("未安装 NumPy，只测试了纯 Python 实现")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+点菜管理系统命令行工具，不需要 PyQt5 和图形界面，可用于定时任务（如夜间批处理）
+
+用法: python -m menu_cli <命令> [参数]，python -m menu_cli -h 查看全部命令
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import datetime
+
+from menu_core import (__version__, MenuManager, BackupManager, FILE_FORMATS, ROLLUP_GRANULARITIES,
+                       TIME_SLOTS, ColumnarAnalytics, backup_dir_for, check_order_version, format_money,
+                       openpyxl, read_json_file, rollup_key)
+
+
+class CommandError(Exception):
+    """命令执行失败，消息直接显示给用户"""
+
+
+def load_menu(filename, lazy_history=True):
+    menu_manager = MenuManager()
+    if not menu_manager.load_from_file(filename, lazy_history):
+        raise CommandError(f"无法加载菜单文件: {filename}")
+    return menu_manager
+
+
+def cmd_export_menu(args):
+    """把菜单（默认连同订单历史）导出为单个 JSON 文件"""
+    menu_manager = load_menu(args.menu, lazy_history=args.menu_only)
+    menu_manager.begin_copy(args.output, args.format, with_history=not args.menu_only).run()
+    print(f"已导出菜单 {len(menu_manager.dishes)} 个菜品到 {args.output}")
+
+
+def cmd_import_menu(args):
+    """从其他菜单文件导入菜品：名称不存在的新增，--update 时更新同名菜品的价格和分类"""
+    source = read_json_file(args.source)
+    if not isinstance(source, dict) or not isinstance(source.get("dishes"), list):
+        raise CommandError(f"无效的菜单文件: {args.source}")
+    menu_manager = load_menu(args.menu)
+    added = updated = 0
+    for dish_data in source["dishes"]:
+        try:
+            name, price = dish_data["name"], float(dish_data["price"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        category = dish_data.get("category", "未分类")
+        dish = menu_manager.get_dish_by_name(name)
+        if dish is None:
+            menu_manager.add_dish(name, price, category, dish_data.get("description", ""),
+                                  dish_data.get("dialect_name", ""), dish_data.get("is_spicy", 0))
+            added += 1
+        elif args.update and (dish.price != price or dish.category != category):
+            menu_manager.update_dish(dish.id, price=price, category=category)
+            updated += 1
+    if added or updated:
+        menu_manager.save_to_file(args.menu)
+    print(f"新增 {added} 个菜品，更新 {updated} 个菜品")
+
+
+def cmd_merge_orders(args):
+    """把 .order 订单文件追加到订单历史；时间和桌号与已有订单相同的视为重复，默认跳过"""
+    menu_manager = load_menu(args.menu)
+    existing = set()
+    if not args.allow_duplicates:
+        existing = {(order_data.get("timestamp"), order_data.get("table"))
+                    for order_data in menu_manager.order_history}
+    merged = skipped = 0
+    for filename in args.orders:
+        try:
+            order_data = read_json_file(filename)
+        except (OSError, ValueError) as e:
+            print(f"读取订单文件失败: {filename}: {e}", file=sys.stderr)
+            skipped += 1
+            continue
+        if (not isinstance(order_data, dict) or not isinstance(order_data.get("orders"), dict)
+                or not order_data.get("timestamp")):
+            print(f"无效的订单文件: {filename}", file=sys.stderr)
+            skipped += 1
+            continue
+        try:
+            check_order_version(order_data)
+        except ValueError as e:
+            print(f"{filename}: {e}", file=sys.stderr)
+            skipped += 1
+            continue
+        order_data.pop("version", None)
+        key = (order_data["timestamp"], order_data.get("table", ""))
+        if key in existing:
+            skipped += 1
+            continue
+        existing.add(key)
+        menu_manager.append_order(order_data)
+        merged += 1
+    menu_manager.save_stats()
+    print(f"已合并 {merged} 个订单，跳过 {skipped} 个")
+
+
+def cmd_rebuild_stats(args):
+    menu_manager = load_menu(args.menu)
+    stats = menu_manager.rebuild_stats()
+    print(f"已重新统计 {stats.order_count} 个订单")
+
+
+def print_summary(label, summary):
+    print(f"{label}  订单 {summary['orders']}  人次 {summary['covers']}  "
+          f"营业额 {format_money(summary['revenue_cents'])}元  客单价 {format_money(summary['avg_ticket_cents'])}元")
+
+
+def cmd_report(args):
+    """按时间段输出营业汇总和热销菜品，如本月晚餐: report menu.json --period month --slot 晚餐"""
+    menu_manager = load_menu(args.menu)
+    rollups = menu_manager.sales_rollups
+    slot = args.slot or None
+    if args.trend:
+        for key, summary in reversed(rollups.series(args.period, slot, args.trend)):
+            print_summary(key, summary)
+        return
+    key = args.key or rollup_key(args.period, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    print_summary(f"{key} {slot or '全天'}", rollups.summary(args.period, key, slot))
+    for rank, (dish_id, quantity) in enumerate(rollups.top_dishes(args.period, key, slot, args.limit), 1):
+        print(f"{rank:>3}. {menu_manager.dish_name(dish_id)}  {quantity}")
+    if args.customers:
+        print("消费最多的顾客:")
+        habits = menu_manager.customer_habits.customers
+        ranked = sorted(habits.items(), key=lambda x: x[1]["total_spent_cents"], reverse=True)
+        for name, habit in ranked[:args.customers]:
+            print(f"  {name}  {habit['count']}次  {format_money(habit['total_spent_cents'])}元")
+
+
+def cmd_analyze(args):
+    """把订单历史转换为列式数据做全量分析（安装 NumPy 时使用向量化计算），不使用增量统计"""
+    menu_manager = load_menu(args.menu)
+    analytics = ColumnarAnalytics(menu_manager.columnar_history(args.cache))
+    print(f"计算方式: {'NumPy' if analytics.use_numpy else '纯 Python'}")
+    for key, revenue_cents in sorted(analytics.revenue_by_period(args.period).items()):
+        print(f"{key}  营业额 {format_money(revenue_cents)}元")
+    print("热销菜品:")
+    for rank, (dish_id, quantity) in enumerate(analytics.top_dishes(args.limit), 1):
+        print(f"{rank:>3}. {menu_manager.dish_name(dish_id)}  {quantity}")
+
+
+def cmd_export_history(args):
+    """导出订单历史为 CSV 或 XLSX（按扩展名），每个菜品项一行"""
+    if args.output.lower().endswith(".xlsx") and openpyxl is None:
+        raise CommandError("导出 Excel 文件需要安装 openpyxl（pip install openpyxl）")
+    menu_manager = load_menu(args.menu)
+    # --end 为包含当天的日期，换算为下一天零点
+    end = None
+    if args.end:
+        end = (datetime.date.fromisoformat(args.end) + datetime.timedelta(days=1)).isoformat()
+    job = menu_manager.begin_export(args.output, args.start, end, args.table)
+    job.run()
+    print(f"已导出 {job.rows_written} 行订单历史到 {args.output}")
+
+
+def cmd_migrate(args):
+    """把菜单和订单历史转换到另一种存储（按扩展名：.db/.sqlite 为 SQLite，其余为 JSON）"""
+    menu_manager = load_menu(args.source, lazy_history=False)
+    menu_manager.save_to_file(args.dest, args.format)
+    menu_manager.rebuild_stats()
+    print(f"已把 {len(menu_manager.order_history)} 个订单迁移到 {args.dest}")
+
+
+def cmd_compact(args):
+    """整理存储：JSON 菜单按指定格式重写、订单日志重写；SQLite 数据库 VACUUM"""
+    menu_manager = load_menu(args.menu)
+    if args.format:
+        menu_manager.save_to_file(args.menu, args.format)
+    menu_manager.storage.compact()
+    print(f"已整理 {args.menu}")
+
+
+def cmd_backup(args):
+    menu_manager = load_menu(args.menu)
+    job = menu_manager.begin_backup()
+    job.run()
+    if job.entry is None:
+        print("内容与上次备份相同，未新增备份")
+    else:
+        print(f"已备份到 {job.filename}（{job.entry['kind']}）")
+
+
+def cmd_restore(args):
+    """把菜单和订单历史恢复到 --at 之前最近的一次备份；恢复前先备份当前内容，恢复后可以再撤销"""
+    try:
+        when = datetime.datetime.fromisoformat(args.at) if args.at else datetime.datetime.now()
+    except ValueError:
+        raise CommandError(f"无法识别的时间: {args.at}")
+    data = BackupManager(backup_dir_for(args.menu)).restore_at(when)
+    if data is None:
+        raise CommandError(f"{when.strftime(BackupManager.TIME_FORMAT)} 之前没有备份")
+    output = args.output or args.menu
+    if output == args.menu and os.path.exists(args.menu):
+        cmd_backup(args)  # 菜单文件已丢失时直接恢复
+    menu_manager = MenuManager()
+    menu_manager.restore_backup(data, output)
+    menu_manager.save_to_file(output)
+    menu_manager.rebuild_stats()
+    print(f"已恢复 {len(menu_manager.dishes)} 个菜品、{len(menu_manager.order_history)} 个订单到 {output}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m menu_cli", description="点菜管理系统命令行工具")
+    parser.add_argument("--version", action="version", version=__version__)
+    commands = parser.add_subparsers(dest="command", metavar="命令")
+    commands.required = True
+    formats = list(FILE_FORMATS)
+    periods = list(ROLLUP_GRANULARITIES)
+    slots = [name for name, _, _ in TIME_SLOTS]
+
+    p = commands.add_parser("export-menu", help="导出菜单（默认含订单历史）为单个文件")
+    p.add_argument("menu")
+    p.add_argument("output")
+    p.add_argument("--format", choices=formats, default="pretty")
+    p.add_argument("--menu-only", action="store_true", help="不包含订单历史")
+    p.set_defaults(func=cmd_export_menu)
+
+    p = commands.add_parser("import-menu", help="从其他菜单文件导入菜品")
+    p.add_argument("source")
+    p.add_argument("menu")
+    p.add_argument("--update", action="store_true", help="同时更新同名菜品的价格和分类")
+    p.set_defaults(func=cmd_import_menu)
+
+    p = commands.add_parser("merge-orders", help="把 .order 订单文件合并到订单历史")
+    p.add_argument("menu")
+    p.add_argument("orders", nargs="+")
+    p.add_argument("--allow-duplicates", action="store_true", help="不跳过时间和桌号相同的订单")
+    p.set_defaults(func=cmd_merge_orders)
+
+    p = commands.add_parser("rebuild-stats", help="从订单历史重建销量、消费习惯和时间段汇总")
+    p.add_argument("menu")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = commands.add_parser("report", help="营业汇总和热销菜品（使用增量统计）")
+    p.add_argument("menu")
+    p.add_argument("--period", choices=periods, default="month")
+    p.add_argument("--key", help="汇总键，如 2024-05、2024-W19、2024-05-01；默认为当前时间所在的时间段")
+    p.add_argument("--slot", choices=slots, help="营业时段")
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--trend", type=int, metavar="N", help="改为输出最近 N 个时间段的汇总")
+    p.add_argument("--customers", type=int, metavar="N", help="同时输出消费最多的 N 位顾客")
+    p.set_defaults(func=cmd_report)
+
+    p = commands.add_parser("analyze", help="全量分析订单历史（按时间段营业额、热销菜品）")
+    p.add_argument("menu")
+    p.add_argument("--period", choices=periods, default="month")
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--cache", metavar="FILE", help="列式历史缓存文件，下次分析只转换新增的订单")
+    p.set_defaults(func=cmd_analyze)
+
+    p = commands.add_parser("export-history", help="导出订单历史为 CSV/XLSX")
+    p.add_argument("menu")
+    p.add_argument("output")
+    p.add_argument("--start", help="开始日期 YYYY-MM-DD")
+    p.add_argument("--end", help="结束日期 YYYY-MM-DD（包含当天）")
+    p.add_argument("--table", help="桌号")
+    p.set_defaults(func=cmd_export_history)
+
+    p = commands.add_parser("migrate", help="把菜单和订单历史转换到另一种存储（JSON/SQLite）")
+    p.add_argument("source")
+    p.add_argument("dest")
+    p.add_argument("--format", choices=formats, help="JSON 菜单文件的保存格式")
+    p.set_defaults(func=cmd_migrate)
+
+    p = commands.add_parser("compact", help="整理存储文件")
+    p.add_argument("menu")
+    p.add_argument("--format", choices=formats, help="同时把 JSON 菜单文件转换为该格式")
+    p.set_defaults(func=cmd_compact)
+
+    p = commands.add_parser("backup", help="备份菜单和订单历史到备份目录")
+    p.add_argument("menu")
+    p.set_defaults(func=cmd_backup)
+
+    p = commands.add_parser("restore", help="从备份目录恢复菜单和订单历史（恢复前先备份当前内容）")
+    p.add_argument("menu")
+    p.add_argument("--at", help="恢复到该时间之前最近的备份，如 2024-05-01 或 \"2024-05-01 18:00:00\"；默认为最近一次备份")
+    p.add_argument("--output", help="恢复到另一个文件，不修改原菜单文件")
+    p.set_defaults(func=cmd_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except CommandError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"执行失败: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2761 @@
+"""
+点菜管理系统的核心：菜单、订单、订单历史存储、统计分析、备份和导出，不依赖 PyQt5
+图形界面（MenuManager.py）和命令行工具（menu_cli.py）都基于本模块
+"""
+__version__ = "3.4.0"
+
+import os
+import csv
+import json
+import sqlite3
+import datetime
+import tempfile
+import hashlib
+import heapq
+import gzip
+import lzma
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 没有 pypinyin 时只按原始文本搜索
+    lazy_pinyin = None
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，没有时批量分析使用纯 Python 实现
+    np = None
+try:
+    import openpyxl
+except ImportError:  # openpyxl 为可选依赖，只在导出 Excel 文件时需要
+    openpyxl = None
+
+
+def to_cents(amount):
+    """把以元为单位的金额（float/str/Decimal）换算为整数分，四舍五入"""
+    if isinstance(amount, int):
+        return amount * 100
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_money(cents):
+    """整数分格式化为两位小数的元，如 1230 -> '12.30'"""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def split_cents(total_cents, count):
+    """平均分摊金额：余下的分依次多分给前面的人，保证各份之和恰好等于总额"""
+    if count <= 0:
+        return []
+    base, remainder = divmod(total_cents, count)
+    return [base + 1 if i < remainder else base for i in range(count)]
+
+
+class Dish:
+    def __init__(self, id, name, price, category="未分类", description="", dialect_name="", is_spicy=0):
+        self.id = id  # 菜品编号（用于快捷键）
+        self.name = name
+        self.price = price
+        self.category = category
+        self.description = description
+        self.dialect_name = dialect_name  # 方言菜名
+        self.is_spicy = is_spicy  # 辣度 0-不辣 1-微辣 2-中辣 3-重辣
+        self.sales_count = 0  # 文件中保存的销量，实际销量由 SalesStats 按订单历史统计
+        self.remarks = []  # 顾客备注历史
+
+    @property
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, price):
+        self._price = price
+        self._price_cents = to_cents(price)  # 设置价格时换算一次，计算和显示金额都使用整数分
+
+    @property
+    def price_cents(self):
+        return self._price_cents
+
+    def total_cents(self, quantity):
+        return self.price_cents * quantity
+
+    def total_price(self, quantity):
+        return self.total_cents(quantity) / 100
+
+    def add_remark(self, remark):
+        self.remarks.append(remark)
+
+    def get_spicy_text(self):
+        spicy_map = {0: "不辣", 1: "微辣", 2: "中辣", 3: "重辣"}
+        return spicy_map.get(self.is_spicy, "")
+
+
+def build_search_keys(dish):
+    """生成菜品的搜索关键字：中文名、全拼、首字母，以及方言名的同样三项"""
+    keys = []
+    for text in (dish.name, dish.dialect_name):
+        if not text:
+            continue
+        keys.append(text.lower())
+        try:
+            # 支持中文、拼音全拼、拼音首字母搜索
+            syllables = lazy_pinyin(text)
+            keys.append(''.join(syllables).lower())
+            keys.append(''.join(x[0] for x in syllables if x).lower())
+        except Exception:
+            # 如果拼音转换失败，只比较原始文本
+            pass
+    return tuple(keys)
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding='utf-8', newline=None):
+    """
+    原子写入：先写同目录下的临时文件并 fsync，再用 os.replace 替换目标文件
+    中途崩溃或断电时目标文件要么是旧内容，要么是完整的新内容
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding, newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        _copy_file_mode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+
+
+# umask 只能通过设置再恢复来读取，而它是整个进程共享的；在导入时（还没有后台线程）读取一次
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _copy_file_mode(path, tmp_path):
+    """mkstemp 创建的文件权限为 0600，替换前恢复为原文件（或默认）的权限"""
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = 0o666 & ~_UMASK
+    try:
+        os.chmod(tmp_path, mode)
+    except OSError:
+        pass
+
+
+def _fsync_dir(directory):
+    """同步目录项，确保 os.replace 的结果落盘（Windows 不支持，忽略）"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data, indent=2):
+    with atomic_write(path) as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+
+
+# 菜单、订单和备份文件可选的保存格式；读取时根据文件头自动识别，与扩展名无关
+FILE_FORMATS = {
+    "pretty": "格式化JSON",
+    "compact": "紧凑JSON",
+    "gzip": "gzip压缩",
+    "lzma": "lzma压缩",
+}
+DEFAULT_FILE_FORMATS = {"menu": "pretty", "order": "pretty"}
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+def encode_json(data, file_format="pretty"):
+    if file_format == "pretty":
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return compress_bytes(raw, file_format)
+
+
+def compress_bytes(raw, file_format):
+    if file_format in ("pretty", "compact"):
+        return raw
+    if file_format == "gzip":
+        return gzip.compress(raw, mtime=0)
+    if file_format == "lzma":
+        return lzma.compress(raw)
+    raise ValueError(f"未知的文件格式: {file_format}")
+
+
+def decode_json(raw):
+    """解析 JSON 文件内容，gzip/lzma 压缩的内容自动解压"""
+    try:
+        if raw.startswith(GZIP_MAGIC):
+            raw = gzip.decompress(raw)
+        elif raw.startswith(XZ_MAGIC):
+            raw = lzma.decompress(raw)
+    except (OSError, EOFError, lzma.LZMAError) as e:
+        raise ValueError(f"解压失败: {e}") from e
+    return json.loads(raw.decode('utf-8-sig'))
+
+
+def read_json_file(path):
+    with open(path, 'rb') as f:
+        return decode_json(f.read())
+
+
+def write_json_file(path, data, file_format="pretty"):
+    with atomic_write(path, 'wb') as f:
+        f.write(encode_json(data, file_format))
+
+
+def journal_path(menu_file):
+    """菜单文件对应的订单日志路径，如 menu.json -> menu_orders.jsonl"""
+    return os.path.splitext(menu_file)[0] + "_orders.jsonl"
+
+
+def stats_path(menu_file):
+    """菜单文件对应的订单统计文件路径，如 menu.json -> menu_stats.json"""
+    return os.path.splitext(menu_file)[0] + "_stats.json"
+
+
+def _journal_complete_size(f, size):
+    """日志中最后一个换行符之后的位置，之后的内容是写入中断留下的不完整行"""
+    position = size
+    while position > 0:
+        start = max(0, position - 4096)
+        f.seek(start)
+        newline = f.read(position - start).rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        position = start
+    return 0
+
+
+def append_order_journal(path, order_data):
+    """向订单日志追加一条订单（一行JSON）；上次写入中断留下的不完整最后一行先截掉，避免与新订单连在一起"""
+    line = (json.dumps(order_data, ensure_ascii=False) + "\n").encode('utf-8')
+    with open(path, 'a+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                complete = _journal_complete_size(f, size)
+                print(f"订单日志最后一行不完整（写入中断），已截掉 {size - complete} 字节")
+                f.truncate(complete)
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_order_journal(path, orders):
+    with atomic_write(path) as f:
+        for order_data in orders:
+            f.write(json.dumps(order_data, ensure_ascii=False) + "\n")
+
+
+def read_order_journal(path):
+    """
+    一次读取全部订单，结果与 JsonStorage 按页读取一致：
+    损坏的行用空订单占位，没有换行符的最后一行（写入中断）不计入
+    """
+    orders = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if line.strip():
+                orders.append(_parse_journal_line(line.decode('utf-8', 'replace'), len(orders) + 1))
+    return orders
+
+
+def _parse_journal_line(line, order_no):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        # 损坏的记录用空订单占位，保持后续订单的序号不变
+        print(f"订单日志第{order_no}条订单损坏，已跳过: {e}")
+        return {"table": "", "timestamp": "", "orders": {}}
+
+
+class LazyOrderHistory:
+    """
+    按需分页读取的订单历史，用法与 list 相同（len、下标、切片、迭代、append）
+    加载菜单时不读取历史，第一次访问时才从存储后端统计数量，按页读取并缓存最近使用的若干页
+    加载后新增的订单保存在内存中（存储后端由 MenuManager.append_order 另行追加）
+    """
+    PAGE_SIZE = 256
+    MAX_CACHED_PAGES = 64
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._stored = None  # 存储中的订单数，首次访问时读取
+        self._appended = []
+        self._pages = OrderedDict()  # {页号: [订单数据]}，最近使用的在末尾
+
+    def _stored_count(self):
+        if self._stored is None:
+            self._stored = self.storage.count_orders()
+        return self._stored
+
+    def _page(self, page_no):
+        page = self._pages.get(page_no)
+        if page is not None:
+            self._pages.move_to_end(page_no)
+            return page
+        start = page_no * self.PAGE_SIZE
+        page = self.storage.read_orders(start, min(start + self.PAGE_SIZE, self._stored_count()))
+        self._pages[page_no] = page
+        if len(self._pages) > self.MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+        return page
+
+    def __len__(self):
+        return self._stored_count() + len(self._appended)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("订单历史下标越界")
+        stored = self._stored_count()
+        if index >= stored:
+            return self._appended[index - stored]
+        return self._page(index // self.PAGE_SIZE)[index % self.PAGE_SIZE]
+
+    def __iter__(self):
+        stored = self._stored_count()
+        for page_no in range((stored + self.PAGE_SIZE - 1) // self.PAGE_SIZE):
+            yield from self._page(page_no)
+        yield from list(self._appended)
+
+    def append(self, order_data):
+        self._stored_count()  # 先确定存储中的数量，之后追加到存储的订单不会重复计算
+        self._appended.append(order_data)
+
+    def refresh(self):
+        """
+        重新读取存储中的订单数，包括其他终端向共享存储追加的订单
+        只能在加载后新增的订单都已写入存储时调用，之后下标与存储的历史序号一致
+        返回 (刷新前存储中的订单数, 加载后新增的订单)：这些订单在存储中位于前者之后，可能与其他终端的订单交错
+        """
+        start = self._stored_count()
+        appended, self._appended = self._appended, []
+        self._stored = self.storage.count_orders()
+        # 最后一页可能不满，订单数变化后重新读取
+        for page_no in [page_no for page_no, page in self._pages.items() if len(page) < self.PAGE_SIZE]:
+            del self._pages[page_no]
+        return start, appended
+
+    def snapshot(self):
+        """
+        当前历史的快照，供后台线程读取：只复制存储中的订单数和加载后新增的订单，
+        由快照使用新的存储对象自己分页读取，不在调用线程读取存储，也不与原历史共用页缓存
+        """
+        history = LazyOrderHistory(storage_for(self.storage.path))
+        history._stored = self._stored
+        history._appended = list(self._appended)
+        return history
+
+
+def unpack_order_item(item):
+    """
+    历史订单中的菜品项：新格式为 [菜品ID, 数量, 备注, 单价(分), 菜品名]，旧格式只有前三项
+    返回 (菜品ID, 数量, 备注, 单价, 菜品名)，旧格式的单价和菜品名为 None
+    """
+    if len(item) >= 5:
+        return item[0], item[1], item[2], item[3], item[4]
+    return item[0], item[1], item[2], None, None
+
+
+# .order 文件格式版本：2.3.0 起菜品项为 [菜品ID, 数量, 备注, 单价(分), 菜品名] 并记录金额快照，
+# 2.2.0 及以前只有前三项（这些旧版本程序会跳过不是三项的菜品项，所以升级了版本号）
+ORDER_FILE_VERSION = "2.3.0"
+
+
+def check_order_version(order_data):
+    """
+    检查 .order 文件的版本；主版本号比本程序新时格式可能不兼容，抛出 ValueError
+    订单历史中的订单没有版本号，视为当前格式；新旧两种菜品项格式都能读取
+    """
+    version = order_data.get("version")
+    if version is None:
+        return
+    try:
+        major = int(str(version).split(".")[0])
+    except ValueError:
+        raise ValueError(f"无法识别的订单文件版本: {version}")
+    if major > int(ORDER_FILE_VERSION.split(".")[0]):
+        raise ValueError(f"订单文件版本 {version} 高于本程序支持的 {ORDER_FILE_VERSION}，请升级程序后再打开")
+
+
+def order_matches(order_data, start=None, end=None, table=None):
+    """按时间范围 [start, end) 和桌号筛选订单；时间为 "%Y-%m-%d %H:%M:%S" 格式字符串"""
+    timestamp = order_data.get("timestamp", "")
+    if start and timestamp < start:
+        return False
+    if end and timestamp >= end:
+        return False
+    if table is not None and order_data.get("table") != table:
+        return False
+    return True
+
+
+# 营业时段：(名称, 开始小时, 结束小时)，结束小时小于开始小时表示跨过零点
+TIME_SLOTS = [("早餐", 5, 10), ("午餐", 10, 14), ("下午茶", 14, 17), ("晚餐", 17, 21), ("夜宵", 21, 5)]
+
+
+def time_slot(timestamp):
+    """按订单时间（"%Y-%m-%d %H:%M:%S"）返回所属营业时段名，无法解析时返回空字符串"""
+    try:
+        hour = int(timestamp[11:13])
+    except (TypeError, ValueError):
+        return ""
+    for name, start, end in TIME_SLOTS:
+        if start <= hour < end or (start > end and (hour >= start or hour < end)):
+            return name
+    return ""
+
+
+def update_top(top, counts, key, limit):
+    """
+    counts[key] 增加后更新按计数从高到低排列、最多 limit 项的 top 列表
+    计数只增不减，只有被更新的 key 可能进入或前移，复杂度 O(limit)
+    """
+    try:
+        index = top.index(key)
+    except ValueError:
+        if len(top) < limit:
+            top.append(key)
+        elif counts[key] > counts[top[-1]]:
+            top[-1] = key
+        else:
+            return
+        index = len(top) - 1
+    # 向前冒泡到正确位置
+    while index > 0 and counts[top[index - 1]] < counts[key]:
+        top[index] = top[index - 1]
+        index -= 1
+    top[index] = key
+
+
+class SalesStats:
+    """
+    菜品总销量统计：订单保存到历史时按数量增量累计（按时间段的销量见 SalesRollups）
+    维护销量最高的 TOP_K 个菜品，取排行为 O(K)
+    """
+    TOP_K = 50
+
+    def __init__(self):
+        self.quantities = defaultdict(int)  # {dish_id: 总销量}
+        self.names = {}  # {dish_id: 订单中记录的菜品名}，菜品删除后仍可显示
+        self._top = []  # 销量从高到低的 dish_id
+
+    def add_order(self, order_data):
+        for person_data in order_data.get("orders", {}).values():
+            for item in person_data.get("items", []):
+                try:
+                    dish_id, quantity, _, _, name = unpack_order_item(item)
+                    dish_id, quantity = int(dish_id), int(quantity)
+                except (TypeError, ValueError, IndexError):
+                    continue
+                if quantity <= 0:
+                    continue
+                if name:
+                    self.names[dish_id] = name
+                self.quantities[dish_id] += quantity
+                update_top(self._top, self.quantities, dish_id, self.TOP_K)
+
+    def quantity(self, dish_id):
+        return self.quantities.get(dish_id, 0)
+
+    def top(self, limit=10):
+        """返回 [(dish_id, 销量)]，按销量从高到低"""
+        if limit <= self.TOP_K:
+            return [(dish_id, self.quantities[dish_id]) for dish_id in self._top[:limit]]
+        return sorted(self.quantities.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+    def to_dict(self):
+        # JSON 的键只能是字符串，dish_id 在 from_dict 中转换回整数
+        return {
+            "quantities": {str(k): v for k, v in self.quantities.items()},
+            "names": {str(k): v for k, v in self.names.items()},
+            "top": list(self._top)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.quantities.update((int(k), v) for k, v in data["quantities"].items())
+        stats.names = {int(k): v for k, v in data["names"].items()}
+        stats._top = [int(k) for k in data["top"]]
+        return stats
+
+
+class CustomerHabits:
+    """顾客消费习惯：每位顾客的消费次数、消费金额和各菜品数量，维护每人最常点的 TOP_N 个菜品"""
+    TOP_N = 5
+
+    def __init__(self):
+        self.customers = {}  # {顾客名: {"count", "total_spent_cents", "dishes": {菜品名: 数量}, "top": [菜品名]}}
+
+    def add_order(self, order_data, menu_manager):
+        for name, person_data in order_data.get("orders", {}).items():
+            habit = self.customers.get(name)
+            if habit is None:
+                habit = self.customers[name] = {"count": 0, "total_spent_cents": 0, "dishes": {}, "top": []}
+            habit["count"] += 1
+            # 优先使用保存时记录的金额和菜品名
+            habit["total_spent_cents"] += menu_manager.person_total_cents(person_data)
+            dishes = habit["dishes"]
+            for item in person_data.get("items", []):
+                resolved = menu_manager.resolve_order_item(item)
+                if resolved:
+                    dishes[resolved[0]] = dishes.get(resolved[0], 0) + resolved[2]
+                    update_top(habit["top"], dishes, resolved[0], self.TOP_N)
+
+    def top_dishes(self, name, limit=3):
+        """返回 [(菜品名, 数量)]"""
+        habit = self.customers[name]
+        return [(dish_name, habit["dishes"][dish_name]) for dish_name in habit["top"][:limit]]
+
+    def to_dict(self):
+        return {name: {"count": habit["count"], "total_spent_cents": habit["total_spent_cents"],
+                       "dishes": dict(habit["dishes"]), "top": list(habit["top"])}
+                for name, habit in self.customers.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        habits = cls()
+        habits.customers = data
+        return habits
+
+
+# 汇总粒度：{名称: (显示名称, 由订单时间计算汇总键的函数)}，汇总键按字符串排序即按时间排序
+def _week_key(timestamp):
+    year, week, _ = datetime.date(int(timestamp[:4]), int(timestamp[5:7]), int(timestamp[8:10])).isocalendar()
+    return f"{year:04d}-W{week:02d}"
+
+
+ROLLUP_GRANULARITIES = {
+    "hour": ("按小时", lambda timestamp: timestamp[:13]),
+    "day": ("按天", lambda timestamp: timestamp[:10]),
+    "week": ("按周", _week_key),
+    "month": ("按月", lambda timestamp: timestamp[:7]),
+}
+
+
+def rollup_key(granularity, timestamp):
+    """订单时间（"%Y-%m-%d %H:%M:%S"）所在的汇总键，如 month -> "2024-05"，week -> "2024-W19" """
+    return ROLLUP_GRANULARITIES[granularity][1](timestamp)
+
+
+def _new_bucket():
+    return {"orders": 0, "covers": 0, "revenue_cents": 0, "dishes": {}}
+
+
+def _add_to_bucket(bucket, revenue_cents, covers, quantities):
+    bucket["orders"] += 1
+    bucket["covers"] += covers
+    bucket["revenue_cents"] += revenue_cents
+    dishes = bucket["dishes"]
+    for dish_id, quantity in quantities.items():
+        dishes[dish_id] = dishes.get(dish_id, 0) + quantity
+
+
+def bucket_summary(bucket):
+    """汇总桶的订单数、人次、营业额和客单价（分，按订单平均）"""
+    orders = bucket["orders"]
+    return {
+        "orders": orders,
+        "covers": bucket["covers"],
+        "revenue_cents": bucket["revenue_cents"],
+        "avg_ticket_cents": bucket["revenue_cents"] // orders if orders else 0
+    }
+
+
+class SalesRollups:
+    """
+    按小时/天/周/月预先汇总的营业额、人次、订单数和各菜品销量，订单保存到历史时增量更新
+    天/周/月的汇总桶内再按营业时段（TIME_SLOTS）分别汇总，"本月晚餐热销菜品"只需读取一个桶
+    小时汇总不分时段，按小时所属的时段筛选
+    """
+
+    def __init__(self):
+        self.buckets = {granularity: {} for granularity in ROLLUP_GRANULARITIES}  # {粒度: {汇总键: 汇总桶}}
+
+    def add_order(self, order_data, menu_manager):
+        timestamp = order_data.get("timestamp", "")
+        try:
+            keys = {granularity: rollup_key(granularity, timestamp) for granularity in ROLLUP_GRANULARITIES}
+        except (ValueError, IndexError):
+            return  # 损坏或没有时间的订单不计入
+        quantities = defaultdict(int)
+        for person_data in order_data.get("orders", {}).values():
+            for item in person_data.get("items", []):
+                try:
+                    quantities[int(item[0])] += int(item[1])
+                except (TypeError, ValueError, IndexError):
+                    continue
+        revenue_cents = menu_manager.order_total_cents(order_data)
+        covers = len(order_data.get("orders", {}))
+        slot = time_slot(timestamp)
+        for granularity, key in keys.items():
+            bucket = self.buckets[granularity].get(key)
+            if bucket is None:
+                bucket = self.buckets[granularity][key] = _new_bucket()
+                if granularity != "hour":
+                    bucket["slots"] = {}
+            _add_to_bucket(bucket, revenue_cents, covers, quantities)
+            if granularity != "hour":
+                slot_bucket = bucket["slots"].get(slot)
+                if slot_bucket is None:
+                    slot_bucket = bucket["slots"][slot] = _new_bucket()
+                _add_to_bucket(slot_bucket, revenue_cents, covers, quantities)
+
+    def bucket(self, granularity, key, slot=None):
+        """返回汇总桶，没有订单时返回 None；slot 为营业时段名，None 表示全天"""
+        bucket = self.buckets[granularity].get(key)
+        if bucket is None or not slot:
+            return bucket
+        if granularity == "hour":
+            return bucket if time_slot(key + ":00:00") == slot else None
+        return bucket["slots"].get(slot)
+
+    def summary(self, granularity, key, slot=None):
+        bucket = self.bucket(granularity, key, slot)
+        return bucket_summary(bucket or _new_bucket())
+
+    def series(self, granularity, slot=None, limit=30):
+        """最近 limit 个有订单的汇总键及其汇总 [(汇总键, 汇总)]，按时间从新到旧"""
+        result = []
+        for key in sorted(self.buckets[granularity], reverse=True):
+            bucket = self.bucket(granularity, key, slot)
+            if bucket is not None:
+                result.append((key, bucket_summary(bucket)))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def top_dishes(self, granularity, key, slot=None, limit=10):
+        """汇总桶内销量最高的菜品 [(dish_id, 销量)]，如 top_dishes("month", "2024-05", "晚餐")"""
+        bucket = self.bucket(granularity, key, slot)
+        if bucket is None:
+            return []
+        return heapq.nlargest(limit, bucket["dishes"].items(), key=lambda x: x[1])
+
+    @staticmethod
+    def _bucket_to_dict(bucket):
+        data = dict(bucket, dishes={str(k): v for k, v in bucket["dishes"].items()})
+        if "slots" in bucket:
+            data["slots"] = {slot: SalesRollups._bucket_to_dict(b) for slot, b in bucket["slots"].items()}
+        return data
+
+    @staticmethod
+    def _bucket_from_dict(data):
+        bucket = dict(data, dishes={int(k): v for k, v in data["dishes"].items()})
+        if "slots" in data:
+            bucket["slots"] = {slot: SalesRollups._bucket_from_dict(b) for slot, b in data["slots"].items()}
+        return bucket
+
+    def to_dict(self):
+        return {granularity: {key: self._bucket_to_dict(bucket) for key, bucket in buckets.items()}
+                for granularity, buckets in self.buckets.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        rollups = cls()
+        for granularity in ROLLUP_GRANULARITIES:
+            rollups.buckets[granularity] = {key: cls._bucket_from_dict(bucket)
+                                            for key, bucket in data[granularity].items()}
+        return rollups
+
+
+class OrderStats:
+    """
+    订单历史的增量统计（销量、顾客消费习惯、按时间汇总），订单保存到历史时更新
+    与订单历史保存在同一存储中；加载时用已统计的订单数和最后一条订单的时间校验，
+    之后新增的订单用 catch_up 补上，不一致时从历史完整重建
+    """
+    VERSION = 2
+
+    def __init__(self, menu_manager):
+        self.menu_manager = menu_manager  # 用于解析旧格式订单的菜品名和金额
+        self.order_count = 0  # 已统计的历史订单数（order_history 的前 order_count 条）
+        self.last_timestamp = ""  # 最后一条已统计订单的时间
+        self.sales = SalesStats()
+        self.habits = CustomerHabits()
+        self.rollups = SalesRollups()
+
+    def add_order(self, order_data):
+        self.sales.add_order(order_data)
+        self.habits.add_order(order_data, self.menu_manager)
+        self.rollups.add_order(order_data, self.menu_manager)
+        self.order_count += 1
+        self.last_timestamp = order_data.get("timestamp", "")
+
+    def catch_up(self, history):
+        """统计 history 中还未统计的订单（下标从 order_count 开始）"""
+        for seq in range(self.order_count, len(history)):
+            self.add_order(history[seq])
+
+    def matches(self, history):
+        """已统计的订单是否仍是 history 的开头部分"""
+        if self.order_count > len(history):
+            return False
+        return self.order_count == 0 or history[self.order_count - 1].get("timestamp", "") == self.last_timestamp
+
+    def to_dict(self):
+        return {
+            "version": self.VERSION,
+            "order_count": self.order_count,
+            "last_timestamp": self.last_timestamp,
+            "sales": self.sales.to_dict(),
+            "habits": self.habits.to_dict(),
+            "rollups": self.rollups.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data, menu_manager):
+        """data 版本不符时返回 None（需要重建）"""
+        if data.get("version") != cls.VERSION:
+            return None
+        stats = cls(menu_manager)
+        stats.order_count = data["order_count"]
+        stats.last_timestamp = data["last_timestamp"]
+        stats.sales = SalesStats.from_dict(data["sales"])
+        stats.habits = CustomerHabits.from_dict(data["habits"])
+        stats.rollups = SalesRollups.from_dict(data["rollups"])
+        return stats
+
+
+class ColumnarHistory:
+    """
+    列式订单历史，便于批量分析：订单列（时间、桌号）和菜品项列（所属订单、顾客、菜品、数量、单价）
+    顾客名编码为整数（customers 为编号到顾客名的对照表），单价已按快照或当前菜单解析为分
+    """
+    COLUMNS = ("timestamps", "tables", "item_order", "item_customer", "item_dish", "item_quantity", "item_price")
+
+    def __init__(self):
+        self.timestamps = []  # 每个订单一项
+        self.tables = []
+        self.item_order = []  # 每个菜品项一项，值为所属订单在 timestamps 中的下标
+        self.item_customer = []
+        self.item_dish = []
+        self.item_quantity = []
+        self.item_price = []
+        self.customers = []
+        self._customer_codes = {}
+
+    def __len__(self):
+        return len(self.item_order)
+
+    @classmethod
+    def from_history(cls, history, menu_manager):
+        columns = cls()
+        for order_data in history:
+            columns.add_order(order_data, menu_manager)
+        return columns
+
+    def add_order(self, order_data, menu_manager):
+        order_index = len(self.timestamps)
+        self.timestamps.append(order_data.get("timestamp", ""))
+        self.tables.append(str(order_data.get("table", "")))
+        for name, person_data in order_data.get("orders", {}).items():
+            code = self._customer_codes.get(name)
+            if code is None:
+                code = self._customer_codes[name] = len(self.customers)
+                self.customers.append(name)
+            for item in person_data.get("items", []):
+                resolved = menu_manager.resolve_order_item(item)
+                if not resolved:
+                    continue  # 与消费习惯统计一致，已删除且没有快照的菜品不计入
+                self.item_order.append(order_index)
+                self.item_customer.append(code)
+                self.item_dish.append(int(item[0]))
+                self.item_quantity.append(int(resolved[2]))
+                self.item_price.append(int(resolved[1]))
+
+    def to_dict(self):
+        data = {column: getattr(self, column) for column in self.COLUMNS}
+        data["customers"] = self.customers
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        columns = cls()
+        for column in cls.COLUMNS:
+            setattr(columns, column, list(data[column]))
+        columns.customers = list(data["customers"])
+        columns._customer_codes = {name: code for code, name in enumerate(columns.customers)}
+        return columns
+
+    def save(self, path, file_format="gzip"):
+        write_json_file(path, self.to_dict(), file_format)
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_dict(read_json_file(path))
+
+
+def normalize_order_time(timestamp):
+    """把订单时间规范为 "%Y-%m-%d %H:%M:%S"，无法解析时返回 None"""
+    try:
+        value = datetime.datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if len(timestamp) == 19 and timestamp[10] == " " and value.tzinfo is None:
+        return timestamp  # 已是标准格式（绝大多数订单），不再重新格式化
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ColumnarAnalytics:
+    """
+    基于 ColumnarHistory 的批量分析：热销菜品、按时间段的营业额、每位顾客的消费
+    安装了 NumPy 时用向量化的分组求和，否则使用纯 Python 实现，两者结果相同
+    按时间汇总时两种实现都不计入时间无法解析的订单
+    """
+
+    def __init__(self, columns, use_numpy=None):
+        self.columns = columns
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise ValueError("未安装 NumPy")
+        self._arrays = None
+        self._times = None
+
+    def _order_times(self):
+        """每个订单规范化后的时间，无法解析的为 None"""
+        if self._times is None:
+            self._times = [normalize_order_time(timestamp) for timestamp in self.columns.timestamps]
+        return self._times
+
+    def _np(self):
+        if self._arrays is None:
+            c = self.columns
+            quantity = np.asarray(c.item_quantity, dtype=np.int64)
+            self._arrays = {
+                "timestamps": np.array(self._order_times(), dtype='datetime64[s]'),  # None 转换为 NaT
+                "order": np.asarray(c.item_order, dtype=np.int64),
+                "customer": np.asarray(c.item_customer, dtype=np.int64),
+                "dish": np.asarray(c.item_dish, dtype=np.int64),
+                "quantity": quantity,
+                "amount": quantity * np.asarray(c.item_price, dtype=np.int64),
+            }
+        return self._arrays
+
+    def top_dishes(self, limit=10):
+        """返回 [(dish_id, 销量)]，按销量从高到低"""
+        if self.use_numpy:
+            a = self._np()
+            if not len(a["dish"]):
+                return []
+            totals = np.bincount(a["dish"], weights=a["quantity"])
+            order = np.argsort(-totals, kind='stable')[:limit]
+            return [(int(dish_id), int(totals[dish_id])) for dish_id in order if totals[dish_id] > 0]
+        totals = defaultdict(int)
+        for dish_id, quantity in zip(self.columns.item_dish, self.columns.item_quantity):
+            totals[dish_id] += quantity
+        # 销量相同时按菜品编号排列，与 NumPy 的结果一致
+        return sorted(totals.items(), key=lambda x: (-x[1], x[0]))[:limit]
+
+    def customer_spend(self):
+        """返回 {顾客名: (消费次数, 消费金额分)}"""
+        c = self.columns
+        if self.use_numpy:
+            a = self._np()
+            count = len(c.customers)
+            spent = np.bincount(a["customer"], weights=a["amount"], minlength=count)
+            # 同一订单中同一位顾客的菜品项是连续的，只在 (订单, 顾客) 变化处计一次消费
+            first = np.ones(len(a["order"]), dtype=bool)
+            first[1:] = (a["order"][1:] != a["order"][:-1]) | (a["customer"][1:] != a["customer"][:-1])
+            visits = np.bincount(a["customer"][first], minlength=count)
+            return {name: (int(visits[code]), int(round(spent[code])))
+                    for code, name in enumerate(c.customers) if visits[code]}
+        spent = defaultdict(int)
+        visits = defaultdict(int)
+        previous = None
+        for order_index, code, quantity, price in zip(c.item_order, c.item_customer,
+                                                      c.item_quantity, c.item_price):
+            spent[code] += quantity * price
+            if (order_index, code) != previous:
+                visits[code] += 1
+                previous = (order_index, code)
+        return {c.customers[code]: (visits[code], spent[code]) for code in visits}
+
+    def revenue_by_period(self, granularity="day"):
+        """按 ROLLUP_GRANULARITIES 中的粒度汇总营业额，返回 {汇总键: 营业额分}，键与 SalesRollups 相同"""
+        c = self.columns
+        if self.use_numpy:
+            a = self._np()
+            revenue = np.bincount(a["order"], weights=a["amount"], minlength=len(c.timestamps))
+            timestamps = a["timestamps"]
+            # 与纯 Python 实现相同，只计入时间有效且有菜品项的订单
+            valid = ~np.isnat(timestamps) & (np.bincount(a["order"], minlength=len(c.timestamps)) > 0)
+            timestamps, revenue = timestamps[valid], revenue[valid]
+            if granularity == "week":
+                # 按周一所在日期分组（1970-01-01 为周四），组数很少，再逐组换算为 ISO 周
+                days = timestamps.astype('datetime64[D]').astype(np.int64)
+                periods = ((days + 3) // 7 * 7 - 3).astype('datetime64[D]')
+            else:
+                periods = timestamps.astype({"hour": 'datetime64[h]', "day": 'datetime64[D]',
+                                             "month": 'datetime64[M]'}[granularity])
+            keys, inverse = np.unique(periods, return_inverse=True)
+            totals = np.bincount(inverse.ravel(), weights=revenue, minlength=len(keys))
+            if granularity == "week":
+                labels = [rollup_key("week", str(key)) for key in keys]
+            else:
+                labels = [str(key).replace("T", " ") for key in keys]
+            return {label: int(round(total)) for label, total in zip(labels, totals)}
+        order_revenue = defaultdict(int)
+        for order_index, quantity, price in zip(c.item_order, c.item_quantity, c.item_price):
+            order_revenue[order_index] += quantity * price
+        times = self._order_times()
+        totals = defaultdict(int)
+        for order_index, amount in order_revenue.items():
+            timestamp = times[order_index]
+            if timestamp is not None:
+                totals[rollup_key(granularity, timestamp)] += amount
+        return dict(totals)
+
+
+EXPORT_HEADERS = ["订单序号", "时间", "桌号", "顾客", "菜品编号", "菜品", "数量", "单价", "小计", "支付方式"]
+XLSX_MAX_ROWS = 1048576  # Excel 每个工作表的最大行数（含表头）
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
+
+class HistoryExport:
+    """
+    订单历史导出任务：每个菜品项一行，逐条读取订单、逐行写入 CSV 或 XLSX（按扩展名），不在内存中生成完整数据
+    在界面线程中由 MenuManager.begin_export 生成，run() 可在后台线程执行
+    progress(已处理订单数, 订单总数) 定期回调；cancel() 之后 run() 抛出 ExportCancelled，目标文件保持不变
+    """
+    PROGRESS_EVERY = 1000  # 每处理多少条订单回调一次进度并检查是否取消
+
+    def __init__(self, filename, history, dish_snapshot, start=None, end=None, table=None, progress=None):
+        self.filename = filename
+        self.history = history
+        self.dish_snapshot = dish_snapshot  # {dish_id: (菜品名, 单价分)}，用于没有快照的旧格式订单
+        self.filter = (start, end, table)
+        self.progress = progress
+        self.rows_written = 0
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def rows(self):
+        """逐行产生导出数据，金额为分"""
+        total = len(self.history)
+        for seq, order_data in enumerate(self.history):
+            if seq % self.PROGRESS_EVERY == 0:
+                if self._cancelled:
+                    raise ExportCancelled()
+                if self.progress:
+                    self.progress(seq, total)
+            if not order_matches(order_data, *self.filter):
+                continue
+            timestamp = order_data.get("timestamp", "")
+            table = order_data.get("table", "")
+            for name, person_data in order_data.get("orders", {}).items():
+                payment_method = person_data.get("payment_method", "")
+                for item in person_data.get("items", []):
+                    dish_id, quantity, _, price_cents, dish_name = unpack_order_item(item)
+                    if price_cents is None:
+                        dish_name, price_cents = self.dish_snapshot.get(dish_id, ("", 0))
+                    yield [seq + 1, timestamp, table, name, dish_id, dish_name, quantity,
+                           price_cents, price_cents * quantity, payment_method]
+        if self.progress:
+            self.progress(total, total)
+
+    def run(self):
+        if os.path.splitext(self.filename)[1].lower() == ".xlsx":
+            self._write_xlsx()
+        else:
+            self._write_csv()
+
+    def _write_csv(self):
+        # utf-8-sig 让 Excel 直接打开时正确识别中文
+        with atomic_write(self.filename, encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_HEADERS)
+            for row in self.rows():
+                row[7], row[8] = format_money(row[7]), format_money(row[8])
+                writer.writerow(row)
+                self.rows_written += 1
+
+    def _write_xlsx(self):
+        if openpyxl is None:
+            raise RuntimeError("导出 Excel 文件需要安装 openpyxl")
+        # 只写模式逐行写入临时文件，内存占用与行数无关；超过单个工作表的行数时换新的工作表
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = None
+        sheet_rows = XLSX_MAX_ROWS
+        for row in self.rows():
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"订单历史{len(workbook.worksheets) + 1}")
+                sheet.append(EXPORT_HEADERS)
+                sheet_rows = 1
+            row[7], row[8] = row[7] / 100, row[8] / 100
+            sheet.append(row)
+            sheet_rows += 1
+            self.rows_written += 1
+        if sheet is None:
+            workbook.create_sheet("订单历史1").append(EXPORT_HEADERS)
+        with atomic_write(self.filename, 'wb') as f:
+            workbook.save(f)
+
+
+class MenuStorage:
+    """
+    菜单和订单历史的存储后端接口
+    load() 返回 (菜单数据, 订单历史, 历史是否已完整保存在此存储中)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file_format = "pretty"  # 菜单文件的保存格式（FILE_FORMATS），仅 JSON 后端使用
+
+    def load(self, lazy_history=False):
+        """lazy_history 为 True 且历史已保存在此存储中时，返回 LazyOrderHistory 代替列表"""
+        raise NotImplementedError
+
+    def save_menu(self, menu_data):
+        raise NotImplementedError
+
+    def count_orders(self):
+        raise NotImplementedError
+
+    def read_orders(self, start, stop):
+        """按保存顺序返回第 start 到 stop-1 条订单"""
+        raise NotImplementedError
+
+    def write_history(self, orders):
+        """用 orders 替换全部订单历史"""
+        raise NotImplementedError
+
+    def append_order(self, order_data):
+        raise NotImplementedError
+
+    def query_orders(self, start=None, end=None, table=None):
+        """返回 [(历史序号, 订单数据)]，按保存顺序排列"""
+        raise NotImplementedError
+
+    # query_order_seqs 支持的排序键（"table" 桌号、"customers" 顾客数、"total" 总金额）
+    SORT_KEYS = ()
+
+    def query_order_seqs(self, start=None, end=None, table=None, sort=None):
+        """只返回符合条件的历史序号；sort 为 SORT_KEYS 中的排序键时按该列升序（相同时按序号）"""
+        if sort is not None:
+            raise ValueError(f"不支持的排序: {sort}")
+        return [seq for seq, _ in self.query_orders(start, end, table)]
+
+    def load_stats(self):
+        """读取保存的订单统计（OrderStats.to_dict 的结果），没有时返回 None"""
+        raise NotImplementedError
+
+    def save_stats(self, stats_data):
+        raise NotImplementedError
+
+    def compact(self):
+        """整理存储文件，回收删除和追加留下的空间"""
+        raise NotImplementedError
+
+
+class JsonStorage(MenuStorage):
+    """菜单保存为 JSON 文件，订单历史保存在同名的 _orders.jsonl 日志中"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._offsets = []  # 订单日志中每条订单所在行的起始位置
+        self._scanned = 0  # 已扫描到的日志位置
+
+    def load(self, lazy_history=False):
+        data = read_json_file(self.path)
+        # 优先读取订单日志；旧版本文件把历史嵌在 order_history 中，下次保存时迁移
+        journal = journal_path(self.path)
+        if os.path.exists(journal):
+            if lazy_history:
+                return data, LazyOrderHistory(self), True
+            return data, read_order_journal(journal), True
+        history = data.pop("order_history", [])
+        return data, history, not history
+
+    def save_menu(self, menu_data):
+        # 原子替换，不再在每次保存时把旧文件改名为 _backup_ 副本（备份由备份目录统一管理）
+        write_json_file(self.path, menu_data, self.file_format)
+
+    def write_history(self, orders):
+        write_order_journal(journal_path(self.path), orders)
+        self._offsets, self._scanned = [], 0
+
+    def _scan_journal(self):
+        """只扫描行边界（不解析JSON）建立行偏移索引；日志只会追加，从上次扫描的位置继续"""
+        journal = journal_path(self.path)
+        if not os.path.exists(journal):
+            return
+        with open(journal, 'rb') as f:
+            f.seek(self._scanned)
+            position = self._scanned
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 写入中途的最后一行，下次再扫描
+                if line.strip():
+                    self._offsets.append(position)
+                position += len(line)
+            self._scanned = position
+
+    def count_orders(self):
+        self._scan_journal()
+        return len(self._offsets)
+
+    def read_orders(self, start, stop):
+        if stop > len(self._offsets):
+            self._scan_journal()
+        offsets = self._offsets[start:stop]
+        if not offsets:
+            return []
+        orders = []
+        with open(journal_path(self.path), 'rb') as f:
+            for index, offset in enumerate(offsets, start):
+                f.seek(offset)
+                orders.append(_parse_journal_line(f.readline().decode('utf-8', 'replace'), index + 1))
+        return orders
+
+    def append_order(self, order_data):
+        append_order_journal(journal_path(self.path), order_data)
+
+    def _iter_orders(self, batch_size=1024):
+        """按批读取日志中的订单，产生 (历史序号, 订单数据)，序号与 read_orders 一致"""
+        count = self.count_orders()
+        for batch_start in range(0, count, batch_size):
+            yield from enumerate(self.read_orders(batch_start, min(batch_start + batch_size, count)), batch_start)
+
+    def query_orders(self, start=None, end=None, table=None):
+        return [(seq, order_data) for seq, order_data in self._iter_orders()
+                if order_matches(order_data, start, end, table)]
+
+    def load_stats(self):
+        path = stats_path(self.path)
+        if not os.path.exists(path):
+            return None
+        return read_json_file(path)
+
+    def save_stats(self, stats_data):
+        write_json_file(stats_path(self.path), stats_data, "compact")
+
+    def compact(self):
+        """逐条重写订单日志，去掉空行和写入中断留下的半行；损坏的订单保留为空订单占位"""
+        journal = journal_path(self.path)
+        if not os.path.exists(journal):
+            return
+        with atomic_write(journal) as f:
+            for _, order_data in self._iter_orders():
+                f.write(json.dumps(order_data, ensure_ascii=False) + "\n")
+        self._offsets, self._scanned = [], 0
+
+
+class SqliteStorage(MenuStorage):
+    """
+    SQLite 存储后端（.db 文件），多台终端可共享同一个数据库文件
+    每次操作使用独立连接并在事务中完成
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS categories (
+        position INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS dishes (
+        id INTEGER PRIMARY KEY,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        price REAL NOT NULL,
+        category TEXT NOT NULL DEFAULT '未分类',
+        description TEXT NOT NULL DEFAULT '',
+        dialect_name TEXT NOT NULL DEFAULT '',
+        is_spicy INTEGER NOT NULL DEFAULT 0,
+        sales_count INTEGER NOT NULL DEFAULT 0,
+        remarks TEXT NOT NULL DEFAULT '[]'
+    );
+    CREATE TABLE IF NOT EXISTS orders (
+        seq INTEGER PRIMARY KEY,
+        table_no TEXT NOT NULL DEFAULT '',
+        timestamp TEXT NOT NULL,
+        total_cents INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS person_orders (
+        id INTEGER PRIMARY KEY,
+        order_seq INTEGER NOT NULL REFERENCES orders(seq) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        payment_method TEXT NOT NULL DEFAULT 'AA',
+        payment_value REAL NOT NULL DEFAULT 1.0,
+        original_cents INTEGER,
+        final_cents INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS order_items (
+        id INTEGER PRIMARY KEY,
+        person_order_id INTEGER NOT NULL REFERENCES person_orders(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        dish_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        remark TEXT NOT NULL DEFAULT '',
+        price_cents INTEGER,
+        dish_name TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_orders_table ON orders(table_no);
+    CREATE INDEX IF NOT EXISTS idx_person_orders_order ON person_orders(order_seq);
+    CREATE INDEX IF NOT EXISTS idx_order_items_person ON order_items(person_order_id);
+    CREATE INDEX IF NOT EXISTS idx_order_items_dish ON order_items(dish_id);
+    """
+    SCHEMA_VERSION = 1
+    # 各版本新增的列：{版本: [(表, 列定义)]}，旧数据库打开时用 ALTER TABLE 补齐
+    MIGRATIONS = {
+        1: [("orders", "total_cents INTEGER"),
+            ("person_orders", "original_cents INTEGER"),
+            ("person_orders", "final_cents INTEGER"),
+            ("order_items", "price_cents INTEGER"),
+            ("order_items", "dish_name TEXT")],
+    }
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._initialized = False  # 建表、WAL 模式和迁移只在第一次连接时执行
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")  # 每个连接单独设置
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode = WAL")  # 保存在数据库文件中；允许其他终端在写入时继续读取
+                conn.executescript(self.SCHEMA)
+                self._migrate(conn)
+                self._initialized = True
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _migrate(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+        with conn:
+            for target in range(version + 1, self.SCHEMA_VERSION + 1):
+                for table, column in self.MIGRATIONS.get(target, []):
+                    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                    if column.split()[0] not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def load(self, lazy_history=False):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        conn = self._connect()
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            dishes = [{
+                "id": row[0], "name": row[1], "price": row[2], "category": row[3],
+                "description": row[4], "dialect_name": row[5], "is_spicy": row[6],
+                "sales_count": row[7], "remarks": json.loads(row[8])
+            } for row in conn.execute(
+                "SELECT id, name, price, category, description, dialect_name, is_spicy, "
+                "sales_count, remarks FROM dishes ORDER BY position")]
+            data = {
+                "dishes": dishes,
+                "categories": [row[0] for row in conn.execute(
+                    "SELECT name FROM categories ORDER BY position")] or ["未分类"],
+                "next_id": int(meta.get("next_id", len(dishes) + 1)),
+            }
+            if lazy_history:
+                history = LazyOrderHistory(self)
+            else:
+                history = [order_data for _, order_data in self._select_orders(conn, "", ())]
+        finally:
+            conn.close()
+        return data, history, True
+
+    def save_menu(self, menu_data):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM dishes")
+                conn.executemany(
+                    "INSERT INTO dishes (id, position, name, price, category, description, "
+                    "dialect_name, is_spicy, sales_count, remarks) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(d["id"], position, d["name"], d["price"], d["category"], d["description"],
+                      d["dialect_name"], d["is_spicy"], d["sales_count"],
+                      json.dumps(d["remarks"], ensure_ascii=False))
+                     for position, d in enumerate(menu_data["dishes"])])
+                conn.execute("DELETE FROM categories")
+                conn.executemany("INSERT INTO categories (position, name) VALUES (?, ?)",
+                                 list(enumerate(menu_data["categories"])))
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_id', ?)",
+                             (str(menu_data["next_id"]),))
+        finally:
+            conn.close()
+
+    def _insert_order(self, conn, seq, order_data):
+        # 金额和菜品名快照在旧格式订单中不存在，保存为 NULL
+        conn.execute("INSERT INTO orders (seq, table_no, timestamp, total_cents) VALUES (?, ?, ?, ?)",
+                     (seq, order_data.get("table", ""), order_data["timestamp"], order_data.get("total_cents")))
+        for position, (name, person_data) in enumerate(order_data["orders"].items()):
+            cursor = conn.execute(
+                "INSERT INTO person_orders (order_seq, position, name, payment_method, payment_value, "
+                "original_cents, final_cents) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (seq, position, name, person_data.get("payment_method", "AA"),
+                 person_data.get("payment_value", 1.0),
+                 person_data.get("original_cents"), person_data.get("final_cents")))
+            conn.executemany(
+                "INSERT INTO order_items (person_order_id, position, dish_id, quantity, remark, "
+                "price_cents, dish_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, item_position) + unpack_order_item(item)
+                 for item_position, item in enumerate(person_data["items"])])
+
+    def write_history(self, orders):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM orders")
+                for seq, order_data in enumerate(orders):
+                    self._insert_order(conn, seq, order_data)
+        finally:
+            conn.close()
+
+    def append_order(self, order_data):
+        conn = self._connect()
+        try:
+            with conn:
+                # 先取得写锁再分配序号，多台终端同时追加时不会得到相同的序号
+                conn.execute("BEGIN IMMEDIATE")
+                seq = conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM orders").fetchone()[0]
+                self._insert_order(conn, seq, order_data)
+        finally:
+            conn.close()
+
+    def _select_orders(self, conn, where, params):
+        orders = {}
+        for order_seq, table_no, timestamp, total_cents in conn.execute(
+                f"SELECT seq, table_no, timestamp, total_cents FROM orders {where} ORDER BY seq", params):
+            orders[order_seq] = {"table": table_no, "timestamp": timestamp, "orders": {}}
+            if total_cents is not None:
+                orders[order_seq]["total_cents"] = total_cents
+        if not orders:
+            return []
+        persons = {}
+        for person_id, order_seq, name, method, value, original_cents, final_cents in conn.execute(
+                f"SELECT p.id, p.order_seq, p.name, p.payment_method, p.payment_value, "
+                f"p.original_cents, p.final_cents "
+                f"FROM person_orders p JOIN orders ON orders.seq = p.order_seq {where} "
+                f"ORDER BY p.order_seq, p.position", params):
+            person_data = {"items": [], "payment_method": method, "payment_value": value}
+            if original_cents is not None:
+                person_data["original_cents"] = original_cents
+                person_data["final_cents"] = final_cents
+            orders[order_seq]["orders"][name] = person_data
+            persons[person_id] = person_data
+        for person_id, dish_id, quantity, remark, price_cents, dish_name in conn.execute(
+                f"SELECT i.person_order_id, i.dish_id, i.quantity, i.remark, i.price_cents, i.dish_name "
+                f"FROM order_items i JOIN person_orders p ON p.id = i.person_order_id "
+                f"JOIN orders ON orders.seq = p.order_seq {where} "
+                f"ORDER BY i.person_order_id, i.position", params):
+            if price_cents is None:
+                persons[person_id]["items"].append([dish_id, quantity, remark])
+            else:
+                persons[person_id]["items"].append([dish_id, quantity, remark, price_cents, dish_name])
+        return list(orders.items())
+
+    def count_orders(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        finally:
+            conn.close()
+
+    def read_orders(self, start, stop):
+        conn = self._connect()
+        try:
+            return [order_data for _, order_data in self._select_orders(
+                conn, "WHERE orders.seq >= ? AND orders.seq < ?", (start, stop))]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _order_conditions(start, end, table):
+        conditions, params = [], []
+        if start:
+            conditions.append("orders.timestamp >= ?")
+            params.append(start)
+        if end:
+            conditions.append("orders.timestamp < ?")
+            params.append(end)
+        if table is not None:
+            conditions.append("orders.table_no = ?")
+            params.append(table)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        return where, tuple(params)
+
+    def query_orders(self, start=None, end=None, table=None):
+        where, params = self._order_conditions(start, end, table)
+        conn = self._connect()
+        try:
+            return self._select_orders(conn, where, params)
+        finally:
+            conn.close()
+
+    SORT_KEYS = ("table", "customers", "total")
+    # 与 MenuManager.order_total_cents 相同：优先用保存的总金额，其次每人金额，旧订单按当前菜品价格计算
+    _TOTAL_CENTS_SQL = """COALESCE(orders.total_cents, (
+        SELECT SUM(COALESCE(p.original_cents, (
+            SELECT SUM(i.quantity * COALESCE(i.price_cents, CAST(ROUND(d.price * 100) AS INTEGER), 0))
+            FROM order_items i LEFT JOIN dishes d ON d.id = i.dish_id WHERE i.person_order_id = p.id), 0))
+        FROM person_orders p WHERE p.order_seq = orders.seq), 0)"""
+    _SORT_SQL = {
+        "table": "orders.table_no",
+        "customers": "(SELECT COUNT(*) FROM person_orders p WHERE p.order_seq = orders.seq)",
+        "total": _TOTAL_CENTS_SQL,
+    }
+
+    def query_order_seqs(self, start=None, end=None, table=None, sort=None):
+        where, params = self._order_conditions(start, end, table)
+        if sort is not None and sort not in self._SORT_SQL:
+            raise ValueError(f"不支持的排序: {sort}")
+        order_by = f"{self._SORT_SQL[sort]}, orders.seq" if sort else "orders.seq"
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute(f"SELECT seq FROM orders {where} ORDER BY {order_by}", params)]
+        finally:
+            conn.close()
+
+    def load_stats(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'stats'").fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def save_stats(self, stats_data):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats', ?)",
+                             (json.dumps(stats_data, ensure_ascii=False, separators=(',', ':')),))
+        finally:
+            conn.close()
+
+    def compact(self):
+        """把 WAL 日志合并回数据库并 VACUUM"""
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+
+class SaveJob:
+    """
+    一次保存的快照，在界面线程中生成，run() 可在后台线程执行
+    storage 为 None 时表示把 menu_data 和 history 按 file_format 合并保存为单个文件（副本）
+    history 为订单历史的快照（列表或 LazyOrderHistory.snapshot()），在 run() 中才读取
+    """
+
+    def __init__(self, filename, menu_data, storage=None, history=None, file_format="pretty", stats=None):
+        self.filename = filename
+        self.menu_data = menu_data
+        self.storage = storage
+        self.history = history  # 需要完整重写的订单历史，None 表示不需要
+        self.file_format = file_format
+        self.stats = stats  # 与订单历史一起保存的订单统计，None 表示不需要
+
+    def run(self):
+        if self.storage is None:
+            menu_data = self.menu_data
+            if self.history is not None:
+                menu_data = dict(menu_data, order_history=list(self.history))
+            write_json_file(self.filename, menu_data, self.file_format)
+            return
+        self.storage.save_menu(self.menu_data)
+        if self.history is not None:
+            self.storage.write_history(self.history)
+        if self.stats is not None:
+            self.storage.save_stats(self.stats)
+
+
+def storage_for(path):
+    """根据文件扩展名选择存储后端：.db/.sqlite/.sqlite3 使用 SQLite，其余使用 JSON"""
+    if os.path.splitext(path)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteStorage(path)
+    return JsonStorage(path)
+
+
+def backup_dir_for(menu_file):
+    """菜单文件对应的备份目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(menu_file)), "backups")
+
+
+class BackupPolicy:
+    """
+    备份保留策略：
+    keep_last 保留最近 N 个备份；keep_hourly/keep_daily 在最近 N 个有备份的小时/天中各保留最新一个；
+    max_total_mb 限制备份总大小（超出时从最旧的开始删除，最新的备份始终保留）
+    checkpoint_every 增量备份模式：每 N 次备份写一次完整检查点，其余只记录变化；为 0 时每次都写完整快照
+    file_format 备份文件的保存格式（FILE_FORMATS）
+    """
+    FIELDS = ("keep_last", "keep_hourly", "keep_daily", "max_total_mb", "checkpoint_every", "file_format")
+
+    def __init__(self, keep_last=10, keep_hourly=24, keep_daily=30, max_total_mb=200, checkpoint_every=20,
+                 file_format="gzip"):
+        self.keep_last = keep_last
+        self.keep_hourly = keep_hourly
+        self.keep_daily = keep_daily
+        self.max_total_mb = max_total_mb
+        self.checkpoint_every = checkpoint_every
+        self.file_format = file_format
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+
+def _canonical(value):
+    """整数值的浮点数换成整数（SQLite 读出的 8.0 与内存中的 8 相同），使摘要与 == 比较一致"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def backup_hash(data):
+    """备份比较用的内容摘要（按排序键的 JSON 计算），data 为 None 时返回 None"""
+    if data is None:
+        return None
+    text = json.dumps(_canonical(data), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def apply_backup_delta(state, delta):
+    """
+    把增量应用到备份数据上，返回新的备份数据（不修改 state）
+    增量记录 orders_from 之后新增的订单，菜单有变化时在 menu 中记录完整的菜单数据；
+    旧版本按菜品记录变化的增量（dishes、removed_dishes 等）也能应用
+    """
+    if "menu" in delta:
+        new_state = dict(delta["menu"])
+        new_state["order_history"] = state["order_history"][:delta["orders_from"]] + delta.get("new_orders", [])
+        return new_state
+    dishes = {dish["id"]: dish for dish in state["dishes"]}
+    order = [dish["id"] for dish in state["dishes"]]
+    for dish_id in delta.get("removed_dishes", []):
+        dishes.pop(dish_id, None)
+    for dish in delta.get("dishes", []):
+        if dish["id"] not in dishes:
+            order.append(dish["id"])
+        dishes[dish["id"]] = dish
+    order = delta.get("dish_order", order)
+    new_state = dict(state)
+    new_state["dishes"] = [dishes[dish_id] for dish_id in order if dish_id in dishes]
+    new_state["order_history"] = state["order_history"][:delta["orders_from"]] + delta.get("new_orders", [])
+    for key in ("categories", "next_id", "current_file"):
+        if key in delta:
+            new_state[key] = delta[key]
+    return new_state
+
+
+class BackupManager:
+    """
+    备份目录管理：快照按内容的 SHA-256 存放在 objects/ 下，相同内容只保存一份
+    index.json 记录每次备份的时间、类型（full 完整检查点 / delta 增量）和对应的快照，
+    以及菜单数据的摘要、订单数和最后一个订单的摘要，下次备份只与这些记录比较，不在内存中保留上次备份的数据；
+    policy.json 为保留策略，可手工修改
+    恢复时从最近的检查点开始依次应用增量
+    """
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, backup_dir, policy=None):
+        self.backup_dir = backup_dir
+        self.objects_dir = os.path.join(backup_dir, "objects")
+        self.index_path = os.path.join(backup_dir, "index.json")
+        self.policy_path = os.path.join(backup_dir, "policy.json")
+        self.policy = policy or self._load_policy()
+
+    def _load_policy(self):
+        try:
+            with open(self.policy_path, 'r', encoding='utf-8') as f:
+                return BackupPolicy.from_dict(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"读取备份策略失败，使用默认策略: {e}")
+            return BackupPolicy()
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest + ".json")
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("backups", [])
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError as e:
+            print(f"读取备份索引失败: {e}")
+            return []
+
+    def _write_index(self, entries):
+        write_json_atomic(self.index_path, {"backups": entries})
+
+    def _ensure_dirs(self):
+        os.makedirs(self.objects_dir, exist_ok=True)
+        if not os.path.exists(self.policy_path):
+            write_json_atomic(self.policy_path, self.policy.to_dict())
+
+    def _store_object(self, content):
+        """按内容寻址保存快照（摘要按未压缩的内容计算），返回 (摘要, 磁盘大小)"""
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            with atomic_write(path, 'wb') as f:
+                f.write(compress_bytes(data, self.policy.file_format))
+        return digest, os.path.getsize(path)
+
+    def _import_legacy(self, entries):
+        """把旧版本留下的 menu_backup_*.json 整文件备份并入快照库"""
+        imported = False
+        for name in sorted(os.listdir(self.backup_dir)):
+            if not (name.startswith("menu_backup_") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.backup_dir, name)
+            try:
+                timestamp = datetime.datetime.strptime(name[len("menu_backup_"):-len(".json")], "%Y%m%d_%H%M%S")
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except (ValueError, OSError) as e:
+                print(f"导入旧备份失败 {name}: {e}")
+                continue
+            digest, size = self._store_object(content)
+            entries.append({"timestamp": timestamp.strftime(self.TIME_FORMAT), "hash": digest, "size": size})
+            os.remove(path)
+            imported = True
+        if imported:
+            entries.sort(key=lambda entry: entry["timestamp"])
+        return imported
+
+    def add_snapshot(self, menu_data, history, now=None):
+        """
+        保存一次备份并按策略清理，返回备份记录；与上一次备份内容相同时不新增记录，返回 None
+        menu_data 为菜单数据，history 为订单历史（列表或 LazyOrderHistory），在后台线程调用
+        上一次备份的订单仍是当前历史的开头时只读取并保存之后新增的订单，否则写入完整检查点
+        """
+        self._ensure_dirs()
+        entries = self.load_index()
+        self._import_legacy(entries)
+        count = len(history)
+        menu_hash = backup_hash(menu_data)
+        last_order_hash = backup_hash(history[count - 1] if count else None)
+        last = entries[-1] if entries else None
+        if (last is not None and last.get("menu_hash") == menu_hash and last.get("order_count") == count
+                and last.get("last_order_hash") == last_order_hash):
+            return None
+
+        delta = None
+        checkpoint_every = self.policy.checkpoint_every
+        if checkpoint_every and last is not None and "order_count" in last:
+            since_checkpoint = len(entries) - 1 - self._checkpoint_index(entries, len(entries) - 1)
+            done = last["order_count"]
+            if (since_checkpoint + 1 < checkpoint_every and done <= count
+                    and backup_hash(history[done - 1] if done else None) == last["last_order_hash"]):
+                delta = {"orders_from": done, "new_orders": history[done:count]}
+                if menu_hash != last["menu_hash"]:
+                    delta["menu"] = menu_data
+
+        if delta is None:
+            kind, payload = "full", dict(menu_data, order_history=history[:count])
+        else:
+            kind, payload = "delta", delta
+        digest, size = self._store_object(json.dumps(payload, ensure_ascii=False, sort_keys=True))
+        now = now or datetime.datetime.now()
+        entry = {"timestamp": now.strftime(self.TIME_FORMAT), "kind": kind, "hash": digest, "size": size,
+                 "menu_hash": menu_hash, "order_count": count, "last_order_hash": last_order_hash}
+        entries.append(entry)
+        self._write_index(self.prune_entries(entries))
+        self._remove_unreferenced()
+        return entry
+
+    @staticmethod
+    def _checkpoint_index(entries, index):
+        """entries[index] 所依赖的完整检查点的下标"""
+        while index > 0 and entries[index].get("kind") == "delta":
+            index -= 1
+        return index
+
+    def prune_entries(self, entries):
+        """按保留策略筛选备份记录（entries 按时间升序），返回保留的记录"""
+        if not entries:
+            return []
+        policy = self.policy
+        times = [datetime.datetime.strptime(entry["timestamp"], self.TIME_FORMAT) for entry in entries]
+        keep = set(range(max(0, len(entries) - policy.keep_last), len(entries)))
+        keep.add(len(entries) - 1)
+
+        # 时间分桶稀疏化：每个桶保留最新的一个
+        for limit, bucket in ((policy.keep_hourly, lambda t: t.strftime("%Y%m%d%H")),
+                              (policy.keep_daily, lambda t: t.strftime("%Y%m%d"))):
+            if not limit:
+                continue
+            seen = set()
+            for i in range(len(entries) - 1, -1, -1):
+                key = bucket(times[i])
+                if key in seen:
+                    continue
+                seen.add(key)
+                if len(seen) > limit:
+                    break
+                keep.add(i)
+
+        # 增量备份依赖它之前直到检查点的所有记录
+        for i in list(keep):
+            keep.update(range(self._checkpoint_index(entries, i), i))
+        kept = [i for i in range(len(entries)) if i in keep]
+
+        # 总大小限制：相同快照只计算一次，以检查点为单位从最旧的开始删除
+        if policy.max_total_mb:
+            max_bytes = policy.max_total_mb * 1024 * 1024
+            sizes = {}
+            for i in kept:
+                sizes[entries[i]["hash"]] = entries[i].get("size", 0)
+            total = sum(sizes.values())
+            while total > max_bytes and len(kept) > 1:
+                chain_end = 1
+                while chain_end < len(kept) and entries[kept[chain_end]].get("kind") == "delta":
+                    chain_end += 1
+                if chain_end == len(kept):
+                    break  # 只剩最新的一组检查点和增量
+                removed, kept = kept[:chain_end], kept[chain_end:]
+                for digest in {entries[i]["hash"] for i in removed}:
+                    if all(entries[i]["hash"] != digest for i in kept):
+                        total -= sizes.pop(digest)
+        return [entries[i] for i in kept]
+
+    def _remove_unreferenced(self):
+        referenced = {entry["hash"] for entry in self.load_index()}
+        for name in os.listdir(self.objects_dir):
+            if name.endswith(".json") and name[:-len(".json")] not in referenced:
+                try:
+                    os.remove(os.path.join(self.objects_dir, name))
+                except OSError as e:
+                    print(f"删除过期备份失败 {name}: {e}")
+
+    def list_backups(self):
+        return self.load_index()
+
+    def load_snapshot(self, entry):
+        """读取某次备份保存的原始内容（检查点为完整数据，增量备份为增量）"""
+        return read_json_file(self._object_path(entry["hash"]))
+
+    def restore(self, entry, entries=None):
+        """从检查点开始依次应用增量，返回 entry 时刻的完整数据（菜单和订单历史）"""
+        entries = entries if entries is not None else self.load_index()
+        matches = [i for i, e in enumerate(entries)
+                   if e["hash"] == entry["hash"] and e["timestamp"] == entry["timestamp"]]
+        if not matches:
+            raise KeyError(f"备份记录不存在: {entry['timestamp']}")
+        index = matches[-1]
+        start = self._checkpoint_index(entries, index)
+        state = self.load_snapshot(entries[start])
+        state.setdefault("order_history", [])
+        for delta_entry in entries[start + 1:index + 1]:
+            state = apply_backup_delta(state, self.load_snapshot(delta_entry))
+        return state
+
+    def restore_at(self, when):
+        """恢复到 when（datetime）时刻之前最近一次备份的数据；没有更早的备份时返回 None"""
+        entries = self.load_index()
+        limit = when.strftime(self.TIME_FORMAT)
+        candidates = [entry for entry in entries if entry["timestamp"] <= limit]
+        if not candidates:
+            return None
+        return self.restore(candidates[-1], entries)
+
+
+class BackupJob:
+    """
+    一次备份的快照，run() 可在后台线程执行
+    data 为菜单数据；订单历史在 run() 中从 history 读取（只读取上次备份之后新增的订单）
+    """
+
+    def __init__(self, backup_manager, data, history):
+        self.backup_manager = backup_manager
+        self.data = data
+        self.history = history
+        self.filename = backup_manager.backup_dir
+        self.storage = None
+        self.entry = None
+
+    def run(self, now=None):
+        self.entry = self.backup_manager.add_snapshot(self.data, self.history, now)
+
+
+class MenuManager:
+    def __init__(self):
+        self.dishes = []
+        self.categories = ["未分类"]
+        self.current_file = None
+        self.next_id = 1  # 用于自动生成菜品ID
+        self.order_history = []  # 订单历史保存
+        self.storage = None  # 当前文件的存储后端（JsonStorage / SqliteStorage）
+        self._history_synced = True  # 存储后端是否已包含全部订单历史
+        self._history_job = None  # 正在完整重写订单历史的保存任务
+        self._deferred_orders = []  # 重写期间新增的订单，完成后再追加
+        self._backup_manager = None  # 当前文件的备份目录管理
+        self._order_stats = None  # 订单统计，第一次使用时读取保存的统计或从订单历史建立
+        self._saved_stats_count = None  # 存储中的订单统计对应的订单数
+        self.modified = False # 修改标记
+        self.generation = 0  # 修改代数，每次修改菜品或订单历史都递增，用于廉价判断是否需要备份
+        # 查询索引，与 self.dishes 保持一致
+        self._id_index = {}  # {dish_id: Dish}
+        self._name_index = defaultdict(list)  # {name: [Dish]}，允许重名，顺序与 self.dishes 相同
+        self._category_index = defaultdict(list)  # {category: [Dish]}，顺序与 self.dishes 相同
+        self._search_keys = {}  # {dish_id: 搜索关键字元组}，避免每次按键重新转换拼音
+        self._dish_listeners = []  # update_dish 之后调用 listener(dish, 修改的字段集合)
+
+    def touch(self, modified=True):
+        """记录一次修改；modified=False 用于只影响销量、备注等统计数据的修改（不提示保存）"""
+        self.generation += 1
+        if modified:
+            self.modified = True
+
+    def _index_dish(self, dish):
+        self._id_index[dish.id] = dish
+        self._name_index[dish.name].append(dish)
+        self._category_index[dish.category].append(dish)
+
+    def _unindex_dish(self, dish):
+        self._id_index.pop(dish.id, None)
+        for index, key in ((self._name_index, dish.name), (self._category_index, dish.category)):
+            same_key = index.get(key)
+            if same_key is not None:
+                same_key.remove(dish)
+                if not same_key:
+                    del index[key]
+
+    def rebuild_indexes(self):
+        """按 self.dishes 重建全部索引（加载或排序后调用）"""
+        self._id_index = {}
+        self._name_index = defaultdict(list)
+        self._category_index = defaultdict(list)
+        for dish in self.dishes:
+            self._index_dish(dish)
+
+    def add_dish(self, name, price, category="未分类", description="", dialect_name="", is_spicy=0):
+        dish = Dish(self.next_id, name, price, category, description, dialect_name, is_spicy)
+        self.dishes.append(dish)
+        self._index_dish(dish)
+        self._search_keys[dish.id] = build_search_keys(dish)
+        self.next_id += 1
+        
+        if category not in self.categories:
+            self.categories.append(category)
+        self.touch()  # 设置修改标记
+        return dish
+
+    def remove_dish(self, dish_id):
+        dish = self._id_index.get(dish_id)
+        if dish is None:
+            return False
+        self.dishes.remove(dish)
+        self._unindex_dish(dish)
+        self._search_keys.pop(dish_id, None)
+        self.touch()  # 设置修改标记
+        return True
+
+    def update_dish(self, dish_id, **kwargs):
+        dish = self._id_index.get(dish_id)
+        if dish is None:
+            return False
+
+        # 名称或分类变化时需要更新对应索引
+        reindex = any(key in ('name', 'category') for key in kwargs)
+        if reindex:
+            self._unindex_dish(dish)
+
+        for key, value in kwargs.items():
+            if hasattr(dish, key):
+                setattr(dish, key, value)
+                
+                if key == 'category' and value not in self.categories:
+                    self.categories.append(value)
+
+        if reindex:
+            self._id_index[dish.id] = dish
+            # 名称和分类索引需保持与 self.dishes 相同的顺序
+            self._name_index[dish.name] = [d for d in self.dishes if d.name == dish.name]
+            self._category_index[dish.category] = [
+                d for d in self.dishes if d.category == dish.category
+            ]
+        if 'name' in kwargs or 'dialect_name' in kwargs:
+            # 只让被修改的菜品的搜索关键字失效
+            self._search_keys[dish.id] = build_search_keys(dish)
+        self.touch()  # 设置修改标记
+
+        changed = set(kwargs)
+        for listener in self._dish_listeners:
+            listener(dish, changed)
+        return True
+
+    def add_dish_listener(self, listener):
+        if listener not in self._dish_listeners:
+            self._dish_listeners.append(listener)
+
+    def remove_dish_listener(self, listener):
+        if listener in self._dish_listeners:
+            self._dish_listeners.remove(listener)
+
+    def get_dish_by_id(self, dish_id):
+        return self._id_index.get(dish_id)
+
+    def get_dish_by_name(self, name):
+        """重名时返回菜单中排在最前的菜品"""
+        dishes = self._name_index.get(name)
+        return dishes[0] if dishes else None
+
+    def get_dishes_by_category(self, category):
+        return list(self._category_index.get(category, []))
+
+    def get_search_keys(self, dish):
+        keys = self._search_keys.get(dish.id)
+        if keys is None:
+            keys = self._search_keys[dish.id] = build_search_keys(dish)
+        return keys
+
+    def dish_matches(self, dish, search_text):
+        """search_text 需为小写；空字符串匹配所有菜品"""
+        if not search_text:
+            return True
+        return any(search_text in key for key in self.get_search_keys(dish))
+
+    def filter_dishes(self, category=None, search_text="", candidates=None):
+        """按分类和搜索文本筛选菜品；提供 candidates 时只在其中筛选（用于逐步细化的搜索）"""
+        if candidates is None:
+            candidates = self._category_index.get(category, []) if category else self.dishes
+        elif category:
+            candidates = [dish for dish in candidates if dish.category == category]
+        return [dish for dish in candidates if self.dish_matches(dish, search_text)]
+
+    def sort_dishes(self, key='default'):
+        if key == 'default':
+            self.dishes.sort(key=lambda x: x.id)
+        elif key == 'name':
+            self.dishes.sort(key=lambda x: x.name)
+        elif key == 'price':
+            self.dishes.sort(key=lambda x: x.price_cents)
+        self.rebuild_indexes()
+        self.touch(modified=False)  # 菜品顺序会写入菜单文件和备份
+
+    @property
+    def order_stats(self):
+        """
+        订单统计；第一次访问时读取存储中保存的统计并补上之后的订单，没有或不一致时统计全部订单历史
+        之后随 append_order 增量更新
+        """
+        if self._order_stats is None:
+            self._order_stats = self._load_order_stats() or OrderStats(self)
+        self._order_stats.catch_up(self.order_history)
+        return self._order_stats
+
+    def _load_order_stats(self):
+        if not (self.storage and self._history_synced):
+            return None
+        try:
+            data = self.storage.load_stats()
+            stats = OrderStats.from_dict(data, self) if data else None
+        except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+            print(f"读取订单统计失败: {e}")
+            return None
+        if stats is None or not stats.matches(self.order_history):
+            return None
+        self._saved_stats_count = stats.order_count
+        return stats
+
+    @property
+    def sales_stats(self):
+        return self.order_stats.sales
+
+    @property
+    def customer_habits(self):
+        return self.order_stats.habits
+
+    @property
+    def sales_rollups(self):
+        return self.order_stats.rollups
+
+    def begin_export(self, filename, start=None, end=None, table=None):
+        """
+        生成订单历史导出任务，run() 可在后台线程执行
+        历史已全部保存在存储中时由任务自己分页读取，不与界面共用缓存；否则导出当前历史的副本
+        """
+        if self.storage and self._history_synced and self._history_job is None:
+            history = LazyOrderHistory(storage_for(self.storage.path))
+        else:
+            history = self._history_snapshot()
+        dish_snapshot = {dish.id: (dish.name, dish.price_cents) for dish in self.dishes}
+        return HistoryExport(filename, history, dish_snapshot, start, end, table)
+
+    def _history_snapshot(self):
+        """交给后台任务的订单历史快照：按页读取的历史由任务自己读取，不在界面线程读取全部订单"""
+        if isinstance(self.order_history, LazyOrderHistory):
+            return self.order_history.snapshot()
+        return list(self.order_history)
+
+    def columnar_history(self, cache=None):
+        """
+        把订单历史转换为 ColumnarHistory（用于 ColumnarAnalytics 批量分析或导出）
+        cache 为缓存文件：读取上次转换的结果，只转换之后新增的订单再写回；
+        缓存损坏或与订单历史不一致（订单更少、最后一个订单的时间不同）时重新转换
+        """
+        history = self.order_history
+        columns = None
+        if cache and os.path.exists(cache):
+            try:
+                columns = ColumnarHistory.load(cache)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"读取分析缓存失败，重新转换: {e}")
+        done = len(columns.timestamps) if columns is not None else 0
+        if columns is None or done > len(history) or (
+                done and history[done - 1].get("timestamp", "") != columns.timestamps[-1]):
+            columns, done = ColumnarHistory(), 0
+        for seq in range(done, len(history)):
+            columns.add_order(history[seq], self)
+        if cache and len(columns.timestamps) != done:
+            columns.save(cache)
+        return columns
+
+    def rebuild_stats(self):
+        """从订单历史完整重建订单统计并保存到当前存储"""
+        self._order_stats = OrderStats(self)
+        self._order_stats.catch_up(self.order_history)
+        self._saved_stats_count = None
+        self.save_stats()
+        return self._order_stats
+
+    def _stats_snapshot(self):
+        """需要保存的订单统计数据；还未统计或没有新订单时返回 None"""
+        stats = self._order_stats
+        if stats is None or stats.order_count == self._saved_stats_count:
+            return None
+        self._saved_stats_count = stats.order_count
+        return stats.to_dict()
+
+    def save_stats(self):
+        """把订单统计写入当前存储（退出程序时调用），下次打开时不必重新统计全部历史"""
+        if not (self.storage and self._history_synced) or self._history_job is not None:
+            return
+        stats_data = self._stats_snapshot()
+        if stats_data is None:
+            return
+        try:
+            self.storage.save_stats(stats_data)
+        except (OSError, sqlite3.Error) as e:
+            self._saved_stats_count = None
+            print(f"保存订单统计失败: {e}")
+
+    def dish_name(self, dish_id):
+        """当前菜单中的菜品名；菜品已删除时使用订单中记录的菜品名"""
+        dish = self.get_dish_by_id(dish_id)
+        if dish is not None:
+            return dish.name
+        if self._order_stats is not None:
+            return self._order_stats.sales.names.get(dish_id, "")
+        return ""
+
+    def get_top_dishes(self, limit=5):
+        """返回销量最高的菜品 [(dish_id, 销量)]"""
+        return self.sales_stats.top(limit)
+
+    def dish_sales_count(self, dish):
+        if self._order_stats is None:
+            return dish.sales_count  # 还未统计时沿用文件中保存的销量
+        return self._order_stats.sales.quantity(dish.id)
+
+    def _menu_data(self, filename):
+        return {
+            "dishes": [{
+                "id": dish.id,
+                "name": dish.name,
+                "price": dish.price,
+                "category": dish.category,
+                "description": dish.description,
+                "dialect_name": dish.dialect_name,
+                "is_spicy": dish.is_spicy,
+                "sales_count": self.dish_sales_count(dish),
+                "remarks": list(dish.remarks)
+            } for dish in self.dishes],
+            "categories": list(self.categories),
+            "next_id": self.next_id,
+            "current_file": filename
+        }
+
+    def begin_save(self, filename, file_format=None):
+        """
+        生成保存快照并立即更新保存状态，返回的 SaveJob 可交给后台线程执行
+        执行完毕后必须在界面线程调用 finish_save
+        订单历史由存储后端单独保存（JSON 日志或 SQLite 表），不再写入菜单文件
+        file_format 为 JSON 菜单文件的保存格式（FILE_FORMATS），None 表示沿用当前格式
+        """
+        storage = self.storage if filename == self.current_file and self.storage else storage_for(filename)
+        if file_format:
+            storage.file_format = file_format
+
+        # 存储中已包含全部历史时无需重写；另存为新文件或从旧格式迁移时写入完整历史
+        history = None
+        if storage is not self.storage or not self._history_synced:
+            history = self._history_snapshot()
+            self._saved_stats_count = None  # 新存储中还没有统计
+        job = SaveJob(filename, self._menu_data(filename), storage, history, stats=self._stats_snapshot())
+
+        self.storage = storage
+        self.current_file = filename
+        self._history_synced = True
+        if history is not None:
+            self._history_job = job
+        self.modified = False  # 保存后重置修改标记
+        return job
+
+    def begin_copy(self, filename, file_format="pretty", with_history=True):
+        """生成菜单和订单历史合并为单个文件的快照（用于备份或导出），不改变当前文件"""
+        history = self._history_snapshot() if with_history else None
+        return SaveJob(filename, self._menu_data(filename), history=history, file_format=file_format)
+
+    def finish_save(self, job, error=None):
+        if job is self._history_job:
+            self._history_job = None
+            deferred, self._deferred_orders = self._deferred_orders, []
+            if error is None:
+                for order_data in deferred:
+                    job.storage.append_order(order_data)
+            else:
+                self._history_synced = False  # 下次保存时重新写入完整历史
+        if error is not None and job.storage is not None:
+            self.modified = True
+            if job.stats is not None:
+                self._saved_stats_count = None
+
+    def save_to_file(self, filename, file_format=None):
+        job = self.begin_save(filename, file_format)
+        try:
+            job.run()
+        except Exception as e:
+            self.finish_save(job, e)
+            raise
+        self.finish_save(job)
+
+    def begin_backup(self, backup_manager=None):
+        """
+        生成备份快照，返回的 BackupJob 可交给后台线程执行
+        这里只复制菜单数据，订单历史由任务在后台读取（与 begin_export 相同）
+        """
+        if backup_manager is None:
+            backup_dir = backup_dir_for(self.current_file)
+            if self._backup_manager is None or self._backup_manager.backup_dir != backup_dir:
+                self._backup_manager = BackupManager(backup_dir)
+            backup_manager = self._backup_manager
+        if self.storage and self._history_synced and self._history_job is None:
+            # 存储中已包含全部历史，由任务自己分页读取，不在界面线程统计数量
+            history = LazyOrderHistory(storage_for(self.storage.path))
+        else:
+            history = self._history_snapshot()
+        return BackupJob(backup_manager, self._menu_data(self.current_file), history)
+
+    def backup_key(self):
+        """
+        判断是否需要备份的廉价键：修改代数和存储中的订单数（共享 SQLite 文件时包含其他终端新增的订单）
+        只反映会写入备份的菜单和订单历史，不包括当前未保存的订单
+        """
+        count = None
+        if self.storage and self._history_synced:
+            try:
+                count = self.storage.count_orders()
+            except (OSError, sqlite3.Error) as e:
+                print(f"读取订单数量失败: {e}")
+        return (self.generation, count)
+
+    def append_order(self, order_data):
+        """添加一条订单历史；已有菜单文件时只向订单日志追加一行"""
+        self.order_history.append(order_data)
+        if self._order_stats is not None:
+            self._order_stats.catch_up(self.order_history)
+        self.touch(modified=False)
+        if not self.storage:
+            return  # 首次保存菜单时写入完整历史
+        if self._history_job is not None:
+            # 后台正在重写完整历史，完成后再追加
+            self._deferred_orders.append(order_data)
+            return
+        try:
+            if self._history_synced:
+                self.storage.append_order(order_data)
+            else:
+                # 旧格式文件的历史还在菜单文件里，先完整迁移
+                self.storage.write_history(self.order_history)
+                self._history_synced = True
+        except (OSError, sqlite3.Error):
+            # 订单已在内存的历史中；标记为未同步，下次保存菜单时写入完整历史
+            self._history_synced = False
+            self.modified = True
+            raise
+
+    def _history_from_storage(self):
+        """order_history 是否按页读取当前存储且全部订单都已写入，此时可由存储查询历史序号"""
+        return (isinstance(self.order_history, LazyOrderHistory) and self.order_history.storage is self.storage
+                and self._history_synced and self._history_job is None)
+
+    def refresh_history(self):
+        """
+        从存储重新读取订单数量（共享 SQLite 文件时包括其他终端新增的订单），
+        使 order_history 的下标与存储的历史序号一致；不能刷新时返回 False
+        """
+        if not self._history_from_storage():
+            return False
+        stats = self._order_stats
+        if stats is not None:
+            stats.catch_up(self.order_history)  # 先统计完本终端的订单
+        start, appended = self.order_history.refresh()
+        if stats is not None and appended:
+            self._resync_stats(stats, start, appended)
+        return True
+
+    def _resync_stats(self, stats, start, appended):
+        """
+        刷新历史后，本终端新增的订单（appended，已统计）在存储中可能与其他终端的订单交错：
+        只补上从存储序号 start 开始的其他终端的订单，并把已统计数量对齐到存储的序号；对应不上时重新统计
+        """
+        def order_key(order_data):
+            return order_data.get("timestamp"), order_data.get("table"), tuple(order_data.get("orders", {}))
+
+        history = self.order_history
+        own = 0
+        for seq in range(start, len(history)):
+            order_data = history[seq]
+            if own < len(appended) and order_key(order_data) == order_key(appended[own]):
+                own += 1
+            else:
+                stats.add_order(order_data)
+        if own < len(appended):
+            self._order_stats = self._saved_stats_count = None
+            return
+        stats.order_count = len(history)
+        stats.last_timestamp = history[-1].get("timestamp", "") if stats.order_count else ""
+
+    def query_orders(self, start=None, end=None, table=None):
+        """按时间范围和桌号查询订单历史，返回 [(历史序号, 订单数据)]；SQLite 后端直接用 SQL 查询"""
+        if self._history_from_storage():
+            orders = self.storage.query_orders(start, end, table)
+            self.refresh_history()  # 查询后再刷新数量，结果中的序号都在 order_history 范围内
+            return orders
+        return [(seq, order_data) for seq, order_data in enumerate(self.order_history)
+                if order_matches(order_data, start, end, table)]
+
+    def can_sort_history(self, sort):
+        """
+        query_order_seqs 能否按 sort 排序：内存中的历史都可以；按页读取时只有存储支持该排序（SQLite）才可以，
+        否则需要读取全部订单
+        """
+        if sort is None or not isinstance(self.order_history, LazyOrderHistory):
+            return True
+        return self._history_from_storage() and sort in self.storage.SORT_KEYS
+
+    def _history_sort_value(self, order_data, sort):
+        if sort == "table":
+            return str(order_data.get("table", ""))
+        if sort == "customers":
+            return len(order_data["orders"])
+        return self.order_total_cents(order_data)
+
+    def query_order_seqs(self, start=None, end=None, table=None, sort=None):
+        """
+        只返回符合条件的历史序号（可作为 order_history 的下标）
+        sort 为 "table"/"customers"/"total" 时按桌号、顾客数或总金额升序，相同时按序号；先用 can_sort_history 检查
+        """
+        if self._history_from_storage():
+            seqs = self.storage.query_order_seqs(start, end, table, sort)
+            self.refresh_history()  # 查询后再刷新数量，结果中的序号都在 order_history 范围内
+            return seqs
+        matching = [(seq, order_data) for seq, order_data in enumerate(self.order_history)
+                    if order_matches(order_data, start, end, table)]
+        if sort is not None:
+            matching.sort(key=lambda x: self._history_sort_value(x[1], sort))
+        return [seq for seq, _ in matching]
+
+    def resolve_order_item(self, item):
+        """
+        返回历史订单菜品项的 (菜品名, 单价分, 数量, 备注)，优先使用保存时的快照
+        旧格式订单按当前菜单价格计算，菜品已删除时返回 None
+        """
+        dish_id, quantity, remark, price_cents, name = unpack_order_item(item)
+        if price_cents is not None:
+            return name, price_cents, quantity, remark
+        dish = self.get_dish_by_id(dish_id)
+        if dish is None:
+            return None
+        return dish.name, dish.price_cents, quantity, remark
+
+    def person_total_cents(self, person_data):
+        """历史订单中一位顾客的消费金额（分）"""
+        if "original_cents" in person_data:
+            return person_data["original_cents"]
+        total_cents = 0
+        for item in person_data["items"]:
+            resolved = self.resolve_order_item(item)
+            if resolved:
+                total_cents += resolved[1] * resolved[2]
+        return total_cents
+
+    def order_total_cents(self, order_data):
+        """历史订单的总金额（分）；保存时记录了总金额的直接读取，不受之后改价影响"""
+        if "total_cents" in order_data:
+            return order_data["total_cents"]
+        return sum(self.person_total_cents(person_data) for person_data in order_data["orders"].values())
+
+    def load_from_file(self, filename, lazy_history=True):
+        """lazy_history 为 True 时只加载菜品和分类，订单历史在第一次访问时按页读取"""
+        try:
+            storage = storage_for(filename)
+            data, history, history_synced = storage.load(lazy_history)
+            self._load_data(data)
+            self.current_file = filename
+            self.storage = storage
+            self.order_history = history
+            self._history_synced = history_synced
+            self._order_stats = self._saved_stats_count = None
+            self.modified = False  # 加载文件后重置修改标记
+            self.generation += 1
+            return True
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            print(f"加载菜单失败: {e}")
+            return False
+
+    def restore_backup(self, data, filename=None):
+        """
+        用备份数据（BackupManager.restore 的结果）替换菜单和订单历史
+        恢复后标记为已修改，下次保存时把完整历史重新写入 filename 对应的存储
+        """
+        self._load_data(data)
+        self.current_file = filename
+        self.storage = storage_for(filename) if filename else None
+        self.order_history = list(data.get("order_history", []))
+        self._history_synced = False
+        self._order_stats = self._saved_stats_count = None
+        self.modified = True
+        self.generation += 1
+
+    def _load_data(self, data):
+        """从菜单数据字典加载菜品和分类"""
+        self.dishes = []
+        for dish_data in data["dishes"]:
+            dish = Dish(
+                dish_data["id"],
+                dish_data["name"],
+                dish_data["price"],
+                dish_data.get("category", "未分类"),
+                dish_data.get("description", ""),
+                dish_data.get("dialect_name", ""),
+                dish_data.get("is_spicy", 0)
+            )
+            dish.sales_count = dish_data.get("sales_count", 0)
+            dish.remarks = dish_data.get("remarks", [])
+            self.dishes.append(dish)
+        self.rebuild_indexes()
+        self._search_keys = {dish.id: build_search_keys(dish) for dish in self.dishes}
+
+        self.categories = data.get("categories", ["未分类"])
+        self.next_id = data.get("next_id", len(self.dishes) + 1)
+
+
+class OrderItem:
+    def __init__(self, dish_id, quantity, remark="", price_cents=0):
+        self.dish_id = dish_id
+        self.quantity = quantity
+        self.remark = remark  # 本次点单的特殊要求
+        self.price_cents = price_cents  # 点单时的单价（分）
+
+    @property
+    def price(self):
+        """单价（元），版本2.2.1新增"""
+        return self.price_cents / 100
+
+    @property
+    def total_cents(self):
+        return self.price_cents * self.quantity
+
+
+
+class PersonOrder:
+    def __init__(self, name):
+        self.name = name
+        self.items = []
+        self.payment_method = "AA"  # AA/比例/自定义
+        self.payment_value = 1.0  # 比例或自定义金额
+        self._subtotal_cents = 0  # 消费金额（分）的累计值，None 表示需要重新计算
+
+    @property
+    def subtotal_cents(self):
+        if self._subtotal_cents is None:
+            self._subtotal_cents = sum(item.total_cents for item in self.items)
+        return self._subtotal_cents
+
+    def invalidate_subtotal(self):
+        self._subtotal_cents = None
+
+    def add_item(self, dish_id, quantity, remark="", price_cents=0):
+        self.items.append(OrderItem(dish_id, quantity, remark, price_cents))
+        if self._subtotal_cents is not None:
+            self._subtotal_cents += price_cents * quantity
+
+    def remove_item(self, index):
+        if 0 <= index < len(self.items):
+            item = self.items.pop(index)
+            if self._subtotal_cents is not None:
+                self._subtotal_cents -= item.total_cents
+            return True
+        return False
+
+    def update_item(self, index, quantity=None, remark=None, price_cents=None):
+        item = self.items[index]
+        if self._subtotal_cents is not None:
+            self._subtotal_cents -= item.total_cents
+        if quantity is not None:
+            item.quantity = quantity
+        if remark is not None:
+            item.remark = remark
+        if price_cents is not None:
+            item.price_cents = price_cents
+        if self._subtotal_cents is not None:
+            self._subtotal_cents += item.total_cents
+
+    def clear_items(self):
+        self.items = []
+        self._subtotal_cents = 0
+
+    def set_payment_method(self, method, value=1.0):
+        self.payment_method = method
+        self.payment_value = value
+
+
+class BoundSignal:
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self._slots = []
+        elif slot in self._slots:
+            self._slots.remove(slot)
+        else:
+            raise TypeError("信号未连接到该函数")
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class Signal:
+    """
+    不依赖 Qt 的信号，用法与 pyqtSignal 相同（类属性定义，实例上 connect/disconnect/emit）
+    在发送信号的线程中同步调用，与同一线程内的 Qt 直接连接一致
+    """
+
+    def __init__(self, *types):
+        self.types = types
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        signals = instance.__dict__.setdefault("_signals", {})
+        bound = signals.get(self.name)
+        if bound is None:
+            bound = signals[self.name] = BoundSignal()
+        return bound
+
+
+class OrderManager:
+    # 类级别的信号定义
+    order_changed = Signal()  # 整个订单变化（清空、批量加载等），需要整体刷新
+    item_added = Signal(str, int)  # 顾客名, 该顾客的订单项索引
+    item_removed = Signal(str, int)
+    item_changed = Signal(str, int)
+    payment_changed = Signal(str)  # 顾客名
+
+    def __init__(self, menu_manager=None):
+        self.orders = {}  # {person_name: PersonOrder}
+        self.history = []
+        self.current_table = ""
+        self.menu_manager = menu_manager
+        self._batch_depth = 0  # batch_update 嵌套层数
+        self._batch_dirty = False
+        
+        # 如果提供了menu_manager，尝试加载它的历史
+        if menu_manager and hasattr(menu_manager, 'order_history'):
+            self.history = menu_manager.order_history
+        if menu_manager:
+            # 菜品改价后更新当前订单中的单价和小计
+            menu_manager.add_dish_listener(self._on_dish_updated)
+
+    @contextmanager
+    def batch_update(self):
+        """批量修改期间不发送逐项信号，结束时只发送一次 order_changed"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._batch_dirty:
+                self._batch_dirty = False
+                self.order_changed.emit()
+
+    def _dish_price_cents(self, dish_id):
+        dish = self.menu_manager.get_dish_by_id(dish_id) if self.menu_manager else None
+        return dish.price_cents if dish else 0
+
+    def _on_dish_updated(self, dish, changed):
+        if 'price' not in changed:
+            return
+        affected = False
+        for person_order in self.orders.values():
+            for item in person_order.items:
+                if item.dish_id == dish.id:
+                    item.price_cents = dish.price_cents
+                    person_order.invalidate_subtotal()
+                    affected = True
+        if affected:
+            self._notify(self.order_changed)
+
+    def _notify(self, signal, *args):
+        if self._batch_depth:
+            self._batch_dirty = True
+        else:
+            signal.emit(*args)
+
+    def add_person(self, name):
+        if name not in self.orders:
+            self.orders[name] = PersonOrder(name)
+
+    def remove_person(self, name):
+        if name in self.orders:
+            del self.orders[name]
+            self._notify(self.order_changed)
+
+    def add_item_to_person(self, person_name, dish_id, quantity, remark=""):
+        if person_name in self.orders:
+            person_order = self.orders[person_name]
+            dish = self.menu_manager.get_dish_by_id(dish_id) if self.menu_manager else None
+            person_order.add_item(dish_id, quantity, remark, dish.price_cents if dish else 0)
+            # 销量在订单保存到历史时统计
+            if dish and remark:
+                dish.add_remark(remark)
+                self.menu_manager.touch(modified=False)
+            self._notify(self.item_added, person_name, len(person_order.items) - 1)
+            return True
+        return False
+
+    def remove_item_from_person(self, person_name, index):
+        if person_name in self.orders and self.orders[person_name].remove_item(index):
+            self._notify(self.item_removed, person_name, index)
+            return True
+        return False
+
+    def update_item(self, person_name, index, quantity=None, remark=None):
+        """修改订单项的数量或备注"""
+        person_order = self.orders.get(person_name)
+        if person_order is None or not 0 <= index < len(person_order.items):
+            return False
+        person_order.update_item(index, quantity=quantity, remark=remark)
+        self._notify(self.item_changed, person_name, index)
+        return True
+
+    def set_payment_method(self, person_name, method, value=1.0):
+        if person_name in self.orders:
+            self.orders[person_name].set_payment_method(method, value)
+            self._notify(self.payment_changed, person_name)
+            return True
+        return False
+
+    def settle(self):
+        """
+        按整数分结算当前订单，返回 (totals, subtotal_cents)
+        totals[name] 含 original_cents / final_cents，以及换算为元的 original / final
+        """
+        totals = {}
+        subtotal_cents = 0
+        
+        # 每个人的原始消费金额由 PersonOrder 增量维护
+        for name, order in self.orders.items():
+            original = order.subtotal_cents
+            totals[name] = {
+                'original_cents': original,
+                'final_cents': original,  # 默认应付金额等于消费金额
+                'method': order.payment_method,
+                'value': order.payment_value
+            }
+            subtotal_cents += original
+        
+        # 处理AA制：按顾客顺序分摊，除不尽的分依次加给前面的人，各份之和等于应分摊总额
+        aa_people = [name for name, data in totals.items() if data["method"] == "AA"]
+        if aa_people:
+            aa_total = sum(data["original_cents"] for name, data in totals.items() 
+                        if name not in aa_people)
+            shares = split_cents(subtotal_cents - aa_total, len(aa_people))
+            for name, share in zip(aa_people, shares):
+                totals[name]["final_cents"] = share
+        
+        # 处理自定义金额
+        custom_people = [name for name, data in totals.items() if data["method"] == "自定义"]
+        for name in custom_people:
+            # 确保自定义金额不超过消费金额
+            totals[name]["final_cents"] = min(to_cents(totals[name]["value"]),
+                                              totals[name]["original_cents"])
+
+        for data in totals.values():
+            data["original"] = data["original_cents"] / 100
+            data["final"] = data["final_cents"] / 100
+        
+        return totals, subtotal_cents
+
+    def calculate_totals(self, menu_manager=None):
+        totals, subtotal_cents = self.settle()
+        return totals, subtotal_cents / 100
+
+
+    def build_order_data(self):
+        """
+        生成要保存的订单数据，同时记录保存时的单价、菜品名、每人消费/应付金额和订单总金额
+        之后改价不会影响历史订单的金额，历史视图也不必重新计算
+        """
+        totals, subtotal_cents = self.settle()
+        order_data = {
+            "table": self.current_table,
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "orders": {},
+            "total_cents": subtotal_cents
+        }
+
+        for name, person_order in self.orders.items():
+            items = []
+            for item in person_order.items:
+                dish = self.menu_manager.get_dish_by_id(item.dish_id) if self.menu_manager else None
+                items.append([item.dish_id, item.quantity, item.remark, item.price_cents,
+                              dish.name if dish else ""])
+            order_data["orders"][name] = {
+                "items": items,
+                "payment_method": person_order.payment_method,
+                "payment_value": person_order.payment_value,
+                "original_cents": totals[name]["original_cents"],
+                "final_cents": totals[name]["final_cents"]
+            }
+        return order_data
+
+    def save_current_order(self):
+        if self.orders:
+            order_data = self.build_order_data()
+            
+            if self.menu_manager:
+                self.menu_manager.append_order(order_data)
+            else:
+                self.history.append(order_data)
+            return True
+        return False
+
+    def clear_current_order(self):
+        self.orders = {}
+        self.current_table = ""
+        self._notify(self.order_changed)
+
+    def restore_order(self, order_data, record_remarks=False, default_table=""):
+        """
+        一次性恢复 .order 文件或历史记录中的订单，替换当前订单
+        record_remarks 为 True 时把菜品项的备注记录到菜品的常用备注中；
+        默认不记录，重新打开已保存的订单时不会重复记录（销量只在订单保存到历史时统计）
+        结束时只发送一次 order_changed
+        """
+        # 验证订单数据结构
+        if not isinstance(order_data, dict) or not isinstance(order_data.get("orders"), dict):
+            raise ValueError("无效的订单文件格式")
+        check_order_version(order_data)
+
+        with self.batch_update():
+            self.clear_current_order()
+            self.current_table = str(order_data.get("table") or default_table)
+
+            for person_name, person_data in order_data["orders"].items():
+                # 验证顾客数据
+                if not isinstance(person_data, dict) or "items" not in person_data:
+                    continue
+
+                person_order = PersonOrder(person_name)
+                for item in person_data["items"]:
+                    # 验证菜品数据格式 (dish_id, quantity, remark[, price_cents, name])
+                    if len(item) not in (3, 5) or not all(isinstance(i, (int, str)) for i in item[:2]):
+                        continue
+
+                    dish_id, quantity, remark, price_cents, _ = unpack_order_item(item)
+                    dish_id, quantity, remark = int(dish_id), int(quantity), str(remark)
+                    # 有快照时按保存时的单价恢复，旧格式按当前菜单价格
+                    if price_cents is None:
+                        price_cents = self._dish_price_cents(dish_id)
+                    person_order.add_item(dish_id, quantity, remark, int(price_cents))
+                    if record_remarks and remark and self.menu_manager:
+                        dish = self.menu_manager.get_dish_by_id(dish_id)
+                        if dish:
+                            dish.add_remark(remark)
+                            self.menu_manager.touch(modified=False)
+
+                # 设置支付方式（如果有）
+                if "payment_method" in person_data and "payment_value" in person_data:
+                    person_order.set_payment_method(person_data["payment_method"],
+                                                    float(person_data["payment_value"]))
+                self.orders[person_name] = person_order
+
+    def get_customer_habits(self):
+        """返回 {顾客名: {"count", "total_spent_cents", "dishes", "top"}}，由菜单管理器随订单保存增量维护"""
+        if not self.menu_manager:
+            return {}
+        return self.menu_manager.customer_habits.customers
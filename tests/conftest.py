@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# 测试直接导入仓库根目录下的 menu_core（不依赖 PyQt5）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from menu_core import MenuManager  # noqa: E402
+
+
+def make_order(timestamp, table="1", persons=None):
+    """生成一条订单历史；persons 为 {顾客名: [(菜品ID, 数量, 单价分, 菜品名)]}"""
+    persons = persons or {"张三": [(1, 1, 1250, "鱼")]}
+    orders = {}
+    total_cents = 0
+    for name, items in persons.items():
+        person_cents = sum(quantity * price_cents for _, quantity, price_cents, _ in items)
+        orders[name] = {
+            "items": [[dish_id, quantity, "", price_cents, dish_name]
+                      for dish_id, quantity, price_cents, dish_name in items],
+            "payment_method": "AA",
+            "payment_value": 1.0,
+            "original_cents": person_cents,
+            "final_cents": person_cents,
+        }
+        total_cents += person_cents
+    return {"table": table, "timestamp": timestamp, "orders": orders, "total_cents": total_cents}
+
+
+@pytest.fixture
+def menu_manager():
+    menu_manager = MenuManager()
+    menu_manager.add_dish("鱼", 12.5, "热菜")
+    menu_manager.add_dish("青菜", 8, "素菜")
+    menu_manager.add_dish("米饭", 1.5, "主食")
+    return menu_manager
+
+
+@pytest.fixture(params=["json", "db"])
+def menu_file(request, tmp_path):
+    """JSON 和 SQLite 两种存储各测一遍"""
+    return str(tmp_path / f"menu.{request.param}")
@@ -0,0 +1,54 @@
+import pytest
+
+from menu_core import ColumnarAnalytics, ColumnarHistory, ROLLUP_GRANULARITIES
+from test_stats import random_orders
+
+pytest.importorskip("numpy")
+
+
+def analytics_pair(history, menu_manager):
+    columns = ColumnarHistory.from_history(history, menu_manager)
+    return ColumnarAnalytics(columns, use_numpy=True), ColumnarAnalytics(columns, use_numpy=False)
+
+
+@pytest.mark.parametrize("granularity", list(ROLLUP_GRANULARITIES))
+def test_revenue_by_period_parity(menu_manager, granularity):
+    with_numpy, pure = analytics_pair(random_orders(80), menu_manager)
+    assert with_numpy.revenue_by_period(granularity) == pure.revenue_by_period(granularity)
+
+
+def test_top_dishes_and_customer_spend_parity(menu_manager):
+    with_numpy, pure = analytics_pair(random_orders(80, seed=5), menu_manager)
+    assert with_numpy.top_dishes(10) == pure.top_dishes(10)
+    assert with_numpy.customer_spend() == pure.customer_spend()
+
+
+def test_matches_incremental_stats(menu_manager):
+    history = random_orders(50, seed=6)
+    for order_data in history:
+        menu_manager.append_order(order_data)
+    _, pure = analytics_pair(history, menu_manager)
+    rollups = menu_manager.sales_rollups
+    for key, revenue_cents in pure.revenue_by_period("day").items():
+        assert rollups.summary("day", key)["revenue_cents"] == revenue_cents
+
+
+def test_empty_history(menu_manager):
+    with_numpy, pure = analytics_pair([], menu_manager)
+    for analytics in (with_numpy, pure):
+        assert analytics.top_dishes() == []
+        assert analytics.customer_spend() == {}
+        assert analytics.revenue_by_period("month") == {}
+
+
+@pytest.mark.parametrize("granularity", list(ROLLUP_GRANULARITIES))
+def test_invalid_timestamps_are_skipped_by_both(menu_manager, granularity):
+    history = random_orders(30, seed=7)
+    for index, timestamp in ((3, "bad"), (7, ""), (11, "2024-13-01 10:00:00"), (15, None)):
+        history[index]["timestamp"] = timestamp
+    history[20]["timestamp"] = "2024-01-02T09:30:00"  # 非标准格式但可以解析
+    history[25]["orders"] = {}
+    with_numpy, pure = analytics_pair(history, menu_manager)
+    result = pure.revenue_by_period(granularity)
+    assert with_numpy.revenue_by_period(granularity) == result
+    assert "bad" not in result and "" not in result
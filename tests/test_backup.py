@@ -0,0 +1,108 @@
+import datetime
+import json
+
+from conftest import make_order
+from menu_core import BackupManager, BackupPolicy, MenuManager, backup_dir_for
+
+
+def restored_state(menu_manager):
+    """备份中应包含的内容：菜品、分类和完整订单历史"""
+    data = menu_manager._menu_data(menu_manager.current_file)
+    data["order_history"] = list(menu_manager.order_history)
+    return data
+
+
+def test_full_and_delta_backups_restore(menu_manager, menu_file):
+    menu_manager.save_to_file(menu_file)
+    menu_manager.append_order(make_order("2024-01-01 11:00:00"))
+    menu_manager.append_order(make_order("2024-01-01 12:00:00", "2"))
+    first = menu_manager.begin_backup()
+    first.run()
+    first_state = restored_state(menu_manager)
+
+    menu_manager.append_order(make_order("2024-01-01 13:00:00", "3"))
+    menu_manager.update_dish(2, price=9)
+    menu_manager.remove_dish(3)
+    menu_manager.add_dish("汤", 6, "汤类")
+    second = menu_manager.begin_backup()
+    second.run()
+    second_state = restored_state(menu_manager)
+
+    assert first.entry["kind"] == "full"
+    assert second.entry["kind"] == "delta"
+    # 增量只保存新增的订单和变化后的菜单
+    delta = BackupManager(backup_dir_for(menu_file)).load_snapshot(second.entry)
+    assert (delta["orders_from"], delta["new_orders"]) == (2, second_state["order_history"][2:])
+
+    backup_manager = BackupManager(backup_dir_for(menu_file))
+    entries = backup_manager.list_backups()
+    assert len(entries) == 2
+    assert backup_manager.restore(entries[0]) == first_state
+    assert backup_manager.restore(entries[1]) == second_state
+
+
+def test_unchanged_backup_is_skipped(menu_manager, menu_file):
+    menu_manager.save_to_file(menu_file)
+    menu_manager.append_order(make_order("2024-01-01 11:00:00"))
+    menu_manager.begin_backup().run()
+    job = menu_manager.begin_backup()
+    job.run()
+    assert job.entry is None
+
+    # 重新打开菜单后仍能识别内容没有变化
+    reopened = MenuManager()
+    reopened.load_from_file(menu_file)
+    job = reopened.begin_backup()
+    job.run()
+    assert job.entry is None
+
+
+def test_checkpoint_every_and_restore_at(menu_manager, tmp_path):
+    menu_file = str(tmp_path / "menu.json")
+    menu_manager.save_to_file(menu_file)
+    backup_manager = BackupManager(backup_dir_for(menu_file), BackupPolicy(checkpoint_every=2))
+    start = datetime.datetime(2024, 1, 1, 10)
+    states = []
+    for hour in range(5):
+        menu_manager.append_order(make_order(f"2024-01-01 1{hour}:00:00", str(hour)))
+        menu_manager.begin_backup(backup_manager).run(now=start + datetime.timedelta(hours=hour))
+        states.append(restored_state(menu_manager))
+
+    entries = backup_manager.list_backups()
+    assert [entry["kind"] for entry in entries] == ["full", "delta", "full", "delta", "full"]
+    for entry, state in zip(entries, states):
+        assert backup_manager.restore(entry) == state
+    when = start + datetime.timedelta(hours=2, minutes=30)
+    assert backup_manager.restore_at(when) == states[2]
+
+
+def test_rewritten_history_gets_full_checkpoint(menu_manager, tmp_path):
+    backup_manager = BackupManager(str(tmp_path / "backups"))
+    menu_data = menu_manager._menu_data(None)
+    history = [make_order("2024-01-01 11:00:00"), make_order("2024-01-01 12:00:00", "2")]
+    assert backup_manager.add_snapshot(menu_data, history)["kind"] == "full"
+    assert backup_manager.add_snapshot(menu_data, history + [make_order("2024-01-01 13:00:00")])["kind"] == "delta"
+
+    # 上次备份的最后一个订单不在原位置（历史被替换或变短）时不能只追加
+    rewritten = [make_order("2024-01-02 11:00:00", "5")] * 4
+    entry = backup_manager.add_snapshot(menu_data, rewritten)
+    assert entry["kind"] == "full"
+    assert backup_manager.restore(entry) == dict(menu_data, order_history=rewritten)
+    assert backup_manager.add_snapshot(menu_data, rewritten[:2])["kind"] == "full"
+
+
+def test_legacy_delta_still_restores(tmp_path):
+    backup_manager = BackupManager(str(tmp_path / "backups"))
+    backup_manager._ensure_dirs()
+    full = {"dishes": [{"id": 1, "name": "鱼"}, {"id": 2, "name": "青菜"}], "categories": ["未分类"],
+            "next_id": 3, "order_history": [make_order("2024-01-01 11:00:00")]}
+    legacy_delta = {"dishes": [{"id": 3, "name": "汤"}], "removed_dishes": [1], "next_id": 4,
+                    "orders_from": 1, "new_orders": [make_order("2024-01-01 12:00:00")]}
+    entries = []
+    for kind, payload in (("full", full), ("delta", legacy_delta)):
+        digest, size = backup_manager._store_object(json.dumps(payload, ensure_ascii=False))
+        entries.append({"timestamp": f"2024-01-01 1{len(entries)}:00:00", "kind": kind, "hash": digest,
+                        "size": size})
+    assert backup_manager.restore(entries[1], entries) == {
+        "dishes": [{"id": 2, "name": "青菜"}, {"id": 3, "name": "汤"}], "categories": ["未分类"],
+        "next_id": 4, "order_history": full["order_history"] + legacy_delta["new_orders"]}
@@ -0,0 +1,95 @@
+import csv
+import datetime
+import json
+
+from conftest import make_order
+from menu_cli import main
+from menu_core import BackupManager, ColumnarHistory, MenuManager, ORDER_FILE_VERSION, backup_dir_for
+
+
+def load(filename):
+    menu_manager = MenuManager()
+    assert menu_manager.load_from_file(filename)
+    return menu_manager
+
+
+def test_merge_orders_skips_duplicates_and_newer_versions(menu_manager, menu_file, tmp_path, capsys):
+    menu_manager.save_to_file(menu_file)
+    order_files = []
+    for i, version in enumerate([ORDER_FILE_VERSION, ORDER_FILE_VERSION, "9.0.0"]):
+        order_file = tmp_path / f"{i}.order"
+        order_data = make_order("2024-01-01 12:00:00" if i < 2 else "2024-01-02 12:00:00")
+        order_file.write_text(json.dumps({"version": version, **order_data}, ensure_ascii=False),
+                              encoding="utf-8")
+        order_files.append(str(order_file))
+
+    assert main(["merge-orders", menu_file] + order_files) == 0
+    assert "已合并 1 个订单，跳过 2 个" in capsys.readouterr().out
+    loaded = load(menu_file)
+    assert len(loaded.order_history) == 1
+    assert "version" not in loaded.order_history[0]
+
+
+def test_export_history_csv(menu_manager, menu_file, tmp_path):
+    menu_manager.save_to_file(menu_file)
+    menu_manager.append_order(make_order("2024-01-01 12:00:00", "1", {"张三": [(1, 2, 1250, "鱼")]}))
+    menu_manager.append_order(make_order("2024-01-03 12:00:00", "2"))
+    output = str(tmp_path / "history.csv")
+
+    assert main(["export-history", menu_file, output, "--end", "2024-01-02"]) == 0
+    with open(output, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    assert len(rows) == 2
+    assert rows[1][5:9] == ["鱼", "2", "12.50", "25.00"]
+
+
+def test_missing_menu_file(tmp_path, capsys):
+    assert main(["report", str(tmp_path / "missing.json")]) == 1
+    assert "无法加载菜单文件" in capsys.readouterr().err
+
+
+def test_restore_at(menu_manager, menu_file, capsys):
+    menu_manager.save_to_file(menu_file)
+    orders = [make_order(f"2024-01-01 1{i}:00:00", str(i)) for i in range(3)]
+    menu_manager.append_order(orders[0])
+    menu_manager.begin_backup().run(now=datetime.datetime(2024, 1, 1, 10))
+    menu_manager.append_order(orders[1])
+    menu_manager.begin_backup().run(now=datetime.datetime(2024, 1, 1, 12))
+    menu_manager.append_order(orders[2])
+
+    assert main(["restore", menu_file, "--at", "2024-01-01 11:00:00"]) == 0
+    restored = load(menu_file)
+    assert list(restored.order_history) == orders[:1]
+    assert restored.order_stats.order_count == 1
+
+    # 恢复前的内容已备份，可以再恢复回来
+    assert len(BackupManager(backup_dir_for(menu_file)).list_backups()) == 3
+    assert main(["restore", menu_file]) == 0
+    assert list(load(menu_file).order_history) == orders
+
+    capsys.readouterr()
+    assert main(["restore", menu_file, "--at", "2023-12-31"]) == 1
+    assert "之前没有备份" in capsys.readouterr().err
+
+
+def test_analyze_cache(menu_manager, menu_file, tmp_path, capsys):
+    menu_manager.save_to_file(menu_file)
+    menu_manager.append_order(make_order("2024-01-01 12:00:00", "1", {"张三": [(1, 2, 1250, "鱼")]}))
+    cache = str(tmp_path / "columns.json")
+    assert main(["analyze", menu_file, "--cache", cache]) == 0
+    menu_manager.append_order(make_order("2024-02-01 12:00:00"))
+
+    capsys.readouterr()
+    assert main(["analyze", menu_file, "--cache", cache]) == 0
+    cached = capsys.readouterr().out
+    assert main(["analyze", menu_file]) == 0
+    assert capsys.readouterr().out == cached
+    assert ColumnarHistory.load(cache).timestamps == ["2024-01-01 12:00:00", "2024-02-01 12:00:00"]
+
+    # 订单历史被替换后缓存与之不一致，重新转换
+    other = MenuManager()
+    other.add_dish("鱼", 12.5)
+    other.save_to_file(menu_file)
+    other.append_order(make_order("2024-03-01 12:00:00"))
+    assert main(["analyze", menu_file, "--cache", cache]) == 0
+    assert ColumnarHistory.load(cache).timestamps == ["2024-03-01 12:00:00"]
@@ -0,0 +1,23 @@
+from menu_core import MenuManager
+
+
+def test_duplicate_names_stay_findable():
+    menu_manager = MenuManager()
+    first = menu_manager.add_dish("鱼", 10)
+    second = menu_manager.add_dish("鱼", 12)
+    assert menu_manager.get_dish_by_name("鱼") is first
+    menu_manager.remove_dish(first.id)
+    assert menu_manager.get_dish_by_name("鱼") is second
+    menu_manager.update_dish(second.id, name="鲈鱼")
+    assert menu_manager.get_dish_by_name("鱼") is None
+    assert menu_manager.get_dish_by_name("鲈鱼") is second
+
+
+def test_indexes_follow_updates(menu_manager):
+    menu_manager.update_dish(1, category="素菜")
+    assert [dish.name for dish in menu_manager.get_dishes_by_category("素菜")] == ["鱼", "青菜"]
+    assert menu_manager.get_dishes_by_category("热菜") == []
+    menu_manager.sort_dishes("price")
+    assert [dish.name for dish in menu_manager.dishes] == ["米饭", "青菜", "鱼"]
+    assert [dish.name for dish in menu_manager.get_dishes_by_category("素菜")] == ["青菜", "鱼"]
+    assert menu_manager.get_dish_by_id(3).name == "米饭"
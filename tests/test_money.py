@@ -0,0 +1,41 @@
+from decimal import Decimal
+
+from menu_core import Dish, format_money, split_cents, to_cents
+
+
+def test_to_cents_rounds_half_up():
+    assert to_cents(12) == 1200
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents(1.005) == 101
+    assert to_cents("3.35") == 335
+    assert to_cents(Decimal("2.675")) == 268
+
+
+def test_format_money():
+    assert format_money(1230) == "12.30"
+    assert format_money(5) == "0.05"
+    assert format_money(-150) == "-1.50"
+
+
+def test_split_cents_sums_to_total():
+    assert split_cents(1000, 3) == [334, 333, 333]
+    assert split_cents(2, 3) == [1, 1, 0]
+    assert split_cents(900, 3) == [300, 300, 300]
+    for total in (0, 1, 99, 1001, 123457):
+        for count in range(1, 8):
+            parts = split_cents(total, count)
+            assert len(parts) == count
+            assert sum(parts) == total
+            assert max(parts) - min(parts) <= 1
+
+
+def test_split_cents_without_people():
+    assert split_cents(100, 0) == []
+
+
+def test_dish_price_cents_follows_price():
+    dish = Dish(1, "鱼", 12.5)
+    assert dish.price_cents == 1250
+    dish.price = 3.35
+    assert dish.price_cents == 335
+    assert dish.total_cents(3) == 1005
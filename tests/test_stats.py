@@ -0,0 +1,91 @@
+import random
+
+from conftest import make_order
+from menu_core import MenuManager, OrderStats
+
+DISHES = [(1, 1250, "鱼"), (2, 800, "青菜"), (3, 150, "米饭")]
+
+
+def random_orders(count, seed=1):
+    rng = random.Random(seed)
+    orders = []
+    for i in range(count):
+        persons = {}
+        for name in rng.sample(["张三", "李四", "王五", "赵六"], rng.randint(1, 3)):
+            persons[name] = [(dish_id, rng.randint(1, 3), price_cents, dish_name)
+                             for dish_id, price_cents, dish_name in rng.sample(DISHES, rng.randint(1, 3))]
+        day, hour = divmod(i, 12)
+        orders.append(make_order(f"2024-01-{day + 1:02d} {hour + 8:02d}:{rng.randint(0, 59):02d}:00",
+                                 str(rng.randint(1, 5)), persons))
+    return orders
+
+
+def rebuilt(history, menu_manager):
+    stats = OrderStats(menu_manager)
+    stats.catch_up(history)
+    return stats.to_dict()
+
+
+def load(filename):
+    menu_manager = MenuManager()
+    assert menu_manager.load_from_file(filename)
+    return menu_manager
+
+
+def test_incremental_matches_rebuild(menu_manager, menu_file):
+    menu_manager.save_to_file(menu_file)
+    orders = random_orders(60)
+    for order_data in orders[:30]:
+        menu_manager.append_order(order_data)
+    menu_manager.order_stats  # 之后的订单增量统计
+    for order_data in orders[30:]:
+        menu_manager.append_order(order_data)
+    assert menu_manager.order_stats.to_dict() == rebuilt(orders, menu_manager)
+
+
+def test_saved_stats_are_caught_up_on_load(menu_manager, menu_file):
+    menu_manager.save_to_file(menu_file)
+    orders = random_orders(40, seed=2)
+    for order_data in orders[:25]:
+        menu_manager.append_order(order_data)
+    menu_manager.order_stats
+    menu_manager.save_stats()
+    for order_data in orders[25:]:
+        menu_manager.append_order(order_data)
+
+    # 保存的统计只包含前 25 个订单，加载时补上之后的订单
+    loaded = load(menu_file)
+    assert loaded.order_stats.to_dict() == rebuilt(orders, loaded)
+    assert loaded.get_top_dishes(3) == menu_manager.get_top_dishes(3)
+
+
+def test_rebuild_stats(menu_manager, menu_file):
+    menu_manager.save_to_file(menu_file)
+    orders = random_orders(20, seed=3)
+    for order_data in orders:
+        menu_manager.append_order(order_data)
+    loaded = load(menu_file)
+    assert loaded.rebuild_stats().to_dict() == rebuilt(orders, loaded)
+    assert load(menu_file).order_stats.to_dict() == rebuilt(orders, loaded)
+
+
+def test_shared_storage_stats_after_refresh(menu_manager, menu_file):
+    """两个终端共用一个文件，刷新历史后统计按存储的顺序包含双方的订单"""
+    menu_manager.save_to_file(menu_file)
+    for order_data in random_orders(5, seed=4):
+        menu_manager.append_order(order_data)
+    terminal_a, terminal_b = load(menu_file), load(menu_file)
+    assert terminal_a.order_stats.order_count == 5
+
+    terminal_b.append_order(make_order("2024-02-01 12:00:00", "B", {"李四": [(2, 5, 800, "青菜")]}))
+    terminal_a.append_order(make_order("2024-02-01 12:01:00", "A", {"张三": [(1, 1, 1250, "鱼")]}))
+    assert terminal_a.refresh_history()
+    assert terminal_a.query_order_seqs(table="A") == [6]
+
+    history = list(load(menu_file).order_history)
+    assert [order_data["table"] for order_data in history[5:]] == ["B", "A"]
+    assert terminal_a.order_stats.to_dict() == rebuilt(history, terminal_a)
+
+    # 退出时保存的统计在下次加载时仍然正确
+    terminal_a.save_stats()
+    assert load(menu_file).order_stats.to_dict() == rebuilt(history, terminal_a)
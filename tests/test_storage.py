@@ -0,0 +1,174 @@
+import json
+import sqlite3
+
+import pytest
+
+from conftest import make_order
+from menu_core import (JsonStorage, LazyOrderHistory, MenuManager, SqliteStorage, journal_path,
+                       read_order_journal)
+
+LEGACY_ORDER = {
+    "table": "2",
+    "timestamp": "2024-01-01 12:00:00",
+    "orders": {"李四": {"items": [[2, 2, "少盐"]], "payment_method": "AA", "payment_value": 1.0}},
+}
+
+
+def sample_history():
+    return [
+        make_order("2024-01-01 11:00:00", "1"),
+        LEGACY_ORDER,
+        make_order("2024-01-02 18:30:00", "3", {"王五": [(1, 2, 1250, "鱼"), (3, 2, 150, "米饭")],
+                                                 "赵六": [(2, 1, 800, "青菜")]}),
+    ]
+
+
+def load(filename, lazy_history=True):
+    menu_manager = MenuManager()
+    assert menu_manager.load_from_file(filename, lazy_history)
+    return menu_manager
+
+
+@pytest.mark.parametrize("lazy_history", [True, False])
+def test_round_trip(menu_manager, menu_file, lazy_history):
+    menu_manager.save_to_file(menu_file)
+    history = sample_history()
+    for order_data in history:
+        menu_manager.append_order(order_data)
+
+    loaded = load(menu_file, lazy_history)
+    assert isinstance(loaded.order_history, LazyOrderHistory) == lazy_history
+    assert list(loaded.order_history) == history
+    assert [(d.id, d.name, d.price_cents, d.category) for d in loaded.dishes] == \
+        [(d.id, d.name, d.price_cents, d.category) for d in menu_manager.dishes]
+    assert loaded.next_id == menu_manager.next_id
+
+
+def test_query_order_seqs(menu_manager, menu_file):
+    menu_manager.save_to_file(menu_file)
+    for order_data in sample_history():
+        menu_manager.append_order(order_data)
+    loaded = load(menu_file)
+    assert loaded.query_order_seqs(table="2") == [1]
+    assert loaded.query_order_seqs(start="2024-01-01 11:30:00") == [1, 2]
+    assert loaded.query_order_seqs(end="2024-01-02") == [0, 1]
+    assert [seq for seq, _ in loaded.query_orders(table="3")] == [2]
+
+
+def test_save_as_other_backend(menu_manager, tmp_path):
+    menu_manager.save_to_file(str(tmp_path / "menu.json"))
+    for order_data in sample_history():
+        menu_manager.append_order(order_data)
+    loaded = load(str(tmp_path / "menu.json"))
+    loaded.save_to_file(str(tmp_path / "menu.db"))
+    assert list(load(str(tmp_path / "menu.db")).order_history) == sample_history()
+
+
+def test_legacy_json_history_is_migrated_to_journal(tmp_path):
+    filename = str(tmp_path / "menu.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"dishes": [{"id": 2, "name": "青菜", "price": 8, "category": "素菜"}],
+                   "categories": ["未分类", "素菜"], "next_id": 3,
+                   "order_history": [LEGACY_ORDER]}, f, ensure_ascii=False)
+
+    menu_manager = load(filename)
+    assert list(menu_manager.order_history) == [LEGACY_ORDER]
+    # 第一次追加订单时把完整历史写入订单日志，菜单文件在下次保存时重写
+    menu_manager.append_order(make_order("2024-01-03 12:00:00"))
+    assert read_order_journal(journal_path(filename))[0] == LEGACY_ORDER
+    menu_manager.save_to_file(filename)
+    with open(filename, encoding="utf-8") as f:
+        assert "order_history" not in json.load(f)
+    assert len(load(filename).order_history) == 2
+
+
+def test_sqlite_schema_migration(tmp_path):
+    filename = str(tmp_path / "menu.db")
+    conn = sqlite3.connect(filename)
+    conn.executescript("""
+        CREATE TABLE orders (seq INTEGER PRIMARY KEY, table_no TEXT NOT NULL DEFAULT '',
+                             timestamp TEXT NOT NULL);
+        CREATE TABLE person_orders (id INTEGER PRIMARY KEY, order_seq INTEGER NOT NULL,
+                                    position INTEGER NOT NULL, name TEXT NOT NULL,
+                                    payment_method TEXT NOT NULL DEFAULT 'AA',
+                                    payment_value REAL NOT NULL DEFAULT 1.0);
+        CREATE TABLE order_items (id INTEGER PRIMARY KEY, person_order_id INTEGER NOT NULL,
+                                  position INTEGER NOT NULL, dish_id INTEGER NOT NULL,
+                                  quantity INTEGER NOT NULL, remark TEXT NOT NULL DEFAULT '');
+        INSERT INTO orders VALUES (0, '2', '2024-01-01 12:00:00');
+        INSERT INTO person_orders VALUES (1, 0, 0, '李四', 'AA', 1.0);
+        INSERT INTO order_items VALUES (1, 1, 0, 2, 2, '少盐');
+    """)
+    conn.commit()
+    conn.close()
+
+    storage = SqliteStorage(filename)
+    assert storage.read_orders(0, 1) == [LEGACY_ORDER]
+    storage.append_order(make_order("2024-01-02 12:00:00"))
+    assert storage.read_orders(1, 2) == [make_order("2024-01-02 12:00:00")]
+    conn = sqlite3.connect(filename)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SqliteStorage.SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def test_torn_journal_tail(menu_manager, tmp_path):
+    filename = str(tmp_path / "menu.json")
+    menu_manager.save_to_file(filename)
+    menu_manager.append_order(make_order("2024-01-01 11:00:00"))
+    journal = journal_path(filename)
+    with open(journal, "ab") as f:
+        f.write(b'{"table": "torn", "timest')
+
+    # 一次读取和按页读取都不计入写入中断的最后一行
+    assert len(read_order_journal(journal)) == 1
+    assert JsonStorage(filename).count_orders() == 1
+
+    menu_manager.append_order(make_order("2024-01-02 11:00:00", "2"))
+    assert [order["table"] for order in read_order_journal(journal)] == ["1", "2"]
+    storage = JsonStorage(filename)
+    assert [order["table"] for order in storage.read_orders(0, storage.count_orders())] == ["1", "2"]
+
+
+@pytest.mark.parametrize("sort", ["table", "customers", "total"])
+def test_sqlite_sort_matches_in_memory_sort(menu_manager, tmp_path, sort):
+    filename = str(tmp_path / "menu.db")
+    menu_manager.save_to_file(filename)
+    history = sample_history() + [make_order("2024-01-03 12:00:00", "1", {"甲": [(3, 4, 150, "米饭")]})]
+    for order_data in history:
+        menu_manager.append_order(order_data)
+
+    lazy = load(filename)
+    eager = load(filename, lazy_history=False)
+    assert lazy.can_sort_history(sort) and eager.can_sort_history(sort)
+    expected = eager.query_order_seqs(sort=sort)
+    assert sorted(expected) == list(range(len(history)))
+    assert lazy.query_order_seqs(sort=sort) == expected
+    assert lazy.query_order_seqs(start="2024-01-01 11:30:00", sort=sort) == [seq for seq in expected if seq > 0]
+
+
+def test_lazy_json_history_only_sorts_by_time(menu_manager, tmp_path):
+    filename = str(tmp_path / "menu.json")
+    menu_manager.save_to_file(filename)
+    menu_manager.append_order(make_order("2024-01-01 11:00:00"))
+    assert not load(filename).can_sort_history("total")
+    assert load(filename).can_sort_history(None)
+    assert load(filename, lazy_history=False).can_sort_history("total")
+
+
+def test_copy_reads_history_snapshot_in_job(menu_manager, menu_file, tmp_path):
+    menu_manager.save_to_file(menu_file)
+    history = sample_history()
+    for order_data in history[:2]:
+        menu_manager.append_order(order_data)
+    loaded = load(menu_file)
+    loaded.append_order(history[2])
+
+    # 生成任务时不读取存储中的订单，之后新增的订单不包含在副本中
+    job = loaded.begin_copy(str(tmp_path / "copy.json"))
+    assert isinstance(job.history, LazyOrderHistory) and not job.history._pages
+    loaded.append_order(make_order("2024-01-05 12:00:00"))
+    job.run()
+    with open(tmp_path / "copy.json", encoding="utf-8") as f:
+        assert json.load(f)["order_history"] == history